@@ -0,0 +1,445 @@
+"""
+Batch analytics over scraped listings
+
+Listings are loaded column-wise (records.ListingColumns) and every
+statistic is computed a whole column at a time: rows are sorted once by
+group and value, and the percentiles of every group are read off the sorted
+column together. With NumPy installed this runs as array operations over the
+columns' buffers; without it the same algorithm runs in plain Python and
+gives the same numbers.
+
+Usage:
+    python analytics.py --by make,city
+    python analytics.py --source database --json
+"""
+
+import argparse
+import datetime
+import json
+import math
+import os
+import sys
+import time
+from array import array
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional; the pure Python path gives the same results
+    np = None
+
+from config import DATABASE_FILE, OUTPUT_FILE
+from catalog import default_catalog
+from records import ListingColumns, title_model
+from storage import CarDatabase
+
+GROUPINGS = ['make', 'model', 'variant', 'year', 'city']
+STAT_FIELDS = ['price_pkr', 'mileage_km']
+PERCENTILES = (10, 25, 50, 75, 90)
+
+# Prices outside [Q1 - k*IQR, Q3 + k*IQR] of their variant and year are outliers
+OUTLIER_IQR = 1.5
+OUTLIER_MIN_GROUP = 5
+
+# A depreciation curve needs medians for at least this many model years
+DEPRECIATION_MIN_YEARS = 3
+
+
+def _sorted_quantiles(values: Sequence, start: int, count: int, quantiles: Sequence[float]) -> List[float]:
+    """Linearly interpolated quantiles of values[start:start + count], already sorted"""
+    result = []
+    for q in quantiles:
+        offset = (count - 1) * (q / 100)
+        lo = math.floor(offset)
+        hi = math.ceil(offset)
+        low = values[start + lo]
+        result.append(low + (values[start + hi] - low) * (offset - lo))
+    return result
+
+
+def _grouped_quantiles_python(codes, values, quantiles) -> Tuple[list, list, list, list]:
+    groups: Dict[int, list] = {}
+    for code, value in zip(codes, values):
+        if code >= 0 and value >= 0:
+            groups.setdefault(code, []).append(value)
+    keys = sorted(groups)
+    counts, means, rows = [], [], []
+    for key in keys:
+        group = sorted(groups[key])
+        counts.append(len(group))
+        means.append(sum(group) / len(group))
+        rows.append(_sorted_quantiles(group, 0, len(group), quantiles))
+    return keys, counts, means, rows
+
+
+def _grouped_quantiles_numpy(codes, values, quantiles) -> Tuple[list, list, list, list]:
+    keep = (codes >= 0) & (values >= 0)
+    codes, values = codes[keep], values[keep]
+    if not len(codes):
+        return [], [], [], []
+    span = int(values.max()) + 1
+    if int(codes.max()) < 2 ** 62 // span:
+        # Sorting one combined int64 key is several times faster than lexsort
+        keys = np.sort(codes * span + values)
+        codes = keys // span
+        values = (keys - codes * span).astype(np.float64)
+    else:
+        order = np.lexsort((values, codes))
+        codes, values = codes[order], values[order].astype(np.float64)
+    keys, starts, counts = np.unique(codes, return_index=True, return_counts=True)
+    means = np.add.reduceat(values, starts) / counts
+    rows = np.empty((len(keys), len(quantiles)))
+    for j, q in enumerate(quantiles):
+        offset = (counts - 1) * (q / 100)
+        lo = np.floor(offset).astype(np.int64)
+        hi = np.ceil(offset).astype(np.int64)
+        low = values[starts + lo]
+        rows[:, j] = low + (values[starts + hi] - low) * (offset - lo)
+    return keys.tolist(), counts.tolist(), means.tolist(), rows.tolist()
+
+
+class ListingAnalytics:
+    """Grouped statistics, depreciation curves and price outliers for a set of listings.
+
+    Groupings are 'make', 'model' (e.g. "Toyota Corolla"), 'variant' (e.g.
+    "Toyota Corolla Axio"), 'year' and 'city', or a tuple of them for combined
+    groups such as ('model', 'year').
+    """
+
+    def __init__(self, columns: ListingColumns, reference_year: Optional[int] = None,
+                 use_numpy: bool = True):
+        self.columns = columns
+        self.reference_year = reference_year or datetime.date.today().year
+        self.np = np if use_numpy else None
+        self.backend = 'numpy' if self.np is not None else 'python'
+        self.size = len(columns)
+
+        self.values = {field: self._array(columns.ints[field], 'q') for field in ('price_pkr', 'mileage_km', 'year')}
+
+        # Make, model and variant come from the title, so look each distinct title up in the catalog once
+        titles = columns.categories['model']
+        title_codes = self._array(columns.codes['model'], 'I')
+        catalog = default_catalog()
+        parts = [catalog.parse(title) for title in titles]
+        makes = [part.make for part in parts]
+        models = [part.full_model if part.model else title_model(title) for part, title in zip(parts, titles)]
+        variants = [part.full_variant if part.model else title_model(title) for part, title in zip(parts, titles)]
+        self._codes: Dict[str, object] = {}
+        self._labels: Dict[str, list] = {}
+        for name, per_title in (('make', makes), ('model', models), ('variant', variants)):
+            mapping, self._labels[name] = self._encode(per_title)
+            self._codes[name] = self._take(mapping, title_codes)
+        mapping, self._labels['city'] = self._encode(columns.categories['city'])
+        self._codes['city'] = self._take(mapping, self._array(columns.codes['city'], 'I'))
+        self._codes['year'], self._labels['year'] = self._year_codes()
+
+    @classmethod
+    def from_csv(cls, filename: str = OUTPUT_FILE, **kwargs) -> 'ListingAnalytics':
+        return cls(ListingColumns.from_csv(filename), **kwargs)
+
+    @classmethod
+    def from_database(cls, path: str = DATABASE_FILE, make: Optional[str] = None,
+                      city: Optional[str] = None, **kwargs) -> 'ListingAnalytics':
+        database = CarDatabase(path)
+        try:
+            return cls(ListingColumns(database.iter_rows(make, city)), **kwargs)
+        finally:
+            database.close()
+
+    # Column helpers; each has a NumPy and a plain Python form
+
+    def _array(self, column: array, typecode: str):
+        if self.np is None:
+            return column
+        dtype = np.int64 if typecode == 'q' else np.uint32
+        return np.frombuffer(column, dtype=dtype) if len(column) else np.zeros(0, dtype=dtype)
+
+    def _take(self, mapping: List[int], codes):
+        """Map each code through `mapping`"""
+        if self.np is None:
+            return array('q', [mapping[code] for code in codes])
+        return np.asarray(mapping, dtype=np.int64)[codes] if len(mapping) else np.full(len(codes), -1)
+
+    @staticmethod
+    def _encode(values: List[Optional[str]]) -> Tuple[List[int], List[str]]:
+        """Codes for a list of labels, with -1 for None and equal labels sharing a code"""
+        labels, code_of, mapping = [], {}, []
+        for value in values:
+            if value is None:
+                mapping.append(-1)
+                continue
+            if value not in code_of:
+                code_of[value] = len(labels)
+                labels.append(value)
+            mapping.append(code_of[value])
+        return mapping, labels
+
+    def _year_codes(self):
+        years = self.values['year']
+        if self.np is None:
+            labels = sorted({year for year in years if year >= 0})
+            code_of = {year: i for i, year in enumerate(labels)}
+            return array('q', [code_of.get(year, -1) for year in years]), labels
+        labels = np.unique(years[years >= 0])
+        codes = np.where(years >= 0, np.searchsorted(labels, years), -1)
+        return codes, labels.tolist()
+
+    def _group(self, by) -> Tuple[object, Callable[[int], object]]:
+        """Per-row group codes (-1 where any key is missing) and a function decoding a code to its label"""
+        names = (by,) if isinstance(by, str) else tuple(by)
+        for name in names:
+            if name not in GROUPINGS:
+                raise ValueError(f"Unknown grouping '{name}', expected one of {', '.join(GROUPINGS)}")
+        codes = self._codes[names[0]]
+        sizes = [len(self._labels[name]) for name in names]
+        for name, size in zip(names[1:], sizes[1:]):
+            other = self._codes[name]
+            if self.np is None:
+                codes = array('q', [a * size + b if a >= 0 and b >= 0 else -1 for a, b in zip(codes, other)])
+            else:
+                codes = np.where((codes >= 0) & (other >= 0), codes * size + other, -1)
+
+        def label(code: int):
+            parts = []
+            for name, size in zip(reversed(names), reversed(sizes)):
+                code, part = divmod(code, size)
+                parts.append(self._labels[name][part])
+            return parts[0] if len(parts) == 1 else tuple(reversed(parts))
+
+        return codes, label
+
+    def _quantiles(self, codes, values, quantiles=PERCENTILES):
+        if self.np is None:
+            return _grouped_quantiles_python(codes, values, quantiles)
+        return _grouped_quantiles_numpy(codes, values, quantiles)
+
+    def _counts(self, codes) -> Dict[int, int]:
+        if self.np is None:
+            counts: Dict[int, int] = {}
+            for code in codes:
+                if code >= 0:
+                    counts[code] = counts.get(code, 0) + 1
+            return counts
+        valid = codes[codes >= 0]
+        if not len(valid):
+            return {}
+        counts = np.bincount(valid)
+        present = np.flatnonzero(counts)
+        return dict(zip(present.tolist(), counts[present].tolist()))
+
+    @staticmethod
+    def _stats(count: int, mean: float, quantiles: List[float], percentiles=PERCENTILES) -> Dict[str, int]:
+        stats = {'count': count, 'mean': round(mean)}
+        stats.update((f"p{p:g}", round(value)) for p, value in zip(percentiles, quantiles))
+        return stats
+
+    # Public statistics
+
+    def counts(self, by) -> Dict:
+        """Listings per group, largest first"""
+        codes, label = self._group(by)
+        counts = self._counts(codes)
+        return {label(code): count for code, count in sorted(counts.items(), key=lambda item: -item[1])}
+
+    def overall(self, fields: Sequence[str] = STAT_FIELDS) -> Dict[str, Dict[str, int]]:
+        """Statistics over every listing"""
+        result = {}
+        for field in fields:
+            values = self.values[field]
+            codes = array('q', [0]) * len(values) if self.np is None else np.zeros(len(values), dtype=np.int64)
+            _, counts, means, rows = self._quantiles(codes, values)
+            result[field] = self._stats(counts[0], means[0], rows[0]) if counts else {'count': 0}
+        return result
+
+    def grouped_stats(self, by, fields: Sequence[str] = STAT_FIELDS, top: Optional[int] = None,
+                      min_listings: int = 1) -> List[Dict]:
+        """Listing count and percentiles of each field per group, largest groups first"""
+        codes, label = self._group(by)
+        counts = self._counts(codes)
+        stats = {code: {} for code in counts}
+        for field in fields:
+            keys, value_counts, means, rows = self._quantiles(codes, self.values[field])
+            for code, count, mean, row in zip(keys, value_counts, means, rows):
+                stats[code][field] = self._stats(count, mean, row)
+
+        ordered = sorted((code for code, count in counts.items() if count >= min_listings),
+                         key=lambda code: (-counts[code], code))
+        if top:
+            ordered = ordered[:top]
+        return [dict({'group': label(code), 'listings': counts[code]}, **stats[code]) for code in ordered]
+
+    def depreciation(self, by: str = 'variant', min_years: int = DEPRECIATION_MIN_YEARS,
+                     top: Optional[int] = None) -> List[Dict]:
+        """Median price by model year for each group, with the yearly loss of value
+        fitted to those medians (a straight line through log price, weighted by listings)"""
+        codes, label = self._group((by, 'year'))
+        keys, counts, _, rows = self._quantiles(codes, self.values['price_pkr'], (50,))
+        curves: Dict[object, List[Tuple[int, int, float]]] = {}
+        for code, count, (median,) in zip(keys, counts, rows):
+            if median <= 0:
+                # No log price to fit; leave the year out of the curve altogether
+                continue
+            group, year = label(code)
+            curves.setdefault(group, []).append((year, count, median))
+
+        results = []
+        for group, points in curves.items():
+            if len(points) < min_years:
+                continue
+            weight = sum(count for _, count, _ in points)
+            mean_x = sum(year * count for year, count, _ in points) / weight
+            mean_y = sum(math.log(median) * count for _, count, median in points) / weight
+            var = sum(count * (year - mean_x) ** 2 for year, count, _ in points)
+            cov = sum(count * (year - mean_x) * (math.log(median) - mean_y) for year, count, median in points)
+            slope = cov / var if var else 0.0
+            results.append({
+                'group': group,
+                'listings': weight,
+                'annual_depreciation': round(1 - math.exp(-slope), 4),
+                'curve': [{'year': year, 'age': self.reference_year - year, 'listings': count,
+                           'median_price': round(median)} for year, count, median in sorted(points)],
+            })
+        results.sort(key=lambda result: -result['listings'])
+        return results[:top] if top else results
+
+    def outliers(self, by=('variant', 'year'), k: float = OUTLIER_IQR, min_group: int = OUTLIER_MIN_GROUP,
+                 top: Optional[int] = None) -> List[Dict]:
+        """Listings priced outside the interquartile fences of their group, most extreme first"""
+        codes, label = self._group(by)
+        prices = self.values['price_pkr']
+        keys, counts, _, rows = self._quantiles(codes, prices, (25, 50, 75))
+        fences = {}
+        for code, count, (q1, median, q3) in zip(keys, counts, rows):
+            if count >= min_group:
+                fences[code] = (q1 - k * (q3 - q1), median, q3 + k * (q3 - q1))
+        if not fences:
+            return []
+
+        if self.np is None:
+            flagged = [i for i, (code, price) in enumerate(zip(codes, prices))
+                       if code in fences and price >= 0
+                       and not fences[code][0] <= price <= fences[code][2]]
+        else:
+            size = max(fences) + 1
+            low = np.full(size, -np.inf)
+            high = np.full(size, np.inf)
+            for code, (lo, _, hi) in fences.items():
+                low[code], high[code] = lo, hi
+            safe = np.where((codes >= 0) & (codes < size), codes, 0)
+            grouped = (codes >= 0) & (codes < size) & (prices >= 0)
+            flagged = np.flatnonzero(grouped & ((prices < low[safe]) | (prices > high[safe]))).tolist()
+
+        results = []
+        for i in flagged:
+            code, price = int(codes[i]), int(prices[i])
+            median = fences[code][1]
+            listing = self.columns[i]
+            results.append({
+                'group': label(code),
+                'title': listing.model,
+                'url': listing.url,
+                'price': price,
+                'group_median': round(median),
+                'ratio': round(price / median, 3) if median else None,
+            })
+        results.sort(key=lambda result: -abs(math.log(result['ratio'])) if result['ratio'] else 0)
+        return results[:top] if top else results
+
+    def summary(self, groupings: Sequence = GROUPINGS, top: int = 20) -> Dict:
+        """Everything above in one JSON-ready dict"""
+        result = {
+            'listings': self.size,
+            'backend': self.backend,
+            'reference_year': self.reference_year,
+            'overall': self.overall(),
+            'groups': {},
+            'depreciation': [],
+            'outliers': [],
+        }
+        if not self.size:
+            return result
+        for by in groupings:
+            name = by if isinstance(by, str) else '+'.join(by)
+            result['groups'][name] = self.grouped_stats(by, top=top)
+        result['depreciation'] = self.depreciation(top=top)
+        result['outliers'] = self.outliers(top=top)
+        return result
+
+
+def format_summary(summary: Dict) -> str:
+    """Plain text rendering of ListingAnalytics.summary()"""
+    lines = [f"{summary['listings']} listings ({summary['backend']} backend)"]
+    for field, stats in summary['overall'].items():
+        if stats.get('count'):
+            lines.append(f"  {field}: median {stats['p50']:,}, p10 {stats['p10']:,}, p90 {stats['p90']:,} "
+                         f"({stats['count']} values)")
+    for name, groups in summary['groups'].items():
+        lines.append(f"\nBy {name}:")
+        lines.append(f"  {'group':<32} {'listings':>8} {'median price':>13} {'p25':>12} {'p75':>12} "
+                     f"{'median km':>10}")
+        for group in groups:
+            price = group.get('price_pkr', {})
+            mileage = group.get('mileage_km', {})
+            label = ' '.join(map(str, group['group'])) if isinstance(group['group'], (list, tuple)) else str(group['group'])
+            lines.append(f"  {label[:32]:<32} {group['listings']:>8} {price.get('p50', 0):>13,} "
+                         f"{price.get('p25', 0):>12,} {price.get('p75', 0):>12,} {mileage.get('p50', 0):>10,}")
+    if summary['depreciation']:
+        lines.append("\nDepreciation (median price by model year):")
+        for curve in summary['depreciation']:
+            points = ', '.join(f"{point['year']}: {point['median_price']:,}" for point in curve['curve'])
+            lines.append(f"  {curve['group']}: {curve['annual_depreciation']:.1%}/year ({points})")
+    if summary['outliers']:
+        lines.append("\nPrice outliers:")
+        for outlier in summary['outliers']:
+            lines.append(f"  {outlier['title']}: PKR {outlier['price']:,} vs median {outlier['group_median']:,} "
+                         f"({outlier['ratio']}x) {outlier['url']}")
+    return '\n'.join(lines)
+
+
+def parse_groupings(value: str) -> List:
+    """'make,model+year' -> ['make', ('model', 'year')]"""
+    groupings = []
+    for part in value.split(','):
+        part = part.strip()
+        if part:
+            names = tuple(name.strip() for name in part.split('+'))
+            groupings.append(names[0] if len(names) == 1 else names)
+    return groupings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Price and mileage statistics over scraped listings")
+    parser.add_argument('--source', choices=['csv', 'database'], default='csv',
+                        help="read the scraped CSV or every listing in the database")
+    parser.add_argument('--csv', default=OUTPUT_FILE, help="CSV to read with --source csv")
+    parser.add_argument('--make', help="only listings of this make (--source database)")
+    parser.add_argument('--city', help="only listings from this city (--source database)")
+    parser.add_argument('--by', type=parse_groupings, default=GROUPINGS,
+                        help="comma-separated groupings; join keys with '+' e.g. model+year")
+    parser.add_argument('--top', type=int, default=20, help="groups, curves and outliers to show")
+    parser.add_argument('--json', action='store_true', help="print the summary as JSON")
+    parser.add_argument('--no-numpy', action='store_true', help="use the pure Python backend")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    try:
+        if args.source == 'database':
+            analytics = ListingAnalytics.from_database(make=args.make, city=args.city, use_numpy=not args.no_numpy)
+        else:
+            if not os.path.exists(args.csv):
+                sys.exit(f"No data file found at {args.csv}")
+            analytics = ListingAnalytics.from_csv(args.csv, use_numpy=not args.no_numpy)
+        summary = analytics.summary(args.by, top=args.top)
+    except ValueError as e:
+        sys.exit(str(e))
+    elapsed = time.perf_counter() - start
+
+    if args.json:
+        print(json.dumps(summary, indent=2))
+    else:
+        print(format_summary(summary))
+        print(f"\nComputed in {elapsed:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,1338 @@
+"""
+Benchmarks for the PakWheels scraper
+
+Runs the scraper against a local stub HTTP server that serves synthetic
+search-result pages built from the rows in pakwheels_cars_data.csv, so
+nothing here touches the live site.
+
+Usage:
+    python benchmark.py fetch --pages 40 --latency 0.2 --concurrency 1,2,4,8
+    python benchmark.py transport --transports requests,httpx --bandwidth 262144
+    python benchmark.py parse --pages 40 [--fixtures DIR]
+    python benchmark.py extract --vocab-sizes 0,100,1000
+    python benchmark.py pipeline --workers 0,2,4 [--fixtures DIR]
+    python benchmark.py enrich --pages 8 --latency 0.05
+    python benchmark.py retry --pages 30 --capacity 5 --error-rate 0.05
+    python benchmark.py normalize --repeat 5
+    python benchmark.py memory --listings 100000
+    python benchmark.py analytics --listings 1000000
+    python benchmark.py export --listings 200000 --formats csv,jsonl.gz,arrow,parquet
+    python benchmark.py catalog --listings 200000
+    python benchmark.py logging --threads 4 --messages 20000 [--write-latency 0.0002]
+    python benchmark.py suite --output results.json [--compare baseline.json]
+    python benchmark.py record --url URL --pages 10 [--out DIR]
+"""
+
+import argparse
+import copy
+import csv
+import gc
+import glob
+import gzip
+import io
+import json
+import logging
+import math
+import multiprocessing
+import os
+import random
+import re
+import resource
+import platform
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+import tracemalloc
+import zlib
+from collections import deque
+from html import escape
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Dict, Optional
+from urllib.parse import urlparse, parse_qs
+
+from config import OUTPUT_FILE
+from storage import read_csv_rows
+
+LISTINGS_PER_PAGE = 25
+SEARCH_PATH = "/used-cars/search/-/ct_islamabad/"
+SITE = "https://www.pakwheels.com"
+LISTING_ID_PATH = re.compile(r'^/used-cars/.*-(\d+)$')
+
+# Search result pages replayed by the suite
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'search')
+
+# Stub server conditions the suite runs under: fixed and random extra latency
+# in seconds, and the fractions of requests answered 503 or hung up on
+SCENARIOS = {
+    'fast': dict(latency=0.01, jitter=0.01),
+    'steady': dict(latency=0.05, jitter=0.05),
+    'slow': dict(latency=0.25, jitter=0.25),
+    'flaky': dict(latency=0.05, jitter=0.05, error_rate=0.1, drop_rate=0.03),
+}
+
+# Suite results compared between runs, and whether a higher value is better
+SUITE_METRICS = {
+    'pages_per_sec': True,
+    'listings_per_sec': True,
+    'latency_p50_ms': False,
+    'latency_p95_ms': False,
+    'peak_rss_mib': False,
+}
+
+# StubServer.faults key for connections closed without an answer
+DROPPED = 'dropped'
+
+# Content encodings the stub server can send, best first; br and zstd only
+# when their compressors are installed
+STUB_ENCODINGS = {'gzip': lambda body: gzip.compress(body, 6)}
+try:
+    import zstandard
+    STUB_ENCODINGS = {'zstd': lambda body: zstandard.ZstdCompressor(level=3).compress(body), **STUB_ENCODINGS}
+except ImportError:
+    pass
+try:
+    import brotli
+    STUB_ENCODINGS = {'br': lambda body: brotli.compress(body, quality=5), **STUB_ENCODINGS}
+except ImportError:
+    pass
+
+# Bytes the stub writes at a time when its bandwidth is capped
+STUB_WRITE_SIZE = 4096
+
+
+def load_sample_rows(filename: str = OUTPUT_FILE) -> List[Dict[str, str]]:
+    """Load previously scraped rows to build fixture pages from"""
+    with open(filename, newline='', encoding='utf-8') as csvfile:
+        return list(csv.DictReader(csvfile))
+
+
+def _digits(text: str) -> int:
+    digits = ''.join(ch for ch in text if ch.isdigit())
+    return int(digits) if digits else 0
+
+
+def listing_url(row: Dict[str, str], site: str = SITE) -> str:
+    """Rebuild a proper listing URL from a CSV row (older rows have mangled URLs)"""
+    url = row.get('URL', '')
+    if url.startswith('https://') and site == SITE:
+        return url
+    slug = url.split('used-cars')[-1].lstrip('/')
+    return f"{site}/used-cars/{slug}"
+
+
+def _description(row: Dict[str, str]) -> str:
+    color = f" in {row['Color'].lower()} color," if row['Color'] != 'N/A' else ','
+    return (f"{row['Car Model']}{color} "
+            f"{row['Transmission'].lower()} transmission, driven {row['Mileage']} km.")
+
+
+def build_detail_page(row: Dict[str, str]) -> bytes:
+    """Render a PakWheels-style listing page with its spec list"""
+    json_ld = {
+        '@context': 'https://schema.org',
+        '@type': 'Car',
+        'name': row['Car Model'],
+        'color': row['Color'],
+        'modelDate': _digits(row['Model Year']) or None,
+        'vehicleTransmission': row['Transmission'],
+        'mileageFromOdometer': f"{row['Mileage']} km",
+        'offers': {'@type': 'Offer', 'price': _digits(row['Price']), 'priceCurrency': 'PKR'},
+    }
+    specs = [('Registered In', row['Registration City']), ('Color', row['Color']),
+             ('Assembly', 'Local'), ('Body Type', 'Sedan')]
+    spec_items = ''.join(f'<li class="ad-data">{escape(label)}</li><li>{escape(value)}</li>'
+                         for label, value in specs)
+    return (
+        '<!DOCTYPE html><html><head><title>{name}</title>'
+        '<script type="application/ld+json">{json_ld}</script></head>'
+        '<body><h1>{name}</h1><ul class="ul-specs" id="scroll_car_detail">{specs}</ul></body></html>'
+    ).format(name=escape(row['Car Model']), json_ld=json.dumps(json_ld), specs=spec_items).encode('utf-8')
+
+
+def build_listing_html(row: Dict[str, str], site: str = SITE) -> str:
+    """Render one row as a PakWheels-style search result <li>"""
+    json_ld = {
+        '@context': 'https://schema.org',
+        '@type': 'Car',
+        'name': row['Car Model'],
+        'modelDate': _digits(row['Model Year']) or None,
+        'vehicleTransmission': row['Transmission'],
+        'mileageFromOdometer': f"{row['Mileage']} km",
+        'description': _description(row),
+        'offers': {
+            '@type': 'Offer',
+            'price': _digits(row['Price']),
+            'priceCurrency': 'PKR',
+            'url': listing_url(row, site),
+        },
+    }
+    return (
+        '<li class="classified-listing" data-listing-id="{id}">'
+        '<script type="application/ld+json">{json_ld}</script>'
+        '<div class="search-title"><h3>{name}</h3></div>'
+        '<ul class="list-unstyled search-vehicle-info fs13"><li>{city}</li></ul>'
+        '<ul class="list-unstyled search-vehicle-info-2 fs13">'
+        '<li>{year}</li><li>{mileage} km</li><li>Petrol</li><li>{transmission}</li></ul>'
+        '<div class="price-details generic-dark-grey">{price}</div>'
+        '</li>'
+    ).format(
+        id=listing_url(row).rsplit('-', 1)[-1],
+        json_ld=json.dumps(json_ld),
+        name=escape(row['Car Model']),
+        city=escape(row['Registration City']),
+        year=escape(row['Model Year']),
+        mileage=escape(row['Mileage']),
+        transmission=escape(row['Transmission']),
+        price=escape(row['Price']),
+    )
+
+
+def build_pagination(page_num: int, last_page: int) -> str:
+    """Render the result count and page links the way PakWheels does"""
+    first = (page_num - 1) * LISTINGS_PER_PAGE + 1
+    links = ''.join(
+        f'<li class="{"active" if n == page_num else ""}"><a href="{SEARCH_PATH}?page={n}">{n}</a></li>'
+        for n in range(max(1, page_num - 2), min(last_page, page_num + 2) + 1)
+    )
+    if page_num < last_page:
+        links += (f'<li class="next_page"><a rel="next" href="{SEARCH_PATH}?page={page_num + 1}">Next</a></li>'
+                  f'<li class="last next"><a href="{SEARCH_PATH}?page={last_page}">Last</a></li>')
+    return (f'<div class="search-count">Showing {first} - {first + LISTINGS_PER_PAGE - 1} of '
+            f'{last_page * LISTINGS_PER_PAGE:,} Results</div>'
+            f'<ul class="pagination search-pagi">{links}</ul>')
+
+
+def build_search_page(rows: List[Dict[str, str]], site: str = SITE, page_num: int = None,
+                      last_page: int = None) -> str:
+    """Render a full search results page around a list of rows, with pagination if
+    the page's place in the results is given"""
+    listings = ''.join(build_listing_html(row, site) for row in rows)
+    pagination = build_pagination(page_num, last_page) if page_num else ''
+    return (
+        '<!DOCTYPE html><html><head><title>Used Cars for sale in Islamabad</title></head>'
+        '<body><div class="container"><ul class="list-unstyled search-results">'
+        f'{listings}</ul>{pagination}</div></body></html>'
+    )
+
+
+def build_fixture_pages(rows: List[Dict[str, str]], num_pages: int, site: str = SITE,
+                        paginate: bool = True) -> List[bytes]:
+    """Split rows into search pages, wrapping around if there aren't enough rows"""
+    pages = []
+    for page in range(num_pages):
+        start = (page * LISTINGS_PER_PAGE) % max(1, len(rows))
+        page_rows = (rows[start:] + rows[:start])[:LISTINGS_PER_PAGE]
+        page_num = page + 1 if paginate else None
+        pages.append(build_search_page(page_rows, site, page_num, num_pages).encode('utf-8'))
+    return pages
+
+
+class StubServer:
+    """Local HTTP server that serves fixture pages with artificial latency.
+
+    Search pages are served by ?page= number; `details` maps listing IDs to
+    the listing pages served at /used-cars/<slug>-<id>. Each request waits
+    `latency` seconds plus a random share of up to `jitter` seconds.
+
+    Faults can be injected to exercise retries: above `capacity` requests per
+    second the server answers 429, and a random `error_rate` fraction of
+    requests get a 503. Both carry `retry_after` as a Retry-After header if set.
+    A random `drop_rate` fraction of requests get no answer at all; the
+    connection is closed instead, as if it had been reset.
+
+    With `compress` set, bodies are sent in the best encoding the client
+    accepts that the server can produce here (br, zstd, gzip). `bandwidth`
+    caps how many bytes per second each response body is sent at.
+    """
+
+    def __init__(self, pages: List[bytes], latency: float = 0.0, details: Dict[int, bytes] = None,
+                 capacity: float = 0, error_rate: float = 0.0, retry_after: Optional[int] = None,
+                 jitter: float = 0.0, drop_rate: float = 0.0, compress: bool = False, bandwidth: float = 0):
+        self.pages = pages
+        self.compress = compress
+        self.bandwidth = bandwidth
+        self.encodings: Dict[str, int] = {}  # responses sent per content encoding
+        self._encoded: Dict[tuple, bytes] = {}
+        self.details = details or {}
+        self.latency = latency
+        self.jitter = jitter
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.drop_rate = drop_rate
+        self.retry_after = retry_after
+        self.requests_served = 0
+        self.faults = {429: 0, 503: 0, DROPPED: 0}
+        self._recent = deque()
+        self._lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), self._make_handler())
+        self.httpd.daemon_threads = True
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def origin(self) -> str:
+        host, port = self.httpd.server_address
+        return f"http://{host}:{port}"
+
+    @property
+    def url(self) -> str:
+        return f"{self.origin}{SEARCH_PATH}"
+
+    def _fault(self):
+        """Status code to fail the current request with, DROPPED, or None"""
+        now = time.monotonic()
+        with self._lock:
+            self.requests_served += 1
+            if self.capacity:
+                while self._recent and now - self._recent[0] >= 1.0:
+                    self._recent.popleft()
+                if len(self._recent) >= self.capacity:
+                    self.faults[429] += 1
+                    return 429
+                self._recent.append(now)
+            if self.error_rate and random.random() < self.error_rate:
+                self.faults[503] += 1
+                return 503
+            if self.drop_rate and random.random() < self.drop_rate:
+                self.faults[DROPPED] += 1
+                return DROPPED
+        return None
+
+    def _encode(self, body: bytes, accept_encoding: str) -> tuple:
+        """(encoding, body) to send for a client's Accept-Encoding header"""
+        accepted = {part.split(';')[0].strip() for part in accept_encoding.split(',')}
+        for encoding in STUB_ENCODINGS:
+            if encoding in accepted:
+                key = (encoding, zlib.crc32(body), len(body))
+                encoded = self._encoded.get(key)
+                if encoded is None:
+                    encoded = self._encoded[key] = STUB_ENCODINGS[encoding](body)
+                return encoding, encoded
+        return None, body
+
+    def _make_handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                fault = stub._fault()
+                delay = stub.latency + (random.uniform(0, stub.jitter) if stub.jitter else 0)
+                if delay:
+                    time.sleep(delay)
+                if fault == DROPPED:
+                    self.close_connection = True
+                    return
+                if fault:
+                    self.send_response(fault)
+                    if stub.retry_after is not None:
+                        self.send_header('Retry-After', str(stub.retry_after))
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+
+                path = urlparse(self.path)
+                detail = LISTING_ID_PATH.match(path.path)
+                query = parse_qs(path.query)
+                page_num = int(query.get('page', ['1'])[0])
+                if detail:
+                    body = stub.details.get(int(detail.group(1)))
+                    if body is None:
+                        self.send_response(404)
+                        self.send_header('Content-Length', '0')
+                        self.end_headers()
+                        return
+                elif 1 <= page_num <= len(stub.pages):
+                    body = stub.pages[page_num - 1]
+                else:
+                    body = build_search_page([]).encode('utf-8')
+
+                etag = f'"{zlib.crc32(body):08x}"'
+                if self.headers.get('If-None-Match') == etag:
+                    self.send_response(304)
+                    self.send_header('ETag', etag)
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+
+                encoding = None
+                if stub.compress:
+                    encoding, body = stub._encode(body, self.headers.get('Accept-Encoding', ''))
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/html; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.send_header('ETag', etag)
+                if encoding:
+                    self.send_header('Content-Encoding', encoding)
+                self.end_headers()
+                with stub._lock:
+                    stub.encodings[encoding or 'identity'] = stub.encodings.get(encoding or 'identity', 0) + 1
+                if not stub.bandwidth:
+                    self.wfile.write(body)
+                    return
+                for start in range(0, len(body), STUB_WRITE_SIZE):
+                    piece = body[start:start + STUB_WRITE_SIZE]
+                    self.wfile.write(piece)
+                    self.wfile.flush()
+                    time.sleep(len(piece) / stub.bandwidth)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def bench_fetch(args):
+    """Pages/sec of scrape_multiple_pages at different concurrency levels"""
+    from pakwheels_scraper import PakWheelsScraper
+
+    pages = build_fixture_pages(load_sample_rows(args.data), args.pages)
+    print(f"Fetch benchmark: {args.pages} pages, {args.latency:.3f}s server latency, "
+          f"rate limit {args.rate_limit or 'off'}")
+    print(f"{'concurrency':>12} {'seconds':>9} {'pages/sec':>10} {'cars':>7}")
+
+    with StubServer(pages, latency=args.latency) as server:
+        for concurrency in args.concurrency:
+            scraper = PakWheelsScraper(concurrency=concurrency, rate_limit=args.rate_limit, cache_mode='off')
+            start = time.perf_counter()
+            cars = sum(1 for _ in scraper.scrape_multiple_pages(args.pages, server.url))
+            elapsed = time.perf_counter() - start
+            print(f"{concurrency:>12} {elapsed:>9.2f} {args.pages / elapsed:>10.1f} {cars:>7}")
+
+
+def bench_transport(args):
+    """Pages/sec, bytes on the wire and time to first byte per HTTP transport,
+    with and without compressed responses"""
+    from metrics import MetricsRegistry
+    from pakwheels_scraper import PakWheelsScraper
+
+    pages = load_fixture_pages(args)
+    bandwidth = f"{args.bandwidth / 1024:g} KiB/s per response" if args.bandwidth else "unlimited bandwidth"
+    print(f"Transport benchmark: {len(pages)} pages, {args.latency:.3f}s server latency, {bandwidth}, "
+          f"concurrency {args.concurrency}")
+    print(f"{'transport':<10} {'compress':<9} {'encoding':<9} {'seconds':>8} {'pages/sec':>10} "
+          f"{'wire KiB/page':>14} {'KiB/page':>9} {'ttfb p50 ms':>12} {'ttfb p95 ms':>12} {'cars':>6}")
+
+    for transport in args.transports:
+        for compress in (False, True):
+            # Millisecond buckets, so the quantiles are close to exact
+            registry = MetricsRegistry(buckets=[ms / 1000 for ms in range(1, 5001)])
+            with StubServer(pages, latency=args.latency, compress=compress, bandwidth=args.bandwidth) as server:
+                scraper = PakWheelsScraper(concurrency=args.concurrency, rate_limit=0, cache_mode='off',
+                                           metrics=registry, transport=transport)
+                if scraper.transport.name != transport:
+                    print(f"{transport:<10} not available")
+                    break
+                start = time.perf_counter()
+                cars = sum(1 for _ in scraper.scrape_multiple_pages(len(pages), server.url))
+                elapsed = time.perf_counter() - start
+                scraper.transport.close()
+                encoding = max(server.encodings, key=server.encodings.get) if server.encodings else 'identity'
+            fetched = sum(registry.counters['bytes_fetched'].values())
+            wire = sum(registry.counters['bytes_on_wire'].values())
+            ttfb = registry.histograms['ttfb']
+            print(f"{transport:<10} {'on' if compress else 'off':<9} {encoding:<9} "
+                  f"{elapsed:>8.2f} {len(pages) / elapsed:>10.1f} {wire / len(pages) / 1024:>14.1f} "
+                  f"{fetched / len(pages) / 1024:>9.1f} {ttfb.quantile(0.5) * 1000:>12.1f} "
+                  f"{ttfb.quantile(0.95) * 1000:>12.1f} {cars:>6}")
+
+
+def load_fixture_pages(args) -> List[bytes]:
+    """Saved HTML pages from --fixtures, or synthetic pages built from the CSV"""
+    if args.fixtures:
+        paths = sorted(glob.glob(os.path.join(args.fixtures, '*.html')))
+        pages = []
+        for path in paths:
+            with open(path, 'rb') as f:
+                pages.append(f.read())
+        return pages
+    return build_fixture_pages(load_sample_rows(args.data), args.pages)
+
+
+def _parse_pages(backend: str, pages: List[bytes]) -> int:
+    """Parse and extract every listing on the given pages, returning the listing count"""
+    from pakwheels_scraper import PakWheelsScraper
+    from utils import validate_listing
+
+    scraper = PakWheelsScraper(concurrency=1, parser_backend=backend, cache_mode='off')
+    count = 0
+    for content in pages:
+        for listing in scraper.parser.parse(content).listings:
+            car_data = scraper.extract_car_details(listing)
+            if car_data and validate_listing(car_data):
+                count += 1
+    return count
+
+
+def _parse_worker(backend: str, pages: List[bytes], repeat: int, results):
+    """Runs in a fresh process so the RSS high-water mark belongs to one backend"""
+    logging.disable(logging.WARNING)
+    _parse_pages(backend, pages[:1])  # warm up imports and compiled selectors
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        listings = _parse_pages(backend, pages)
+    elapsed = time.perf_counter() - start
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    results.put((listings * repeat, elapsed, (peak - baseline) / 1024))
+
+
+def bench_parse(args):
+    """Listings/sec and peak memory of each parsing backend, no network involved"""
+    pages = load_fixture_pages(args)
+    total_bytes = sum(len(page) for page in pages)
+    print(f"Parse benchmark: {len(pages)} pages, {total_bytes / 1024:.0f} KiB of HTML, x{args.repeat}")
+    print(f"{'backend':>8} {'listings':>9} {'seconds':>9} {'listings/sec':>13} {'peak RSS +MiB':>14}")
+
+    ctx = multiprocessing.get_context('spawn')
+    for backend in args.backends:
+        results = ctx.Queue()
+        worker = ctx.Process(target=_parse_worker, args=(backend, pages, args.repeat, results))
+        worker.start()
+        listings, elapsed, peak_mib = results.get()
+        worker.join()
+        print(f"{backend:>8} {listings:>9} {elapsed:>9.2f} {listings / elapsed:>13.0f} {peak_mib:>14.1f}")
+
+
+def _legacy_city_and_color(description: str, url: str, cities: List[str], colors: List[str]):
+    """City/color lookup as extract_car_details used to do it, kept for comparison"""
+    import re
+    description = description.lower()
+    color = None
+    color_alternation = '|'.join(colors)
+    color_patterns = [
+        rf'({color_alternation})\s*(?:color|colour)',
+        rf'(?:color|colour):\s*({color_alternation})',
+    ]
+    for pattern in color_patterns:
+        match = re.compile(pattern).search(description)
+        if match:
+            color = match.group(1).title()
+            break
+
+    city = None
+    for candidate in cities:
+        if candidate in description or (url and candidate in url.lower()):
+            city = candidate.title()
+            break
+    return city, color
+
+
+def bench_extract(args):
+    """City/color extraction over the CSV rows: legacy loops vs. the precompiled engine"""
+    from config import CITIES, COLORS, COLOR_CONTEXT
+    from extraction import FieldExtractor
+
+    rows = load_sample_rows(args.data)
+    samples = [(_description(row), listing_url(row)) for row in rows]
+    print(f"Extract benchmark: {len(samples)} rows x{args.repeat}")
+    print(f"{'extra words':>12} {'legacy rows/sec':>16} {'engine rows/sec':>16} {'speedup':>8}")
+
+    base_colors = sorted({variant for variants in COLORS.values() for variant in variants})
+    for extra in args.vocab_sizes:
+        # Grow both vocabularies with made-up words that never match, which is
+        # the worst case for a linear scan
+        cities = list(CITIES) + [f"zzcity{i}" for i in range(extra)]
+        colors = dict(COLORS, zzcolor=[f"zzcolor{i}" for i in range(extra)])
+        color_words = base_colors + colors['zzcolor']
+        extractor = FieldExtractor(cities, colors, COLOR_CONTEXT)
+
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            for description, url in samples:
+                _legacy_city_and_color(description, url, cities, color_words)
+        legacy = len(samples) * args.repeat / (time.perf_counter() - start)
+
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            for description, url in samples:
+                extractor.find_color_phrase(description)
+                extractor.find_city(description, url)
+        engine = len(samples) * args.repeat / (time.perf_counter() - start)
+
+        print(f"{extra:>12} {legacy:>16.0f} {engine:>16.0f} {engine / legacy:>7.1f}x")
+
+
+def _legacy_clean_text(text: str) -> str:
+    """clean_text as it was: two uncompiled substitutions, applied to every field"""
+    if not text:
+        return ""
+    text = re.sub(r'\s+', ' ', text.strip())
+    return re.sub(r'[^\w\s\-\.\,\(\)]', '', text)
+
+
+_LEGACY_CAR_TERMS = ['for sale', 'honda', 'toyota', 'suzuki', 'hyundai', 'kia', 'nissan', 'bmw', 'audi',
+                     'mercedes', 'corolla', 'civic', 'city', 'alto', 'cultus', 'prado', 'vitz', 'mehran',
+                     'camry', 'hilux', 'fortuner', 'innova', 'swift', 'baleno']
+_LEGACY_INVALID = ['post an ad', 'create quick alerts', 'how many used cars',
+                   'what is the starting price', 'what are the popular', 'let us know whats wrong']
+
+
+def _legacy_normalize_and_validate(row: Dict[str, str]) -> bool:
+    """normalize_car_data + validate_car_data as they were: every field through clean_text, then linear scans"""
+    data = {key: _legacy_clean_text(str(value)) for key, value in row.items()}
+    car_model = data.get('Car Model', '').lower()
+    if not car_model or car_model in ['na', 'n/a', 'n a']:
+        return False
+    for pattern in _LEGACY_INVALID:
+        if pattern in car_model:
+            return False
+    if any(term in car_model for term in _LEGACY_CAR_TERMS):
+        return True
+    model_year = data.get('Model Year', '')
+    if model_year.isdigit() and 1990 <= int(model_year) <= 2025:
+        return True
+    return data.get('Transmission', '') in ['Automatic', 'Manual', 'CVT']
+
+
+def _raw_listing(row: Dict[str, str]):
+    """A listing holding the row's values as scraped, before normalization"""
+    from records import CarListing
+
+    return CarListing(row['Car Model'], row['Color'], row['Transmission'], row['Mileage'],
+                      row['Model Year'], row['Registration City'], row['Price'], listing_url(row))
+
+
+def check_urls(rows: List[Dict[str, str]]) -> int:
+    """Check that listing URLs come through normalization, extraction and a CSV round trip
+    unchanged, and that mangled ones from older CSVs are repaired. Returns the URLs checked."""
+    from pakwheels_scraper import PakWheelsScraper
+    from records import CarListing, normalize_listing
+    from utils import normalize_url
+
+    expected = [listing_url(row) for row in rows]
+    failures = []
+    for row, url in zip(rows, expected):
+        if normalize_url(url) != url:
+            failures.append(f"normalize_url changed {url!r} to {normalize_url(url)!r}")
+        if normalize_url(row['URL']) != url:
+            failures.append(f"CSV URL {row['URL']!r} repaired to {normalize_url(row['URL'])!r}, expected {url!r}")
+        listing = normalize_listing(_raw_listing(row))
+        if CarListing.from_row(listing.to_row()).url != url:
+            failures.append(f"CSV round trip changed {url!r}")
+
+    scraper = PakWheelsScraper(concurrency=1, cache_mode='off')
+    page = build_search_page(rows[:LISTINGS_PER_PAGE]).encode('utf-8')
+    extracted = [car.url for car in scraper.extract_page(scraper.parser.parse(page), 1)]
+    if extracted != expected[:len(extracted)] or not extracted:
+        failures.append(f"extracted URLs {extracted[:2]} differ from {expected[:2]}")
+
+    if failures:
+        raise SystemExit("URL checks failed:\n  " + "\n  ".join(failures[:10]))
+    return len(rows) + len(extracted)
+
+
+def bench_normalize(args):
+    """Normalization + validation of the CSV rows: clean_text on every field vs. per-field normalizers"""
+    from records import normalize_listing
+    from utils import validate_listing
+
+    rows = load_sample_rows(args.data)
+    print(f"URL checks: {check_urls(rows)} URLs intact")
+
+    print(f"Normalize benchmark: {len(rows)} rows x{args.repeat}")
+    print(f"{'path':>22} {'rows/sec':>11} {'valid':>7}")
+    start = time.perf_counter()
+    for _ in range(args.repeat):
+        valid = sum(_legacy_normalize_and_validate(dict(row, URL=listing_url(row))) for row in rows)
+    legacy = len(rows) * args.repeat / (time.perf_counter() - start)
+    print(f"{'clean_text everywhere':>22} {legacy:>11.0f} {valid:>7}")
+
+    start = time.perf_counter()
+    for _ in range(args.repeat):
+        valid = sum(validate_listing(normalize_listing(_raw_listing(row))) for row in rows)
+    fast = len(rows) * args.repeat / (time.perf_counter() - start)
+    print(f"{'per-field normalizers':>22} {fast:>11.0f} {valid:>7}  ({fast / legacy:.1f}x)")
+
+
+def bench_pipeline(args):
+    """Pages/sec with parsing on the fetch threads vs. in a pool of parser processes"""
+    from pakwheels_scraper import PakWheelsScraper
+
+    pages = load_fixture_pages(args)
+    print(f"Pipeline benchmark: {len(pages)} pages replayed, {args.latency:.3f}s server latency, "
+          f"{args.concurrency} fetch threads, {args.backend} parser, {os.cpu_count()} CPUs")
+    print(f"{'parse workers':>14} {'seconds':>9} {'pages/sec':>10} {'cars':>7}")
+
+    with StubServer(pages, latency=args.latency) as server:
+        for workers in args.workers:
+            scraper = PakWheelsScraper(concurrency=args.concurrency, rate_limit=0, parser_backend=args.backend,
+                                       cache_mode='off', parse_workers=workers)
+            start = time.perf_counter()
+            cars = sum(1 for _ in scraper.scrape_multiple_pages(len(pages), server.url))
+            elapsed = time.perf_counter() - start
+            print(f"{workers:>14} {elapsed:>9.2f} {len(pages) / elapsed:>10.1f} {cars:>7}")
+
+
+def bench_enrich(args):
+    """Extra detail-page requests vs. fields filled for each enrichment mode"""
+    from enrichment import DetailEnricher
+    from pakwheels_scraper import PakWheelsScraper
+
+    rows = load_sample_rows(args.data)
+    # Half the search snippets say nothing about color, as on the live site
+    snippet_rows = [dict(row, Color='N/A') if i % 2 else row for i, row in enumerate(rows)]
+    details = {}
+    for row in rows:
+        detail_id = LISTING_ID_PATH.match(urlparse(listing_url(row)).path)
+        if detail_id:
+            details[int(detail_id.group(1))] = build_detail_page(row)
+
+    print(f"Enrichment benchmark: {args.pages} pages, {args.latency:.3f}s server latency, "
+          f"{args.workers} detail workers")
+    print(f"{'mode':>8} {'run':>5} {'seconds':>9} {'requests':>9} {'cached':>7} {'filled':>7} "
+          f"{'corrected':>10} {'per request':>12}")
+
+    cache_dir = tempfile.mkdtemp(prefix='enrich-bench-')
+    try:
+        with StubServer([], latency=args.latency, details=details) as server:
+            server.pages = build_fixture_pages(snippet_rows, args.pages, site=server.origin)
+            scraper = PakWheelsScraper(concurrency=args.workers, rate_limit=0, cache_mode='off')
+            pages = [page_data for _, page_data in scraper.iter_pages(args.pages, server.url)]
+
+            for mode in args.modes:
+                cache_file = os.path.join(cache_dir, f"{mode}.db")
+                # The second run shows what the listing ID cache saves
+                for run in ('cold', 'warm'):
+                    enricher = DetailEnricher(scraper.fetch_page, mode, workers=args.workers,
+                                              cache_file=cache_file)
+                    start = time.perf_counter()
+                    for page_data in pages:
+                        enricher.enrich([copy.copy(row) for row in page_data])
+                    elapsed = time.perf_counter() - start
+                    enricher.close()
+
+                    stats = enricher.stats
+                    improved = stats['fields_filled'] + stats['fields_corrected']
+                    per_request = improved / stats['requests'] if stats['requests'] else 0
+                    print(f"{mode:>8} {run:>5} {elapsed:>9.2f} {stats['requests']:>9} {stats['cache_hits']:>7} "
+                          f"{stats['fields_filled']:>7} {stats['fields_corrected']:>10} {per_request:>12.2f}")
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+
+def bench_retry(args):
+    """Pages kept and pages/sec against a server that throttles and fails, with and without retries"""
+    from pakwheels_scraper import PakWheelsScraper
+    from throttle import HostRateLimiter, MAX_RETRIES
+
+    pages = build_fixture_pages(load_sample_rows(args.data), args.pages)
+    print(f"Retry benchmark: {args.pages} pages, server capacity {args.capacity:g} req/s, "
+          f"{args.error_rate:.0%} random 503s, Retry-After {args.retry_after}, {args.concurrency} threads")
+    print(f"{'strategy':>20} {'seconds':>9} {'pages/sec':>10} {'pages kept':>11} {'429s':>6} {'503s':>6} "
+          f"{'final rate':>11}")
+
+    strategies = [
+        ('fixed, no retries', HostRateLimiter(args.rate, 4), 0),
+        ('fixed, retries', HostRateLimiter(args.rate, 4), MAX_RETRIES),
+        ('adaptive, retries', HostRateLimiter(args.start_rate, 4, 0.2, args.rate), MAX_RETRIES),
+    ]
+    for name, limiter, retries in strategies:
+        with StubServer(pages, latency=args.latency, capacity=args.capacity, error_rate=args.error_rate,
+                        retry_after=args.retry_after) as server:
+            scraper = PakWheelsScraper(concurrency=args.concurrency, cache_mode='off', rate_limiter=limiter,
+                                       retries=retries)
+            start = time.perf_counter()
+            kept = sum(1 for _, page_data in scraper.iter_pages(args.pages, server.url) if page_data)
+            elapsed = time.perf_counter() - start
+            rate = next(iter(limiter.metrics().values()))['rate']
+            print(f"{name:>20} {elapsed:>9.2f} {args.pages / elapsed:>10.1f} {kept:>11} "
+                  f"{server.faults[429]:>6} {server.faults[503]:>6} {rate:>11g}")
+
+
+def write_listing_csv(rows: List[Dict[str, str]], count: int, csvfile):
+    """Write `count` listings cycling through the sample rows, each with its own ID and price"""
+    writer = csv.DictWriter(csvfile, fieldnames=list(rows[0]))
+    writer.writeheader()
+    for i in range(count):
+        row = rows[i % len(rows)]
+        slug = listing_url(row).rsplit('-', 1)[0]
+        writer.writerow(dict(row, URL=f"{slug}-{10_000_000 + i}",
+                             Price=f"PKR {_digits(row['Price']) + (i % 1000) * 1000:,}"))
+
+
+def _listing_csv(rows: List[Dict[str, str]], count: int) -> str:
+    buffer = io.StringIO()
+    write_listing_csv(rows, count, buffer)
+    return buffer.getvalue()
+
+
+def bench_memory(args):
+    """Memory held per 100k listings as CSV dicts, CarListing records and ListingColumns"""
+    from records import CarListing, ListingColumns
+
+    text = _listing_csv(load_sample_rows(args.data), args.listings)
+    reader = lambda: csv.DictReader(io.StringIO(text))
+    forms = [
+        ('dict rows', lambda: list(reader())),
+        ('CarListing', lambda: [CarListing.from_row(row) for row in reader()]),
+        ('ListingColumns', lambda: ListingColumns(CarListing.from_row(row) for row in reader())),
+    ]
+
+    print(f"Memory benchmark: {args.listings} listings")
+    print(f"{'form':>15} {'MiB held':>9} {'MiB per 100k':>13} {'bytes/listing':>14} {'build secs':>11}")
+    for name, build in forms:
+        gc.collect()
+        tracemalloc.start()
+        start = time.perf_counter()
+        held = build()
+        elapsed = time.perf_counter() - start
+        gc.collect()
+        size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        assert len(held) == args.listings
+        del held
+        print(f"{name:>15} {size / 2**20:>9.1f} {size / args.listings * 100_000 / 2**20:>13.1f} "
+              f"{size / args.listings:>14.0f} {elapsed:>11.2f}")
+
+
+def _naive_summary(filename: str, groupings: List[str]) -> Dict[str, Dict]:
+    """Per-group price percentiles the way a dict-per-row loop would compute them"""
+    from records import parse_int, title_model
+
+    keys = {
+        'make': lambda row: row['Car Model'].split()[0].title() if row['Car Model'].split() else None,
+        'model': lambda row: ' '.join(title_model(row['Car Model']).split()[:2]) if row['Car Model'].split() else None,
+        'variant': lambda row: title_model(row['Car Model']),
+        'year': lambda row: parse_int(row['Model Year']),
+        'city': lambda row: row['Registration City'] if row['Registration City'] not in ('N/A', 'NA') else None,
+    }
+    result = {}
+    for by in groupings:
+        groups = {}
+        for row in read_csv_rows(filename):
+            key = keys[by](row)
+            price = parse_int(row['Price'])
+            if key is not None and price is not None:
+                groups.setdefault(key, []).append(price)
+        stats = {}
+        for key, prices in groups.items():
+            prices.sort()
+            stats[key] = {f"p{p}": prices[round((len(prices) - 1) * p / 100)] for p in (10, 25, 50, 75, 90)}
+        result[by] = stats
+    return result
+
+
+def bench_analytics(args):
+    """Grouped price/mileage percentiles, depreciation and outliers: naive dict loop vs. the column engine"""
+    import analytics
+    from analytics import GROUPINGS, ListingAnalytics
+    from records import ListingColumns
+
+    workdir = tempfile.mkdtemp(prefix='analytics-bench-')
+    try:
+        filename = os.path.join(workdir, 'listings.csv')
+        with open(filename, 'w', newline='', encoding='utf-8') as csvfile:
+            write_listing_csv(load_sample_rows(args.data), args.listings, csvfile)
+
+        print(f"Analytics benchmark: {args.listings} listings, groupings {', '.join(GROUPINGS)}")
+        print(f"{'engine':>22} {'load secs':>10} {'compute secs':>13} {'total':>8} {'rows/sec':>11}")
+
+        start = time.perf_counter()
+        _naive_summary(filename, GROUPINGS)
+        elapsed = time.perf_counter() - start
+        print(f"{'naive dict loop':>22} {'-':>10} {'-':>13} {elapsed:>8.2f} {args.listings / elapsed:>11.0f}")
+
+        start = time.perf_counter()
+        columns = ListingColumns.from_csv(filename)
+        load = time.perf_counter() - start
+        backends = [False, True] if analytics.np is not None else [False]
+        for use_numpy in backends:
+            start = time.perf_counter()
+            engine = ListingAnalytics(columns, use_numpy=use_numpy)
+            engine.summary(GROUPINGS, top=args.top)
+            compute = time.perf_counter() - start
+            name = f"columns ({engine.backend})"
+            print(f"{name:>22} {load:>10.2f} {compute:>13.2f} {load + compute:>8.2f} "
+                  f"{args.listings / (load + compute):>11.0f}")
+        if analytics.np is None:
+            print("NumPy is not installed; only the pure Python column backend was measured")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def _load_export(filename: str, fmt: str) -> int:
+    """Read an export back into typed values the way a consumer would; returns the row count"""
+    if fmt == 'csv':
+        from storage import read_listings
+        return sum(1 for _ in read_listings(filename))
+    if fmt == 'jsonl.gz':
+        with gzip.open(filename, 'rt', encoding='utf-8') as f:
+            return sum(1 for line in f if json.loads(line))
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    if fmt == 'parquet':
+        return pq.read_table(filename).num_rows
+    with pa.ipc.open_stream(filename) as reader:
+        return reader.read_all().num_rows
+
+
+def bench_export(args):
+    """Size, write and load time of the same listings as CSV, jsonl.gz, Arrow and Parquet"""
+    import exporters
+    from records import CarListing
+
+    text = _listing_csv(load_sample_rows(args.data), args.listings)
+    listings = [CarListing.from_row(row) for row in csv.DictReader(io.StringIO(text))]
+    formats = [fmt for fmt in args.formats if fmt not in exporters.ARROW_FORMATS or exporters.pa is not None]
+
+    workdir = tempfile.mkdtemp(prefix='export-bench-')
+    try:
+        print(f"Export benchmark: {args.listings} listings")
+        print(f"{'format':>9} {'MiB':>8} {'bytes/listing':>14} {'write secs':>11} {'load secs':>10}")
+        csv_size = None
+        for fmt in formats:
+            filename = exporters.export_filename(os.path.join(workdir, 'listings.csv'), fmt)
+            start = time.perf_counter()
+            exporters.write_export(listings, filename, fmt)
+            write = time.perf_counter() - start
+            start = time.perf_counter()
+            rows = _load_export(filename, fmt)
+            load = time.perf_counter() - start
+            assert rows == args.listings
+            size = os.path.getsize(filename)
+            csv_size = csv_size or (size if fmt == 'csv' else None)
+            ratio = f"  ({size / csv_size:.0%} of CSV)" if csv_size and fmt != 'csv' else ''
+            print(f"{fmt:>9} {size / 2**20:>8.2f} {size / args.listings:>14.1f} {write:>11.2f} {load:>10.2f}{ratio}")
+        if exporters.pa is None:
+            print("pyarrow is not installed; the arrow and parquet formats were skipped")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def bench_catalog(args):
+    """Title parsing and validation: first-word make plus term regex vs. the catalog tries, cold and cached"""
+    from catalog import Catalog
+    from extraction import keyword_pattern
+    from records import title_model
+
+    titles = [row['Car Model'] for row in load_sample_rows(args.data)]
+    titles = [titles[i % len(titles)] for i in range(args.listings)]
+    terms_re = re.compile(keyword_pattern(_LEGACY_CAR_TERMS))
+
+    def legacy():
+        for title in titles:
+            words = title.split()
+            yield words[0].title() if words else None, title_model(title), bool(terms_re.search(title.lower()))
+
+    catalog = Catalog()
+
+    def cold():
+        for title in titles:
+            catalog._parsed.clear()
+            parts = catalog.parse(title)
+            yield parts.make, parts.full_variant, parts.known > 0
+
+    def cached():
+        catalog._parsed.clear()
+        for title in titles:
+            parts = catalog.parse(title)
+            yield parts.make, parts.full_variant, parts.known > 0
+
+    print(f"Catalog benchmark: {args.listings} titles ({len(set(titles))} distinct), "
+          f"{len(catalog.makes)} makes in the catalog")
+    print(f"{'method':>24} {'secs':>7} {'titles/sec':>11} {'recognized':>11}")
+    for name, run in (('first word + term regex', legacy), ('catalog, uncached', cold),
+                      ('catalog, cached', cached)):
+        start = time.perf_counter()
+        results = list(run())
+        elapsed = time.perf_counter() - start
+        recognized = sum(known for _, _, known in results) / len(results)
+        print(f"{name:>24} {elapsed:>7.3f} {len(results) / elapsed:>11.0f} {recognized:>11.1%}")
+
+
+def _percentile(values: List[float], q: float) -> Optional[float]:
+    """Nearest-rank percentile, q between 0 and 1"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(q * len(ordered)) - 1)]
+
+
+def _suite_worker(pages: List[bytes], scenario: Dict, concurrency: int, parse_workers: int, repeat: int,
+                  results):
+    """Runs one scenario in a fresh process so the peak RSS is that scenario's own"""
+    from pakwheels_scraper import PakWheelsScraper
+
+    logging.disable(logging.WARNING)
+    latencies = []
+    failures = []
+    retries = listings = 0
+    elapsed = 0.0
+    with StubServer(pages, **scenario) as server:
+        for _ in range(repeat):
+            scraper = PakWheelsScraper(concurrency=concurrency, rate_limit=0, cache_mode='off',
+                                       parse_workers=parse_workers)
+            download = scraper.download
+
+            def timed_download(url, consume, timings=None, download=download):
+                # Page latency as the scraper sees it: retries, backoff and a streamed parse included
+                start = time.perf_counter()
+                result = download(url, consume, timings)
+                latencies.append(time.perf_counter() - start)
+                if result is None:
+                    failures.append(url)
+                return result
+
+            scraper.download = timed_download
+            start = time.perf_counter()
+            listings += sum(1 for _ in scraper.scrape_multiple_pages(len(pages), server.url))
+            elapsed += time.perf_counter() - start
+            retries += sum(stats['retries'] for stats in scraper.rate_limiter.metrics().values())
+            scraper.transport.close()
+        faults = dict(server.faults)
+
+    results.put({
+        'pages': len(latencies) // repeat,
+        'listings': listings // repeat,
+        'seconds': round(elapsed / repeat, 3),
+        'pages_per_sec': round(len(latencies) / elapsed, 2),
+        'listings_per_sec': round(listings / elapsed, 1),
+        'latency_p50_ms': round(_percentile(latencies, 0.5) * 1000, 1),
+        'latency_p95_ms': round(_percentile(latencies, 0.95) * 1000, 1),
+        'failed_pages': round(len(failures) / repeat, 1),
+        'retries': round(retries / repeat, 1),
+        'server_faults': {str(key): round(value / repeat, 1) for key, value in faults.items()},
+        'peak_rss_mib': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    })
+
+
+def _git_commit() -> Optional[str]:
+    """Short hash of the checked out commit, marked -dirty if tracked files have changed"""
+    cwd = os.path.dirname(os.path.abspath(__file__))
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=cwd, capture_output=True,
+                                text=True, check=True).stdout.strip()
+        changes = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=cwd,
+                                 capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return f"{commit}-dirty" if changes else commit
+
+
+def compare_results(baseline: Dict, current: Dict, tolerance: float) -> int:
+    """Print how each scenario's metrics moved since `baseline` and return how
+    many got worse by more than `tolerance` (a fraction)"""
+    print(f"\nCompared with {baseline.get('commit') or 'baseline'} ({baseline.get('created', '?')}), "
+          f"tolerance {tolerance:.0%}")
+    print(f"{'scenario':>8} {'metric':>17} {'baseline':>10} {'current':>10} {'change':>8}")
+    regressions = 0
+    for name, result in current['scenarios'].items():
+        before = baseline.get('scenarios', {}).get(name)
+        if not before:
+            continue
+        for metric, higher_is_better in SUITE_METRICS.items():
+            old, new = before.get(metric), result.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            worse = -change if higher_is_better else change
+            flag = ''
+            if worse > tolerance:
+                regressions += 1
+                flag = '  REGRESSION'
+            print(f"{name:>8} {metric:>17} {old:>10g} {new:>10g} {change:>+8.1%}{flag}")
+    return regressions
+
+
+def bench_suite(args):
+    """End-to-end scrape_multiple_pages over the recorded fixtures under each server scenario:
+    pages/sec, listings/sec, p50/p95 page latency and peak RSS, saved as JSON"""
+    unknown = [name for name in args.scenarios if name not in SCENARIOS]
+    if unknown:
+        raise SystemExit(f"Unknown scenario {', '.join(unknown)}; choose from {', '.join(SCENARIOS)}")
+    pages = load_fixture_pages(args)
+    if not pages:
+        raise SystemExit(f"No fixture pages in {args.fixtures}; save some with `benchmark.py record`")
+
+    print(f"Benchmark suite: {len(pages)} pages from {args.fixtures}, {args.concurrency} fetch threads, "
+          f"{args.parse_workers} parse workers, x{args.repeat}")
+    print(f"{'scenario':>8} {'seconds':>9} {'pages/sec':>10} {'listings/sec':>13} {'p50 ms':>8} {'p95 ms':>8} "
+          f"{'retries':>8} {'peak RSS MiB':>13}")
+
+    ctx = multiprocessing.get_context('spawn')
+    scenarios = {}
+    for name in args.scenarios:
+        results = ctx.Queue()
+        worker = ctx.Process(target=_suite_worker, args=(pages, SCENARIOS[name], args.concurrency,
+                                                         args.parse_workers, args.repeat, results))
+        worker.start()
+        result = scenarios[name] = dict(results.get(), **SCENARIOS[name])
+        worker.join()
+        print(f"{name:>8} {result['seconds']:>9.2f} {result['pages_per_sec']:>10.1f} "
+              f"{result['listings_per_sec']:>13.0f} {result['latency_p50_ms']:>8.1f} "
+              f"{result['latency_p95_ms']:>8.1f} {result['retries']:>8g} {result['peak_rss_mib']:>13.1f}")
+
+    report = {
+        'commit': _git_commit(),
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'fixtures': len(pages),
+        'concurrency': args.concurrency,
+        'parse_workers': args.parse_workers,
+        'repeat': args.repeat,
+        'scenarios': scenarios,
+    }
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"Results saved to {args.output}")
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare_results(baseline, report, args.tolerance)
+        if regressions:
+            raise SystemExit(f"{regressions} metric(s) regressed by more than {args.tolerance:.0%}")
+
+
+def bench_record(args):
+    """Save search result pages as suite fixtures, live from --url or synthetic from the CSV"""
+    if args.url:
+        from pakwheels_scraper import PakWheelsScraper
+
+        logging.disable(logging.NOTSET)
+        scraper = PakWheelsScraper(concurrency=1, cache_mode='off')
+        pages = []
+        for page_num in range(1, args.pages + 1):
+            content = scraper.fetch_page(scraper.page_url(page_num, args.url))
+            if content is None:
+                break
+            pages.append(content)
+    else:
+        pages = build_fixture_pages(load_sample_rows(args.data), args.pages)
+
+    os.makedirs(args.out, exist_ok=True)
+    for page_num, content in enumerate(pages, 1):
+        with open(os.path.join(args.out, f"page-{page_num:03d}.html"), 'wb') as f:
+            f.write(content)
+    print(f"Saved {len(pages)} pages to {args.out}")
+
+
+class _SlowFileHandler(logging.FileHandler):
+    """File handler whose writes take at least `delay` seconds, like a busy disk"""
+
+    def __init__(self, filename: str, delay: float):
+        super().__init__(filename, encoding='utf-8')
+        self.write_delay = delay
+
+    def emit(self, record):
+        super().emit(record)
+        if self.write_delay:
+            time.sleep(self.write_delay)
+
+
+def _log_calls(logger: logging.Logger, threads: int, messages: int) -> List[float]:
+    """Seconds each logger.info call took on the thread making it"""
+    timings = [[] for _ in range(threads)]
+
+    def work(index):
+        times = timings[index]
+        for i in range(messages):
+            start = time.perf_counter()
+            logger.info(f"Extracted car {i + 1}: Toyota Corolla 2015 for sale in Lahore")
+            times.append(time.perf_counter() - start)
+
+    workers = [threading.Thread(target=work, args=(index,)) for index in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return [seconds for times in timings for seconds in times]
+
+
+def bench_logging(args):
+    """Time a logging call costs the thread making it: file and console handlers
+    called directly vs. the queue and log thread of logs.py"""
+    import queue
+    from logging.handlers import QueueListener
+    from logs import ChannelQueueHandler, ChannelRouter, LOG_FORMAT
+
+    print(f"Logging benchmark: {args.threads} threads x {args.messages} messages, "
+          f"{args.write_latency * 1000:.2f} ms added per file write")
+    print(f"{'handlers':>10} {'seconds':>9} {'calls/sec':>10} {'p50 us':>8} {'p99 us':>8} {'max ms':>8} "
+          f"{'drain s':>8}")
+
+    log_dir = tempfile.mkdtemp(prefix='log-bench-')
+    devnull = open(os.devnull, 'w')
+    try:
+        for mode in ('direct', 'queued'):
+            logger = logging.getLogger(f'log-bench-{mode}')
+            logger.propagate = False
+            logger.setLevel(logging.INFO)
+            handlers = [_SlowFileHandler(os.path.join(log_dir, f'{mode}.log'), args.write_latency),
+                        logging.StreamHandler(devnull)]
+            for handler in handlers:
+                handler.setFormatter(logging.Formatter(LOG_FORMAT))
+            listener = None
+            if mode == 'direct':
+                for handler in handlers:
+                    logger.addHandler(handler)
+            else:
+                router = ChannelRouter()
+                router.channels['scraper'].extend(handlers)
+                log_queue = queue.SimpleQueue()
+                logger.addHandler(ChannelQueueHandler(log_queue, 'scraper'))
+                listener = QueueListener(log_queue, router)
+                listener.start()
+
+            logging.disable(logging.NOTSET)
+            start = time.perf_counter()
+            calls = _log_calls(logger, args.threads, args.messages)
+            elapsed = time.perf_counter() - start
+            drain_start = time.perf_counter()
+            if listener:
+                listener.stop()
+            drain = time.perf_counter() - drain_start
+            logging.disable(logging.WARNING)
+            for handler in handlers:
+                handler.close()
+
+            print(f"{mode:>10} {elapsed:>9.2f} {len(calls) / elapsed:>10.0f} "
+                  f"{_percentile(calls, 0.5) * 1e6:>8.1f} {_percentile(calls, 0.99) * 1e6:>8.1f} "
+                  f"{max(calls) * 1000:>8.2f} {drain:>8.2f}")
+    finally:
+        devnull.close()
+        shutil.rmtree(log_dir, ignore_errors=True)
+
+
+def _str_list(value: str) -> List[str]:
+    return [part for part in value.split(',') if part]
+
+
+def _int_list(value: str) -> List[int]:
+    return [int(part) for part in value.split(',') if part]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="PakWheels scraper benchmarks")
+    parser.add_argument('--data', default=OUTPUT_FILE, help="CSV of scraped rows used to build fixtures")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    fetch = subparsers.add_parser('fetch', help=bench_fetch.__doc__)
+    fetch.add_argument('--pages', type=int, default=40)
+    fetch.add_argument('--latency', type=float, default=0.2, help="seconds the stub server waits per request")
+    fetch.add_argument('--concurrency', type=_int_list, default=[1, 2, 4, 8])
+    fetch.add_argument('--rate-limit', type=float, default=0, help="requests/sec, 0 disables the limit")
+    fetch.set_defaults(func=bench_fetch)
+
+    transport = subparsers.add_parser('transport', help=bench_transport.__doc__)
+    transport.add_argument('--pages', type=int, default=40, help="synthetic pages to build when --fixtures isn't given")
+    transport.add_argument('--fixtures', help="directory of saved search result .html pages")
+    transport.add_argument('--transports', type=_str_list, default=['requests', 'httpx'])
+    transport.add_argument('--latency', type=float, default=0.05, help="seconds the stub server waits per request")
+    transport.add_argument('--bandwidth', type=float, default=256 * 1024,
+                           help="bytes/sec each response is sent at, 0 for unlimited")
+    transport.add_argument('--concurrency', type=int, default=4)
+    transport.set_defaults(func=bench_transport)
+
+    parse = subparsers.add_parser('parse', help=bench_parse.__doc__)
+    parse.add_argument('--pages', type=int, default=40, help="synthetic pages to build when --fixtures isn't given")
+    parse.add_argument('--fixtures', help="directory of saved search result .html pages")
+    parse.add_argument('--backends', type=_str_list, default=['bs4', 'lxml', 'jsonld'])
+    parse.add_argument('--repeat', type=int, default=3)
+    parse.set_defaults(func=bench_parse)
+
+    extract = subparsers.add_parser('extract', help=bench_extract.__doc__)
+    extract.add_argument('--vocab-sizes', type=_int_list, default=[0, 100, 1000],
+                         help="extra city/color words added to the vocabularies")
+    extract.add_argument('--repeat', type=int, default=3)
+    extract.set_defaults(func=bench_extract)
+
+    pipeline = subparsers.add_parser('pipeline', help=bench_pipeline.__doc__)
+    pipeline.add_argument('--pages', type=int, default=80, help="synthetic pages to build when --fixtures isn't given")
+    pipeline.add_argument('--fixtures', help="directory of saved search result .html pages")
+    pipeline.add_argument('--latency', type=float, default=0.02)
+    pipeline.add_argument('--concurrency', type=int, default=8)
+    pipeline.add_argument('--backend', default='bs4', help="parser backend; bs4 is the most CPU-heavy")
+    pipeline.add_argument('--workers', type=_int_list, default=[0, 2, 4])
+    pipeline.set_defaults(func=bench_pipeline)
+
+    enrich = subparsers.add_parser('enrich', help=bench_enrich.__doc__)
+    enrich.add_argument('--pages', type=int, default=8)
+    enrich.add_argument('--latency', type=float, default=0.05)
+    enrich.add_argument('--workers', type=int, default=4, help="detail pages in flight at once")
+    enrich.add_argument('--modes', type=_str_list, default=['missing', 'all'])
+    enrich.set_defaults(func=bench_enrich)
+
+    retry = subparsers.add_parser('retry', help=bench_retry.__doc__)
+    retry.add_argument('--pages', type=int, default=30)
+    retry.add_argument('--latency', type=float, default=0.02)
+    retry.add_argument('--concurrency', type=int, default=4)
+    retry.add_argument('--capacity', type=float, default=5, help="requests/sec the stub serves before answering 429")
+    retry.add_argument('--error-rate', type=float, default=0.05, help="fraction of requests answered 503")
+    retry.add_argument('--retry-after', type=int, default=None, help="Retry-After seconds sent with 429/503")
+    retry.add_argument('--rate', type=float, default=20, help="fixed rate, and the adaptive ceiling")
+    retry.add_argument('--start-rate', type=float, default=2, help="adaptive starting rate")
+    retry.set_defaults(func=bench_retry)
+
+    normalize = subparsers.add_parser('normalize', help=bench_normalize.__doc__)
+    normalize.add_argument('--repeat', type=int, default=5)
+    normalize.set_defaults(func=bench_normalize)
+
+    memory = subparsers.add_parser('memory', help=bench_memory.__doc__)
+    memory.add_argument('--listings', type=int, default=100_000)
+    memory.set_defaults(func=bench_memory)
+
+    analytics = subparsers.add_parser('analytics', help=bench_analytics.__doc__)
+    analytics.add_argument('--listings', type=int, default=1_000_000)
+    analytics.add_argument('--top', type=int, default=20)
+    analytics.set_defaults(func=bench_analytics)
+
+    export = subparsers.add_parser('export', help=bench_export.__doc__)
+    export.add_argument('--listings', type=int, default=200_000)
+    export.add_argument('--formats', type=_str_list, default=['csv', 'jsonl.gz', 'arrow', 'parquet'])
+    export.set_defaults(func=bench_export)
+
+    catalog = subparsers.add_parser('catalog', help=bench_catalog.__doc__)
+    catalog.add_argument('--listings', type=int, default=200_000)
+    catalog.set_defaults(func=bench_catalog)
+
+    log_bench = subparsers.add_parser('logging', help=bench_logging.__doc__)
+    log_bench.add_argument('--threads', type=int, default=4)
+    log_bench.add_argument('--messages', type=int, default=20000, help="log calls per thread")
+    log_bench.add_argument('--write-latency', type=float, default=0.0,
+                           help="seconds added to every file write, to mimic a slow disk")
+    log_bench.set_defaults(func=bench_logging)
+
+    suite = subparsers.add_parser('suite', help=bench_suite.__doc__)
+    suite.add_argument('--fixtures', default=FIXTURES_DIR, help="directory of saved search result .html pages")
+    suite.add_argument('--scenarios', type=_str_list, default=list(SCENARIOS),
+                       help=f"comma separated, from {', '.join(SCENARIOS)}")
+    suite.add_argument('--concurrency', type=int, default=4)
+    suite.add_argument('--parse-workers', type=int, default=0)
+    suite.add_argument('--repeat', type=int, default=3)
+    suite.add_argument('--output', help="save the results as JSON")
+    suite.add_argument('--compare', help="JSON results of an earlier run to check for regressions against")
+    suite.add_argument('--tolerance', type=float, default=0.1,
+                       help="fraction a metric may get worse by before it counts as a regression")
+    suite.set_defaults(func=bench_suite)
+
+    record = subparsers.add_parser('record', help=bench_record.__doc__)
+    record.add_argument('--url', help="search URL to save pages of; without it pages are built from --data")
+    record.add_argument('--pages', type=int, default=10)
+    record.add_argument('--out', default=FIXTURES_DIR)
+    record.set_defaults(func=bench_record)
+
+    args = parser.parse_args()
+    # Per-listing log lines would dominate the timings
+    logging.disable(logging.WARNING)
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,393 @@
+"""
+Catalog of car makes, models and variants for reading listing titles
+
+A title like "Toyota Corolla Axio 2017 for sale in Islamabad" is parsed into
+make, model, variant, model year and city in one pass over its words. Makes,
+models and variants are held in word tries, and each step takes the longest
+name the catalog knows: "Corolla Cross" is a model of its own, while
+"Corolla Axio" is a Corolla. Models are also indexed without their make, for
+titles that leave it out.
+
+The catalog starts from CAR_CATALOG in config.py and is held in memory, so
+parsing a title never touches a file. The scraper grows it from what it
+scrapes: a make, model or variant it doesn't know is counted in CATALOG_FILE
+every time a listing shows it, and is added once CATALOG_LEARN_MIN_SIGHTINGS
+listings have. The counts persist, so a scraper starts from everything
+earlier runs learned.
+
+Usage:
+    python catalog.py parse "Toyota Corolla Axio 2017 for sale in Islamabad"
+    python catalog.py learn pakwheels_cars_data.csv
+    python catalog.py list [--make toyota]
+"""
+
+import argparse
+import sqlite3
+import threading
+import time
+from collections import Counter
+from typing import Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+from config import CAR_CATALOG, CATALOG_FILE, CATALOG_LEARN_MIN_SIGHTINGS
+
+# Parsed titles kept before the cache is emptied; titles repeat a lot
+PARSE_CACHE_SIZE = 65536
+
+# Trie node key holding the value of the name ending there; words are never empty
+_VALUE = ''
+
+# Alias index value for a model name more than one make uses
+_AMBIGUOUS = object()
+
+
+class TitleParts(NamedTuple):
+    """What a listing title says, e.g. Toyota / Corolla / Axio / 2017 / Islamabad"""
+    make: Optional[str] = None
+    model: Optional[str] = None
+    variant: Optional[str] = None
+    year: Optional[int] = None
+    city: Optional[str] = None
+    known: int = 0  # how many of make, model and variant (in that order) the catalog knew
+
+    @property
+    def depth(self) -> int:
+        """How many of make, model and variant the title has"""
+        return 3 if self.variant else 2 if self.model else 1 if self.make else 0
+
+    @property
+    def full_model(self) -> Optional[str]:
+        """Make and model, e.g. "Toyota Corolla" """
+        return f"{self.make} {self.model}" if self.make and self.model else self.make
+
+    @property
+    def full_variant(self) -> Optional[str]:
+        """Make, model and variant, e.g. "Toyota Corolla Axio" """
+        return f"{self.full_model} {self.variant}" if self.variant and self.model else self.full_model
+
+
+class WordTrie:
+    """Names matched word by word, case-insensitively, longest name first"""
+
+    def __init__(self):
+        self.root: Dict[str, dict] = {}
+        self.size = 0
+
+    def add(self, name: str, value) -> object:
+        """Store `value` under `name` unless the name is already there; returns the stored value"""
+        node = self.root
+        for word in name.lower().split():
+            node = node.setdefault(word, {})
+        if _VALUE not in node:
+            node[_VALUE] = value
+            self.size += 1
+        return node[_VALUE]
+
+    def replace(self, name: str, value):
+        node = self.root
+        for word in name.lower().split():
+            node = node.setdefault(word, {})
+        node[_VALUE] = value
+
+    def get(self, name: str):
+        node = self.root
+        for word in name.lower().split():
+            node = node.get(word)
+            if node is None:
+                return None
+        return node.get(_VALUE)
+
+    def longest(self, words: Sequence[str], start: int) -> Tuple[object, int]:
+        """Value of the longest name at words[start:] (already lowercased) and the
+        index just past it, or (None, start) if no name starts there"""
+        node, value, end = self.root, None, start
+        for i in range(start, len(words)):
+            node = node.get(words[i])
+            if node is None:
+                break
+            found = node.get(_VALUE)
+            if found is not None:
+                value, end = found, i + 1
+        return value, end
+
+    def __len__(self) -> int:
+        return self.size
+
+
+class CatalogModel:
+    """A model and the variants of it the catalog knows"""
+    __slots__ = ('make', 'name', 'variants')
+
+    def __init__(self, make: 'CatalogMake', name: str):
+        self.make = make
+        self.name = name
+        self.variants = WordTrie()
+
+
+class CatalogMake:
+    """A make and the models of it the catalog knows"""
+    __slots__ = ('name', 'models')
+
+    def __init__(self, name: str):
+        self.name = name
+        self.models = WordTrie()
+
+
+def _is_year(word: str) -> bool:
+    return len(word) == 4 and word.isdigit() and word[:2] in ('19', '20')
+
+
+class Catalog:
+    """Make/model/variant tries, seeded from CAR_CATALOG and held in memory.
+
+    A make wins over a model of the same name at the start of a title, so
+    "Tank 500" is the Tank make; Toyota's Tank only matches after "Toyota".
+    """
+
+    def __init__(self, seed: Dict[str, Dict[str, List[str]]] = CAR_CATALOG):
+        self.seed = seed
+        self.makes = WordTrie()
+        # Model name without its make -> model, for titles that leave the make out
+        self.models = WordTrie()
+        self._parsed: Dict[str, TitleParts] = {}
+        for make, models in seed.items():
+            self.add(make)
+            for model, variants in models.items():
+                self.add(make, model)
+                for variant in variants:
+                    self.add(make, model, variant)
+
+    def add(self, make: str, model: str = '', variant: str = ''):
+        """Put a make, model and variant into the tries (not the file)"""
+        entry = self.makes.add(make, CatalogMake(make))
+        if model:
+            model_entry = entry.models.add(model, CatalogModel(entry, model))
+            alias = self.models.get(model)
+            if alias is None:
+                # A bare number ("2008", "911") at the start of a title is more likely a year
+                if not model.replace(' ', '').isdigit():
+                    self.models.add(model, model_entry)
+            elif alias is not _AMBIGUOUS and alias.make is not entry:
+                self.models.replace(model, _AMBIGUOUS)
+            if variant:
+                model_entry.variants.add(variant, variant)
+        self._parsed.clear()
+
+    def parse(self, title: Optional[str]) -> TitleParts:
+        """Make, model, variant, model year and city of a listing title.
+
+        Words after the model up to the model year (or "for sale") are the
+        variant. A make or model the catalog doesn't know is taken from the
+        title as written: its first word, then the next.
+        """
+        if not title:
+            return TitleParts()
+        parts = self._parsed.get(title)
+        if parts is not None:
+            return parts
+
+        words = title.split()
+        lowered = title.lower().split()
+        count = len(words)
+        make = model = None
+        make_entry, position = self.makes.longest(lowered, 0)
+        if make_entry is not None:
+            make = make_entry.name
+            model_entry, position = make_entry.models.longest(lowered, position)
+        else:
+            model_entry, position = self.models.longest(lowered, 0)
+            if model_entry is _AMBIGUOUS:
+                # A model of more than one make, e.g. "Mira": the model is known, the make isn't
+                model_entry, model = None, ' '.join(words[:position])
+            elif model_entry is not None:
+                make = model_entry.make.name
+        if model_entry is not None:
+            model = model_entry.name
+        known = (make is not None) + (model is not None)
+
+        # The variant runs up to the model year or "for sale", whichever comes first
+        stop = position
+        while stop < count and not _is_year(lowered[stop]) and \
+                not (lowered[stop] == 'for' and stop + 1 < count and lowered[stop + 1] == 'sale'):
+            stop += 1
+        year = int(lowered[stop]) if stop < count and _is_year(lowered[stop]) else None
+        city = None
+        for i in range(stop, count - 2):
+            if lowered[i] == 'for' and lowered[i + 1] == 'sale' and lowered[i + 2] == 'in':
+                city = ' '.join(words[i + 3:]) or None
+                break
+
+        loose = words[position:stop]
+        if make is None and model is None and loose:
+            # Only the make is normalized; models and trims like "XLi" keep their case
+            make, loose = loose[0].title(), loose[1:]
+        if model is None and loose:
+            model, loose = loose[0], loose[1:]
+        variant = None
+        if loose:
+            variant = ' '.join(loose)
+            if model_entry is not None:
+                canonical, end = model_entry.variants.longest(lowered, position)
+                if canonical is not None and end == stop:
+                    variant = canonical
+                    known += 1
+
+        parts = TitleParts(make, model, variant, year, city, known)
+        if len(self._parsed) >= PARSE_CACHE_SIZE:
+            self._parsed.clear()
+        self._parsed[title] = parts
+        return parts
+
+    def recognizes(self, title: Optional[str]) -> bool:
+        """Whether the title names a make or model the catalog knows"""
+        return self.parse(title).known > 0
+
+
+
+class CatalogStore:
+    """CATALOG_FILE: every make, model and variant scraped titles have shown,
+    with how often. Opening it puts what earlier runs learned into `catalog`;
+    learn() counts new sightings and adds to `catalog` whatever has been seen
+    often enough.
+    """
+
+    def __init__(self, catalog: Catalog, path: str = CATALOG_FILE,
+                 min_sightings: int = CATALOG_LEARN_MIN_SIGHTINGS):
+        self.catalog = catalog
+        self.path = path
+        self.min_sightings = min_sightings
+        self._lock = threading.Lock()
+        # Threads learning at once share one connection; every use is under self._lock
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS catalog (
+                make TEXT NOT NULL COLLATE NOCASE,
+                model TEXT NOT NULL COLLATE NOCASE,
+                variant TEXT NOT NULL COLLATE NOCASE,
+                source TEXT NOT NULL,
+                sightings INTEGER NOT NULL,
+                first_seen REAL NOT NULL,
+                last_seen REAL NOT NULL,
+                PRIMARY KEY (make, model, variant)
+            )
+        """)
+        now = time.time()
+        self.conn.executemany(
+            "INSERT OR IGNORE INTO catalog VALUES (?, ?, ?, 'seed', 0, ?, ?)",
+            [(make, model, variant, now, now)
+             for make, models in catalog.seed.items()
+             for model, variants in (models.items() or [('', [])])
+             for variant in [''] + list(variants)]
+        )
+        self.conn.commit()
+        for make, model, variant in self.conn.execute(
+                "SELECT make, model, variant FROM catalog WHERE source = 'learned' AND sightings >= ? "
+                "ORDER BY first_seen", (min_sightings,)):
+            catalog.add(make, model, variant)
+
+    def learn(self, titles: Iterable[str]) -> int:
+        """Count the makes, models and variants in these titles that the catalog
+        doesn't know, adding each once it's been seen often enough. Returns how
+        many were added."""
+        sightings = Counter()
+        for title in titles:
+            parts = self.catalog.parse(title)
+            if parts.make and parts.known < parts.depth:
+                sightings[(parts.make, parts.model or '', parts.variant or '')] += 1
+        if not sightings:
+            return 0
+
+        now = time.time()
+        learned = []
+        with self._lock:
+            self.conn.executemany("""
+                INSERT INTO catalog VALUES (?, ?, ?, 'learned', ?, ?, ?)
+                ON CONFLICT (make, model, variant) DO UPDATE SET
+                    sightings = sightings + excluded.sightings,
+                    last_seen = excluded.last_seen
+            """, [(make, model, variant, count, now, now) for (make, model, variant), count in sightings.items()])
+            self.conn.commit()
+            for key in sightings:
+                row = self.conn.execute(
+                    "SELECT make, model, variant, sightings FROM catalog WHERE make = ? AND model = ? AND variant = ?",
+                    key
+                ).fetchone()
+                if row[3] >= self.min_sightings:
+                    self.catalog.add(*row[:3])
+                    learned.append(' '.join(filter(None, row[:3])))
+        return len(learned)
+
+    def entries(self, make: Optional[str] = None) -> List[Tuple[str, str, str, str, int]]:
+        """(make, model, variant, source, sightings) of every row in the file, learned or not"""
+        query = "SELECT make, model, variant, source, sightings FROM catalog"
+        params = ()
+        if make:
+            query += " WHERE make = ?"
+            params = (make,)
+        with self._lock:
+            return self.conn.execute(query + " ORDER BY make, model, variant", params).fetchall()
+
+    def close(self):
+        self.conn.close()
+
+
+_default: Optional[Catalog] = None
+_store: Optional[CatalogStore] = None
+_default_lock = threading.Lock()
+
+
+def default_catalog() -> Catalog:
+    """This process's catalog, built from CAR_CATALOG the first time it's asked for"""
+    global _default
+    if _default is None:
+        with _default_lock:
+            if _default is None:
+                _default = Catalog()
+    return _default
+
+
+def catalog_store() -> CatalogStore:
+    """CATALOG_FILE, opened over the default catalog the first time something learns"""
+    global _store
+    if _store is None:
+        catalog = default_catalog()
+        with _default_lock:
+            if _store is None:
+                _store = CatalogStore(catalog)
+    return _store
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Parse listing titles with the make/model/variant catalog")
+    parser.add_argument('--catalog', default=CATALOG_FILE, help=f"catalog file (default {CATALOG_FILE})")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    parse = subparsers.add_parser('parse', help="print the parts of each title")
+    parse.add_argument('titles', nargs='+')
+    learn = subparsers.add_parser('learn', help="learn from the titles in scraped CSVs")
+    learn.add_argument('files', nargs='+')
+    listing = subparsers.add_parser('list', help="print what the catalog holds")
+    listing.add_argument('--make')
+    args = parser.parse_args()
+
+    catalog = Catalog()
+    store = CatalogStore(catalog, args.catalog)
+    try:
+        if args.command == 'parse':
+            for title in args.titles:
+                parts = catalog.parse(title)
+                print(f"{title}: " + ', '.join(f"{field}={value}" for field, value in parts._asdict().items()))
+        elif args.command == 'learn':
+            from storage import read_csv_rows
+            for filename in args.files:
+                learned = store.learn(row['Car Model'] for row in read_csv_rows(filename))
+                print(f"{filename}: {learned} makes, models and variants learned")
+        else:
+            for make, model, variant, source, sightings in store.entries(args.make):
+                name = ' '.join(filter(None, (make, model, variant)))
+                status = source if source == 'seed' or sightings >= store.min_sightings else 'candidate'
+                print(f"{name:<40} {status:<10} {sightings:>6}")
+    finally:
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+Resumable scrape checkpoints
+
+Records, per search URL, the last page whose rows made it to disk and where
+those rows were written, so a restarted run of the same URL can pick up at
+the first missing page instead of starting again from page 1.
+"""
+
+import os
+import sqlite3
+import time
+from typing import NamedTuple, Optional
+
+from config import CHECKPOINT_FILE
+
+
+class Checkpoint(NamedTuple):
+    """Progress of an unfinished run"""
+    base_url: str
+    last_page: int
+    output_file: str
+    offset: int  # bytes of output_file that belong to pages 1..last_page
+    row_count: int
+
+
+def checkpoint_key(base_url: str) -> str:
+    """Normalize a search URL so trailing-slash variants share a checkpoint"""
+    return base_url.strip().rstrip('/')
+
+
+class CheckpointStore:
+    """SQLite journal of completed pages, one row per search URL"""
+
+    def __init__(self, path: str = CHECKPOINT_FILE):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS checkpoints (
+                base_url TEXT PRIMARY KEY,
+                last_page INTEGER NOT NULL,
+                output_file TEXT NOT NULL,
+                offset INTEGER NOT NULL,
+                row_count INTEGER NOT NULL,
+                updated_at REAL NOT NULL
+            )
+        """)
+        self.conn.commit()
+
+    def get(self, base_url: str) -> Optional[Checkpoint]:
+        """Checkpoint for a URL, if its partial output is still intact"""
+        row = self.conn.execute(
+            "SELECT base_url, last_page, output_file, offset, row_count FROM checkpoints WHERE base_url = ?",
+            (checkpoint_key(base_url),)
+        ).fetchone()
+        if not row:
+            return None
+
+        checkpoint = Checkpoint(*row)
+        if not os.path.exists(checkpoint.output_file) or os.path.getsize(checkpoint.output_file) < checkpoint.offset:
+            self.clear(base_url)
+            return None
+        return checkpoint
+
+    def record(self, base_url: str, page_num: int, output_file: str, offset: int, row_count: int):
+        """Mark pages up to page_num as safely written"""
+        self.conn.execute(
+            "INSERT OR REPLACE INTO checkpoints VALUES (?, ?, ?, ?, ?, ?)",
+            (checkpoint_key(base_url), page_num, output_file, offset, row_count, time.time())
+        )
+        self.conn.commit()
+
+    def clear(self, base_url: str):
+        self.conn.execute("DELETE FROM checkpoints WHERE base_url = ?", (checkpoint_key(base_url),))
+        self.conn.commit()
+
+    def clear_output(self, output_file: str):
+        """Forget every run whose partial output is about to be overwritten"""
+        self.conn.execute("DELETE FROM checkpoints WHERE output_file = ?", (output_file,))
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
@@ -9,9 +9,85 @@ BASE_URL = os.getenv("PAKWHEELS_URL", "https://www.pakwheels.com/used-cars/searc
 
 # Scraping configuration
 MAX_PAGES = 10
-REQUEST_DELAY = 2  # seconds between requests
 TIMEOUT = 30  # request timeout in seconds
 
+# Concurrency and rate limiting
+CONCURRENT_REQUESTS = int(os.getenv("PAKWHEELS_CONCURRENCY", "4"))  # pages in flight at once
+RATE_LIMIT = float(os.getenv("PAKWHEELS_RATE_LIMIT", "2"))  # starting requests per second per host, 0 = unlimited
+RATE_LIMIT_BURST = 4  # requests allowed back to back before the rate limit applies
+
+# Adaptive (AIMD) pacing: every clean response adds RATE_INCREASE req/s up to
+# RATE_LIMIT_MAX, every 429/503 multiplies the rate by RATE_DECREASE down to RATE_LIMIT_MIN
+ADAPTIVE_RATE_LIMIT = os.getenv("PAKWHEELS_ADAPTIVE_RATE", "1") != "0"
+RATE_LIMIT_MIN = 0.2
+RATE_LIMIT_MAX = float(os.getenv("PAKWHEELS_RATE_LIMIT_MAX", "6"))
+RATE_INCREASE = 0.2
+RATE_DECREASE = 0.5
+
+# Retries for 429, 5xx, connection errors and timeouts
+MAX_RETRIES = 3
+RETRY_BACKOFF = 1.0  # seconds; attempt n waits a random time up to RETRY_BACKOFF * 2**n
+RETRY_BACKOFF_MAX = 60  # longest single wait; a longer Retry-After gives up on the request
+
+# Detail-page enrichment: "off", "missing" (rows with N/A fields) or "all" rows
+ENRICH_DETAILS = os.getenv("PAKWHEELS_ENRICH", "off")
+ENRICH_CONCURRENCY = 4  # detail pages in flight at once, within the same rate limit
+
+# Web dashboard jobs run at the same time; the rest wait in the queue.
+# All jobs share one rate limit per host.
+JOB_WORKERS = int(os.getenv("PAKWHEELS_JOB_WORKERS", "2"))
+JOB_HISTORY = 50  # finished jobs kept for /jobs before the oldest are dropped
+
+# Parser processes; 0 parses on the fetch threads, more moves parsing off them
+PARSE_WORKERS = int(os.getenv("PAKWHEELS_PARSE_WORKERS", "0"))
+
+# HTTP response cache: "off" (default), "on" or "replay" (serve only from the
+# cache, no network). Opt in with PAKWHEELS_CACHE or the scraper's --cache flag.
+HTTP_CACHE_MODE = os.getenv("PAKWHEELS_CACHE", "off")
+HTTP_CACHE_TTL = 15 * 60  # seconds before a cached page is revalidated
+HTTP_CACHE_MAX_BYTES = 200 * 1024 * 1024  # compressed bytes kept before evicting
+
+# HTTP client for page downloads: "requests" (default) or "httpx", which
+# multiplexes requests over HTTP/2 when the h2 package is installed. Either
+# accepts brotli/zstd responses when it has a decoder for them installed.
+HTTP_TRANSPORT = os.getenv("PAKWHEELS_TRANSPORT", "requests")
+HTTP2 = os.getenv("PAKWHEELS_HTTP2", "1") != "0"
+HTTP_POOL_SIZE = int(os.getenv("PAKWHEELS_POOL_SIZE", "0"))  # connections per host; 0 = pages + detail pages in flight
+HTTP_KEEPALIVE_EXPIRY = 30.0  # seconds an idle httpx connection is kept open
+STREAM_CHUNK_SIZE = 16 * 1024  # bytes of a page body handed to the parser at a time
+
+# HTML parsing backend: "lxml" (default), "jsonld" (raw JSON-LD scan) or "bs4"
+PARSER_BACKEND = os.getenv("PAKWHEELS_PARSER", "lxml")
+
+# Sharded crawls (crawl.py). A PakWheels search serves at most SEARCH_MAX_PAGES
+# pages; deeper shards are split by model year, then price, within these bounds.
+SEARCH_URL = "https://www.pakwheels.com/used-cars/search/-/"
+SEARCH_MAX_PAGES = int(os.getenv("PAKWHEELS_SEARCH_MAX_PAGES", "50"))
+SHARD_WORKERS = int(os.getenv("PAKWHEELS_SHARD_WORKERS", "2"))  # shards crawled at once, sharing the rate limit
+YEAR_RANGE = (1950, 2026)
+PRICE_RANGE = (0, 1_000_000_000)
+
+# Logging (logs.py). The scraper and the web server's per-request lines go to
+# separate files, each with its own level. Files rotate by size ("size") or at
+# LOG_ROTATE_WHEN ("time"); rotated files are gzipped and only LOG_BACKUP_COUNT kept.
+LOG_FILE = "scraper.log"
+ACCESS_LOG_FILE = "access.log"
+LOG_LEVEL = os.getenv("PAKWHEELS_LOG_LEVEL", "INFO")
+ACCESS_LOG_LEVEL = os.getenv("PAKWHEELS_ACCESS_LOG_LEVEL", "INFO")
+LOG_ROTATE = os.getenv("PAKWHEELS_LOG_ROTATE", "size")
+LOG_MAX_BYTES = 10 * 1024 * 1024
+LOG_ROTATE_WHEN = "midnight"
+LOG_BACKUP_COUNT = 5
+
+# Only every Nth listing's extraction is logged (at DEBUG); the rest are just counted in the metrics
+LOG_SAMPLE_EVERY = int(os.getenv("PAKWHEELS_LOG_SAMPLE_EVERY", "25"))
+
+# Upper bounds, in seconds, of the pipeline stage timing histogram buckets
+METRICS_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+# Where `pakwheels_scraper.py --profile cprofile` writes its cProfile stats
+PROFILE_FILE = "scrape.prof"
+
 # User agent to mimic a real browser
 USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
 
@@ -25,9 +101,149 @@ HEADERS = {
     'Upgrade-Insecure-Requests': '1',
 }
 
+# Vocabularies used to pick out the registration city and color of a listing.
+# Point PAKWHEELS_VOCABULARY at a JSON file with "cities", "colors" and/or
+# "color_context" keys to extend them without editing this file.
+VOCABULARY_FILE = os.getenv("PAKWHEELS_VOCABULARY")
+
+CITIES = [
+    'islamabad', 'karachi', 'lahore', 'rawalpindi', 'faisalabad',
+    'multan', 'peshawar', 'quetta', 'sialkot', 'gujranwala', 'hyderabad',
+]
+
+# Canonical color -> words (English and Urdu) that mean it
+COLORS = {
+    'white': ['white', 'safed'], 'black': ['black', 'kala'],
+    'silver': ['silver', 'chandi'], 'grey': ['grey', 'gray', 'slaiti'],
+    'red': ['red', 'lal', 'maroon'], 'blue': ['blue', 'neela', 'navy'],
+    'green': ['green', 'hara'], 'yellow': ['yellow', 'peela'],
+    'brown': ['brown', 'bhura'], 'gold': ['gold', 'sona'],
+    'beige': ['beige', 'cream'], 'pearl': ['pearl'],
+}
+
+# Words that show a piece of text is talking about the paint
+COLOR_CONTEXT = ['color', 'colour', 'rang', 'painted', 'finish']
+
 # Output configuration
 OUTPUT_FILE = "pakwheels_cars_data.csv"
 
+# SQLite database holding every listing scraped; /download exports from it
+DATABASE_FILE = os.path.join(os.path.dirname(OUTPUT_FILE), "pakwheels_cars.db")
+
+# Journal of completed pages used to resume interrupted runs
+CHECKPOINT_FILE = os.path.join(os.path.dirname(OUTPUT_FILE), "scrape_checkpoints.db")
+
+# Listing ID -> content hash of every listing seen, for incremental runs
+LISTING_INDEX_FILE = os.path.join(os.path.dirname(OUTPUT_FILE), "listing_index.db")
+
+# Compressed page cache used by HTTP_CACHE_MODE
+HTTP_CACHE_FILE = os.path.join(os.path.dirname(OUTPUT_FILE), "http_cache.db")
+
+# Fields taken from each listing's detail page, by listing ID
+DETAIL_CACHE_FILE = os.path.join(os.path.dirname(OUTPUT_FILE), "listing_details.db")
+
+# Known makes -> models -> variants, the starting point of the title catalog
+# (catalog.py). Makes, models and variants scraped titles show beyond these
+# are learned as they're seen. A make wins over a model of the same name at
+# the start of a title: "Tank 500" is the Tank make, "Toyota Tank" Toyota's.
+CAR_CATALOG = {
+    'Toyota': {
+        'Corolla': ['Axio', 'Fielder', 'Touring', 'Hatchback', 'Altis', 'Altis Grande', 'GLi', 'XLi'],
+        'Corolla Cross': ['HEV'], 'Yaris': ['Hatchback', 'Sedan', 'Cross', 'ATIV'],
+        'Prius': ['Alpha', 'PHV'], 'Pixis': ['Epoch', 'Joy', 'Space'], 'Alphard': ['Hybrid'],
+        'Land Cruiser': ['AX', 'VX', 'ZX'], 'Hilux': ['Revo', 'Vigo'], 'Camry': [], 'Prado': [],
+        'Fortuner': [], 'Vitz': [], 'Passo': [], 'Aqua': [], 'Raize': [], 'C-HR': [], 'Premio': [],
+        'Allion': [], 'Crown': [], 'Mark II': [], 'Mark X': [], 'Surf': [], 'Rush': [], 'Belta': [],
+        'Harrier': [], 'Hiace': [], 'Coaster': [], 'Rav4': [], 'Sienta': [], 'Estima': [],
+        'Fj Cruiser': [], '4 Runner': [], 'Town Ace': [], 'Platz': [], 'Corona': [], 'Cressida': [],
+        'Celica': [], 'Roomy': [], 'Tank': [], 'Noah': [], 'Voxy': [], 'Vellfire': [], 'Tundra': [],
+        'Probox': [], 'Succeed': [], 'IST': [], 'ISIS': [], 'Esquire': [], 'Starlet': [], 'Echo': [],
+        'Aygo': [], 'Celsior': [], 'Innova': [],
+    },
+    'Honda': {
+        'Civic': ['Oriel', 'RS', 'Turbo', 'VTi', 'EXi', 'Hybrid'], 'City': ['Aspire', 'IVTEC'],
+        'Accord': [], 'Vezel': [], 'BR-V': [], 'HR-V': [], 'Fit': [], 'Insight': [], 'N Wgn': [],
+        'N Box': [], 'N One': [], 'Life': [], 'Zest': [], 'Freed': [], 'Grace': [], 'Acty': [],
+    },
+    'Suzuki': {
+        'Alto': ['VXR', 'VXL', 'VX', 'Lapin'], 'Cultus': ['VXR', 'VXL'], 'Mehran': ['VX', 'VXR'],
+        'Swift': ['DLX', 'GLX'], 'Wagon R': ['VXR', 'VXL', 'Stingray'], 'Bolan': [], 'Ravi': [],
+        'Every': ['Wagon'], 'Jimny': ['Sierra'], 'Vitara': [], 'Baleno': [], 'Margalla': [],
+        'Khyber': [], 'Liana': [], 'APV': [], 'Ciaz': [], 'Hustler': [], 'Spacia': [], 'Carry': [],
+        'Cervo': [], 'Kei': [], 'MR Wagon': [], 'Mira': [],
+    },
+    'Daihatsu': {
+        'Mira': ['e:S', 'Cocoa'], 'Cuore': [], 'Move': ['Canbus'], 'Hijet': [], 'Charade': [],
+        'Terios': ['Kid'], 'Tanto': ['Custom'], 'Boon': [], 'Cast': [], 'Rocky': [], 'Taft': [],
+    },
+    'Nissan': {
+        'Sunny': [], 'Dayz': ['Highway Star'], 'Moco': [], 'Note': ['e-Power'], 'Juke': [],
+        'X Trail': [], 'Clipper': [], 'March': [], 'Roox': [], 'Otti': [], 'Kix': [], 'Leaf': [],
+        'Patrol': [], 'Skyline': [], 'Bluebird': [], 'AD Van': [], 'Wingroad': [],
+    },
+    'Mitsubishi': {
+        'Lancer': ['Evolution'], 'Pajero': ['Mini', 'Exceed', 'iO'], 'Ek Wagon': [], 'Ek Space': [],
+        'Mirage': [], 'Minica': [], 'Outlander': [], 'Galant': [], 'Delica': [],
+    },
+    'Hyundai': {
+        'Tucson': [], 'Elantra': [], 'Sonata': [], 'Santro': ['Club', 'Plus'], 'Shehzore': [],
+        'Porter': [], 'Santa Fe': [], 'Staria': [], 'Ioniq': [], 'Excel': [],
+    },
+    'KIA': {
+        'Sportage': ['Alpha', 'FWD', 'AWD'], 'Picanto': [], 'Sorento': [], 'Stonic': [],
+        'Carnival': [], 'Grand Carnival': [], 'Spectra': [], 'Classic': [], 'Pride': [], 'Sluger': [],
+    },
+    'Changan': {'Alsvin': [], 'Karvaan': [], 'Oshan X7': [], 'M9': [], 'Uni-T': []},
+    'MG': {'HS': ['Essence', 'PHEV'], 'ZS': ['EV'], 'MG4': [], 'GT': []},
+    'Haval': {'H6': ['HEV'], 'Jolion': [], 'H9': []},
+    'Proton': {'Saga': [], 'X70': []},
+    'FAW': {'V2': [], 'X-PV': [], 'Carrier': [], 'Sirius': []},
+    'DFSK': {'Glory 580': ['Pro'], 'Convoy': []},
+    'Prince': {'Pearl': [], 'K01': []},
+    'United': {'Bravo': [], 'Alpha': []},
+    'Chevrolet': {'Joy': [], 'Optra': [], 'Exclusive': [], 'Aveo': []},
+    'Mazda': {'Carol': [], 'RX8': [], 'Flair': [], 'Scrum': [], 'Axela': [], 'CX-5': []},
+    'Subaru': {'Impreza': [], 'Forester': [], 'Stella': [], 'Pleo': [], 'R2': []},
+    'Lexus': {'LX Series': [], 'RX Series': [], 'ES Series': [], 'NX Series': [], 'LS Series': []},
+    'Mercedes Benz': {'A Class': [], 'C Class': [], 'E Class': [], 'S Class': [], 'G Class': [],
+                      'GLA Class': [], 'GLC': [], 'GLE': [], 'CLA Class': [], 'SL Class': []},
+    'BMW': {'1 Series': [], '3 Series': [], '5 Series': [], '7 Series': [], 'X1': [], 'X3': [],
+            'X5': [], 'X6': [], 'X7': [], 'i8': [], 'iX': []},
+    'Audi': {'A3': [], 'A4': [], 'A5': [], 'A6': [], 'A8': [], 'Q2': [], 'Q3': [], 'Q5': [],
+             'Q7': [], 'Q8': [], 'e-tron': ['GT']},
+    'Land Rover': {'Range Rover': ['Sport', 'Evoque', 'Velar', 'Vogue'], 'Defender': [],
+                   'Discovery': ['Sport']},
+    'Porsche': {'Cayenne': [], 'Macan': [], 'Panamera': [], 'Taycan': [], '911': []},
+    'Volkswagen': {'Golf': [], 'Passat': [], 'Beetle': [], 'Touareg': []},
+    'Peugeot': {'2008': [], '3008': []},
+    'Isuzu': {'D-Max': [], 'Bighorn': []},
+    'BAIC': {'BJ40': []},
+    'Tank': {'500': []},
+    'GUGO': {'Gugo Van': []},
+}
+
+# Title catalog, with how often each make, model and variant it didn't know
+# has been seen; one is learned once CATALOG_LEARN_MIN_SIGHTINGS listings show it
+CATALOG_FILE = os.path.join(os.path.dirname(OUTPUT_FILE), "catalog.db")
+CATALOG_LEARN_MIN_SIGHTINGS = 3
+
+# Extra formats written next to OUTPUT_FILE during a scrape, comma separated,
+# from "jsonl.gz", "arrow" and "parquet" (the last two need pyarrow)
+EXPORT_FORMATS = [fmt.strip() for fmt in os.getenv("PAKWHEELS_EXPORTS", "").split(",") if fmt.strip()]
+EXPORT_BATCH_SIZE = 1000  # listings per chunk of a streamed /download
+PARQUET_ROW_GROUP_SIZE = 50_000  # listings buffered per Parquet row group
+
+# Distributed mode (distributed.py): page tasks shared through this SQLite
+# queue. A worker holds a page for TASK_LEASE_SECONDS before another worker
+# may take it over; a page failing TASK_MAX_ATTEMPTS times is given up.
+TASK_QUEUE_FILE = os.getenv("PAKWHEELS_TASK_QUEUE", os.path.join(os.path.dirname(OUTPUT_FILE), "task_queue.db"))
+TASK_LEASE_SECONDS = 120
+TASK_MAX_ATTEMPTS = 3
+WORKER_POLL_INTERVAL = 1.0  # seconds an idle worker waits before asking for work again
+
+# Directory holding each web dashboard job's CSV output, named <job id>.csv
+JOBS_DIR = os.path.join(os.path.dirname(OUTPUT_FILE), "jobs")
+
 # CSV column headers
 CSV_HEADERS = [
     'Car Model',
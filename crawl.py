@@ -0,0 +1,288 @@
+"""
+Sharded crawls of PakWheels across cities, makes, model years and prices
+
+A single search only paginates SEARCH_MAX_PAGES deep, so covering the whole
+market takes many narrower searches. The dimensions given (cities, makes,
+year bands, price bands) are expanded into shards, one search URL each.
+
+Each shard's first page is fetched to see how deep its results go. A shard
+deeper than SEARCH_MAX_PAGES is split in two by model year, or by price once
+it is down to a single year, and the halves are sized the same way; the rest
+are crawled to their last page, starting after the page already fetched. A
+shard whose first page has no pagination is crawled until it ends, and split
+after all if it is still going at SEARCH_MAX_PAGES. The bands never overlap,
+so no listing belongs to two shards. Listings from a shard that gets split
+are dropped, as its halves fetch them again.
+
+Shards are crawled in parallel, each on its own scraper, all sharing one
+HostRateLimiter. Listings are merged and deduplicated by listing ID, which
+catches the few that move between shards (e.g. a price change) mid-crawl.
+
+Usage:
+    python crawl.py --cities lahore,karachi --makes toyota,honda --years 2005-2014,2015-
+    python crawl.py --cities islamabad --dry-run
+"""
+
+import argparse
+import itertools
+import logging
+import math
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+from config import *
+from pakwheels_scraper import PakWheelsScraper
+from records import CarListing
+from storage import CarDatabase, StreamingCSVWriter
+from throttle import HostRateLimiter
+from utils import setup_logging
+
+logger = logging.getLogger(__name__)
+
+# Prices are split geometrically, since listings cluster at the low end;
+# below this the split point is taken as if the band started here
+PRICE_SPLIT_FLOOR = 100_000
+
+Band = Tuple[int, int]
+
+
+class Shard(NamedTuple):
+    """One search: a city, make, model year band and price band, each optional"""
+    city: Optional[str] = None
+    make: Optional[str] = None
+    years: Optional[Band] = None
+    prices: Optional[Band] = None
+
+    def url(self, search_url: str = SEARCH_URL) -> str:
+        """Search URL in the form the site's own filters build"""
+        parts = []
+        if self.city:
+            parts.append(f"ct_{self.city}")
+        if self.make:
+            parts.append(f"mk_{self.make}")
+        if self.years:
+            parts.append(f"model_year_{self.years[0]}-{self.years[1]}")
+        if self.prices:
+            parts.append(f"price_{self.prices[0]}-{self.prices[1]}")
+        return search_url + ''.join(f"{part}/" for part in parts)
+
+    def split(self) -> List['Shard']:
+        """Two shards whose results together are this one's, or [] if it can't be narrowed"""
+        low, high = self.years or YEAR_RANGE
+        if high > low:
+            middle = (low + high) // 2
+            return [self._replace(years=(low, middle)), self._replace(years=(middle + 1, high))]
+        low, high = self.prices or PRICE_RANGE
+        if high > low:
+            middle = min(high - 1, int(math.sqrt(max(low, PRICE_SPLIT_FLOOR) * high)))
+            if middle < low:
+                middle = (low + high) // 2
+            return [self._replace(prices=(low, middle)), self._replace(prices=(middle + 1, high))]
+        return []
+
+    def __str__(self) -> str:
+        parts = [self.city or 'any city', self.make or 'any make']
+        if self.years:
+            parts.append(f"{self.years[0]}-{self.years[1]}")
+        if self.prices:
+            parts.append(f"PKR {self.prices[0]:,}-{self.prices[1]:,}")
+        return ' / '.join(parts)
+
+
+class ShardResult(NamedTuple):
+    """What crawling a shard produced: its listings, or the shards it was split into"""
+    shard: Shard
+    cars: List[CarListing]
+    children: List[Shard]
+    pages: int
+    truncated: bool = False
+    failed: bool = False
+
+
+def parse_band(text: str, bounds: Band) -> Band:
+    """'2005-2014' -> (2005, 2014); an open end (e.g. "2015-") takes its bound"""
+    low, sep, high = text.strip().partition('-')
+    if not sep:
+        low = high = low
+    return (int(low) if low else bounds[0], int(high) if high else bounds[1])
+
+
+def plan(cities: Iterable[Optional[str]] = (None,), makes: Iterable[Optional[str]] = (None,),
+         years: Iterable[Optional[Band]] = (None,), prices: Iterable[Optional[Band]] = (None,)) -> List[Shard]:
+    """Every combination of the given dimensions; None in a dimension means no filter on it"""
+    return [Shard(city, make, year, price)
+            for city, make, year, price in itertools.product(cities or (None,), makes or (None,),
+                                                            years or (None,), prices or (None,))]
+
+
+class CrawlPlanner:
+    """Size, split and crawl shards in parallel under one rate limit"""
+
+    def __init__(self, max_pages: int = SEARCH_MAX_PAGES, workers: int = SHARD_WORKERS,
+                 rate_limiter: Optional[HostRateLimiter] = None, search_url: str = SEARCH_URL,
+                 **scraper_options):
+        self.max_pages = max_pages
+        self.workers = max(1, workers)
+        self.rate_limiter = rate_limiter or HostRateLimiter.from_config()
+        self.search_url = search_url
+        self.scraper_options = scraper_options
+        self.stats = {'shards': 0, 'split': 0, 'truncated': 0, 'failed': 0, 'pages': 0,
+                      'listings': 0, 'duplicates': 0}
+        self._local = threading.local()
+
+    def scraper(self) -> PakWheelsScraper:
+        """This thread's scraper; every one shares the planner's rate limiter"""
+        scraper = getattr(self._local, 'scraper', None)
+        if scraper is None:
+            scraper = self._local.scraper = PakWheelsScraper(rate_limiter=self.rate_limiter,
+                                                             **self.scraper_options)
+        return scraper
+
+    def crawl_shard(self, shard: Shard) -> ShardResult:
+        """Fetch a shard's first page, then either split it or crawl the rest of it"""
+        scraper = self.scraper()
+        url = shard.url(self.search_url)
+        first = scraper.scrape_first_page(url)
+        if first.listings is None:
+            logger.error(f"Shard {shard}: first page failed, skipping")
+            return ShardResult(shard, [], [], 1, failed=True)
+        if not first.listings:
+            return ShardResult(shard, [], [], 1)
+
+        last_page = first.last_page or self.max_pages
+        truncated = False
+        if last_page > self.max_pages:
+            children = shard.split()
+            if children:
+                logger.info(f"Shard {shard}: {last_page} pages, splitting")
+                return ShardResult(shard, [], children, 1)
+            logger.warning(f"Shard {shard}: {last_page} pages and can't be narrowed further, "
+                           f"only the first {self.max_pages} will be crawled")
+            truncated = True
+
+        cars = list(first.cars)
+        pages = 1
+        page_data = first.cars
+        if last_page > 1:
+            for _, page_data in scraper.iter_pages(min(last_page, self.max_pages), url, start_page=2,
+                                                   previous_urls={car.url for car in first.cars}):
+                cars.extend(page_data)
+                pages += 1
+
+        if first.last_page is None and pages >= self.max_pages and scraper.last_page >= self.max_pages and page_data:
+            # No pagination to size it by, and still going at the deepest page served
+            children = shard.split()
+            if children:
+                logger.info(f"Shard {shard}: no pagination and still listing at page {pages}, splitting")
+                return ShardResult(shard, [], children, pages)
+            logger.warning(f"Shard {shard}: no pagination and can't be narrowed further, "
+                           f"only the first {self.max_pages} pages were crawled")
+            truncated = True
+
+        logger.info(f"Shard {shard}: {pages} pages, {len(cars)} cars")
+        return ShardResult(shard, cars, [], pages, truncated)
+
+    def iter_results(self, shards: Iterable[Shard]) -> Iterator[Tuple[ShardResult, List[CarListing]]]:
+        """Yield each finished shard with the listings it found that no earlier shard had"""
+        seen_ids = set()
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='shard') as executor:
+            pending = {executor.submit(self.crawl_shard, shard) for shard in shards}
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    result = future.result()
+                    pending |= {executor.submit(self.crawl_shard, child) for child in result.children}
+                    self.stats['shards'] += 1
+                    self.stats['pages'] += result.pages
+                    self.stats['split'] += bool(result.children)
+                    self.stats['truncated'] += result.truncated
+                    self.stats['failed'] += result.failed
+
+                    fresh = []
+                    for car in result.cars:
+                        key = car.listing_id or car.url
+                        if key is not None and key in seen_ids:
+                            self.stats['duplicates'] += 1
+                            continue
+                        seen_ids.add(key)
+                        fresh.append(car)
+                    self.stats['listings'] += len(fresh)
+                    yield result, fresh
+
+    def crawl(self, shards: Iterable[Shard]) -> Iterator[CarListing]:
+        """Every distinct listing across the shards"""
+        for _, cars in self.iter_results(shards):
+            yield from cars
+
+    def crawl_to_csv(self, shards: Iterable[Shard], filename: str = OUTPUT_FILE) -> int:
+        """Crawl the shards into one deduplicated CSV, saving every listing to the
+        database as well. Returns the number of rows written."""
+        writer = StreamingCSVWriter(filename)
+        database = CarDatabase()
+        writer.open()
+        try:
+            for _, cars in self.iter_results(shards):
+                writer.write_rows(cars)
+                database.write_rows(cars)
+        except BaseException:
+            writer.abort()
+            raise
+        finally:
+            database.close()
+
+        if writer.rows_written:
+            writer.close()
+            logger.info(f"Data saved to {filename}")
+        else:
+            writer.discard()
+        return writer.rows_written
+
+    def report(self) -> str:
+        stats = self.stats
+        pages = stats['pages'] or 1
+        return (f"{stats['shards']} shards crawled ({stats['split']} split, {stats['truncated']} truncated, "
+                f"{stats['failed']} failed), {stats['pages']} pages, {stats['listings']} listings "
+                f"({stats['listings'] / pages:.1f} per page), {stats['duplicates']} duplicates dropped")
+
+
+def _bands(bounds: Band):
+    return lambda value: [parse_band(part, bounds) for part in value.split(',') if part.strip()]
+
+
+def _names(value: str) -> List[str]:
+    return [part.strip().lower() for part in value.split(',') if part.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Crawl PakWheels as many narrower searches, merged into one CSV")
+    parser.add_argument('--cities', type=_names, default=[], help="comma-separated, e.g. lahore,karachi")
+    parser.add_argument('--makes', type=_names, default=[], help="comma-separated, e.g. toyota,honda")
+    parser.add_argument('--years', type=_bands(YEAR_RANGE), default=[],
+                        help="comma-separated model year bands, e.g. 2005-2014,2015-")
+    parser.add_argument('--prices', type=_bands(PRICE_RANGE), default=[],
+                        help="comma-separated price bands in PKR, e.g. 0-3000000,3000001-")
+    parser.add_argument('--max-pages', type=int, default=SEARCH_MAX_PAGES,
+                        help="deepest page a search serves; deeper shards are split")
+    parser.add_argument('--workers', type=int, default=SHARD_WORKERS, help="shards crawled at once")
+    parser.add_argument('--output', default=OUTPUT_FILE)
+    parser.add_argument('--dry-run', action='store_true', help="print the shard URLs without crawling")
+    args = parser.parse_args()
+
+    shards = plan(args.cities, args.makes, args.years, args.prices)
+    if args.dry_run:
+        for shard in shards:
+            print(shard.url())
+        return
+
+    setup_logging()
+    planner = CrawlPlanner(args.max_pages, args.workers)
+    rows = planner.crawl_to_csv(shards, args.output)
+    logger.info(planner.report())
+    for line in planner.rate_limiter.report().splitlines():
+        logger.info(f"Requests to {line}")
+    print(f"{rows} listings saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
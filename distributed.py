@@ -0,0 +1,531 @@
+"""
+Distributed scraping: a coordinator and any number of workers sharing a task queue
+
+The coordinator turns a search URL and a page range into one task per page
+in a SQLite TaskQueue. Workers, as separate processes on this machine or on
+others that can reach the database file, lease tasks, scrape the page and
+report its rows back. Once no task is left the coordinator merges the rows
+in page order, drops listings seen on an earlier page, and writes one CSV
+and the listings database.
+
+A lease lasts TASK_LEASE_SECONDS. A worker that dies mid-page simply lets
+its lease run out and another worker takes the page over. A failed page goes
+back in the queue after a backoff, up to TASK_MAX_ATTEMPTS tries. When a page
+shows where the results end, the tasks past it are skipped.
+
+Each worker paces its own requests; the rate to the site grows with the
+number of workers, so set PAKWHEELS_RATE_LIMIT per worker accordingly.
+
+Usage:
+    python distributed.py coordinator --url URL --pages 100 --local-workers 2
+    python distributed.py worker [--threads 2] [--forever]
+    python distributed.py status
+"""
+
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from dataclasses import astuple
+from typing import Callable, Dict, Iterator, List, NamedTuple, Optional
+
+from config import *
+from listing_index import listing_id
+from logs import channel_levels, configure_logging, configure_worker_logging, worker_log_queue
+from pakwheels_scraper import PakWheelsScraper
+from records import CarListing
+from storage import CarDatabase, StreamingCSVWriter
+from throttle import backoff_delay
+from utils import setup_logging
+
+logger = logging.getLogger(__name__)
+
+PENDING = 'pending'
+LEASED = 'leased'
+DONE = 'done'
+FAILED = 'failed'
+SKIPPED = 'skipped'
+
+# Pages a worker has to have finished within this many seconds to count
+# towards its current throughput
+THROUGHPUT_WINDOW = 60
+
+# A worker not heard from for this long is shown as gone
+WORKER_TIMEOUT = 30
+
+
+class Task(NamedTuple):
+    """One results page to scrape"""
+    id: int
+    crawl_id: str
+    base_url: str
+    page_num: int
+    attempts: int
+
+
+class TaskQueue:
+    """SQLite queue of page tasks, their results and the workers serving them.
+
+    Every process and thread opens its own TaskQueue on the same file. The
+    database runs in WAL mode, so workers reporting results don't block
+    others leasing tasks for long.
+    """
+
+    def __init__(self, path: str = TASK_QUEUE_FILE, lease_seconds: float = TASK_LEASE_SECONDS,
+                 max_attempts: int = TASK_MAX_ATTEMPTS):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS crawls (
+                id TEXT PRIMARY KEY,
+                base_url TEXT NOT NULL,
+                first_page INTEGER NOT NULL,
+                last_page INTEGER NOT NULL,
+                output_file TEXT NOT NULL,
+                state TEXT NOT NULL,
+                rows_saved INTEGER,
+                created_at REAL NOT NULL,
+                finished_at REAL
+            );
+            CREATE TABLE IF NOT EXISTS tasks (
+                id INTEGER PRIMARY KEY,
+                crawl_id TEXT NOT NULL,
+                page_num INTEGER NOT NULL,
+                state TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                worker_id TEXT,
+                available_at REAL NOT NULL DEFAULT 0,
+                lease_expires REAL,
+                error TEXT,
+                updated_at REAL NOT NULL,
+                UNIQUE (crawl_id, page_num)
+            );
+            CREATE INDEX IF NOT EXISTS tasks_state ON tasks (state, available_at);
+            CREATE TABLE IF NOT EXISTS results (
+                task_id INTEGER PRIMARY KEY,
+                crawl_id TEXT NOT NULL,
+                page_num INTEGER NOT NULL,
+                listings INTEGER NOT NULL,
+                rows TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS workers (
+                id TEXT PRIMARY KEY,
+                host TEXT NOT NULL,
+                pid INTEGER NOT NULL,
+                state TEXT NOT NULL,
+                started_at REAL NOT NULL,
+                last_seen REAL NOT NULL,
+                pages_done INTEGER NOT NULL DEFAULT 0,
+                pages_failed INTEGER NOT NULL DEFAULT 0,
+                rows INTEGER NOT NULL DEFAULT 0,
+                busy_seconds REAL NOT NULL DEFAULT 0
+            );
+        """)
+
+    def _transaction(self):
+        """Write transaction taken up front, so two workers can't lease the same task"""
+        self.conn.execute("BEGIN IMMEDIATE")
+        return self.conn
+
+    def create_crawl(self, base_url: str, last_page: int, first_page: int = 1,
+                     output_file: str = OUTPUT_FILE) -> str:
+        """Queue one task per page of a search; returns the crawl ID"""
+        crawl_id = uuid.uuid4().hex[:12]
+        now = time.time()
+        conn = self._transaction()
+        try:
+            conn.execute("INSERT INTO crawls VALUES (?, ?, ?, ?, ?, 'running', NULL, ?, NULL)",
+                         (crawl_id, base_url, first_page, last_page, output_file, now))
+            conn.executemany("INSERT INTO tasks (crawl_id, page_num, state, updated_at) VALUES (?, ?, ?, ?)",
+                             [(crawl_id, page_num, PENDING, now) for page_num in range(first_page, last_page + 1)])
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return crawl_id
+
+    def lease(self, worker_id: str, crawl_id: Optional[str] = None) -> Optional[Task]:
+        """Take the lowest page that is waiting, or whose lease has run out"""
+        now = time.time()
+        conn = self._transaction()
+        try:
+            row = conn.execute(f"""
+                SELECT tasks.id, tasks.crawl_id, crawls.base_url, tasks.page_num, tasks.attempts
+                FROM tasks JOIN crawls ON crawls.id = tasks.crawl_id
+                WHERE ((tasks.state = ? AND tasks.available_at <= ?) OR (tasks.state = ? AND tasks.lease_expires < ?))
+                  AND tasks.attempts < ? {'AND tasks.crawl_id = ?' if crawl_id else ''}
+                ORDER BY crawls.created_at, tasks.page_num LIMIT 1
+            """, (PENDING, now, LEASED, now, self.max_attempts) + ((crawl_id,) if crawl_id else ())).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            conn.execute("UPDATE tasks SET state = ?, worker_id = ?, attempts = attempts + 1, lease_expires = ?, "
+                         "updated_at = ? WHERE id = ?", (LEASED, worker_id, now + self.lease_seconds, now, row[0]))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        task = Task(*row)
+        return task._replace(attempts=task.attempts + 1)
+
+    def complete(self, task: Task, worker_id: str, cars: List[CarListing], listings: int,
+                 last_page: Optional[int], seconds: float) -> bool:
+        """Store a page's rows. Returns False if another worker already finished it."""
+        now = time.time()
+        rows = json.dumps([astuple(car) for car in cars])
+        conn = self._transaction()
+        try:
+            updated = conn.execute("UPDATE tasks SET state = ?, worker_id = ?, lease_expires = NULL, error = NULL, "
+                                   "updated_at = ? WHERE id = ? AND state != ?",
+                                   (DONE, worker_id, now, task.id, DONE)).rowcount
+            if updated:
+                conn.execute("INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?)",
+                             (task.id, task.crawl_id, task.page_num, listings, rows))
+                # An empty page, or one that knows the last page, ends the search
+                end = task.page_num if not listings else last_page
+                if end is not None:
+                    conn.execute("UPDATE tasks SET state = ?, updated_at = ? "
+                                 "WHERE crawl_id = ? AND page_num > ? AND state = ?",
+                                 (SKIPPED, now, task.crawl_id, end, PENDING))
+                conn.execute("UPDATE workers SET pages_done = pages_done + 1, rows = rows + ?, "
+                             "busy_seconds = busy_seconds + ?, last_seen = ? WHERE id = ?",
+                             (len(cars), seconds, now, worker_id))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return bool(updated)
+
+    def fail(self, task: Task, worker_id: str, error: str, seconds: float):
+        """Put a page back for another try after a backoff, or give up on it"""
+        now = time.time()
+        state = FAILED if task.attempts >= self.max_attempts else PENDING
+        conn = self._transaction()
+        try:
+            conn.execute("UPDATE tasks SET state = ?, lease_expires = NULL, available_at = ?, error = ?, "
+                         "updated_at = ? WHERE id = ? AND state = ? AND worker_id = ?",
+                         (state, now + backoff_delay(task.attempts - 1), error, now, task.id, LEASED, worker_id))
+            conn.execute("UPDATE workers SET pages_failed = pages_failed + 1, busy_seconds = busy_seconds + ?, "
+                         "last_seen = ? WHERE id = ?", (seconds, now, worker_id))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def outstanding(self, crawl_id: Optional[str] = None) -> int:
+        """Tasks still waiting or being worked on. Leases that ran out on
+        their last attempt are given up first."""
+        now = time.time()
+        crawl_filter = 'AND crawl_id = ?' if crawl_id else ''
+        crawl_args = (crawl_id,) if crawl_id else ()
+        self.conn.execute(f"UPDATE tasks SET state = ?, error = 'lease expired', updated_at = ? "
+                          f"WHERE state = ? AND lease_expires < ? AND attempts >= ? {crawl_filter}",
+                          (FAILED, now, LEASED, now, self.max_attempts) + crawl_args)
+        return self.conn.execute(f"SELECT COUNT(*) FROM tasks WHERE state IN (?, ?) {crawl_filter}",
+                                 (PENDING, LEASED) + crawl_args).fetchone()[0]
+
+    def progress(self, crawl_id: str) -> Dict[str, int]:
+        """Task count by state"""
+        counts = dict(self.conn.execute("SELECT state, COUNT(*) FROM tasks WHERE crawl_id = ? GROUP BY state",
+                                        (crawl_id,)).fetchall())
+        return {state: counts.get(state, 0) for state in (PENDING, LEASED, DONE, FAILED, SKIPPED)}
+
+    def crawl(self, crawl_id: str) -> Optional[Dict]:
+        row = self.conn.execute("SELECT id, base_url, first_page, last_page, output_file, state, rows_saved, "
+                                "created_at, finished_at FROM crawls WHERE id = ?", (crawl_id,)).fetchone()
+        if row is None:
+            return None
+        keys = ('id', 'base_url', 'first_page', 'last_page', 'output_file', 'state', 'rows_saved',
+                'created_at', 'finished_at')
+        return dict(zip(keys, row), tasks=self.progress(crawl_id))
+
+    def crawls(self, limit: int = 10) -> List[Dict]:
+        """The most recent crawls with their task counts, newest first"""
+        ids = [row[0] for row in self.conn.execute("SELECT id FROM crawls ORDER BY created_at DESC LIMIT ?",
+                                                   (limit,))]
+        return [self.crawl(crawl_id) for crawl_id in ids]
+
+    def finish_crawl(self, crawl_id: str, rows_saved: int):
+        self.conn.execute("UPDATE crawls SET state = 'finished', rows_saved = ?, finished_at = ? WHERE id = ?",
+                          (rows_saved, time.time(), crawl_id))
+
+    def iter_results(self, crawl_id: str) -> Iterator[List[CarListing]]:
+        """Each finished page's listings, in page order"""
+        for (rows,) in self.conn.execute("SELECT rows FROM results WHERE crawl_id = ? ORDER BY page_num",
+                                         (crawl_id,)):
+            yield [CarListing(*values) for values in json.loads(rows)]
+
+    def register_worker(self, worker_id: str):
+        now = time.time()
+        self.conn.execute("INSERT OR REPLACE INTO workers (id, host, pid, state, started_at, last_seen) "
+                          "VALUES (?, ?, ?, 'idle', ?, ?)", (worker_id, socket.gethostname(), os.getpid(), now, now))
+
+    def heartbeat(self, worker_id: str, state: str):
+        self.conn.execute("UPDATE workers SET state = ?, last_seen = ? WHERE id = ?",
+                          (state, time.time(), worker_id))
+
+    def workers(self, window: float = THROUGHPUT_WINDOW) -> List[Dict]:
+        """Every worker with its totals and its pages per minute, overall and recently"""
+        now = time.time()
+        recent = dict(self.conn.execute("SELECT worker_id, COUNT(*) FROM tasks WHERE state = ? AND updated_at > ? "
+                                        "GROUP BY worker_id", (DONE, now - window)).fetchall())
+        workers = []
+        for (worker_id, host, pid, state, started_at, last_seen, pages_done, pages_failed, rows,
+             busy_seconds) in self.conn.execute("SELECT * FROM workers ORDER BY started_at"):
+            if state != 'stopped' and now - last_seen > WORKER_TIMEOUT:
+                state = 'gone'
+            running = max((now if state in ('idle', 'working') else last_seen) - started_at, 1e-9)
+            workers.append({
+                'id': worker_id,
+                'host': host,
+                'pid': pid,
+                'state': state,
+                'started_at': started_at,
+                'last_seen': last_seen,
+                'pages_done': pages_done,
+                'pages_failed': pages_failed,
+                'rows': rows,
+                'pages_per_minute': round(pages_done / running * 60, 1),
+                'recent_pages_per_minute': round(recent.get(worker_id, 0) / window * 60, 1),
+                'seconds_per_page': round(busy_seconds / pages_done, 2) if pages_done else None,
+            })
+        return workers
+
+    def close(self):
+        self.conn.close()
+
+
+class Worker:
+    """Leases page tasks and scrapes them until the queue runs dry (or forever).
+
+    `threads` pages are worked on at once, each thread with its own queue
+    connection and all of them sharing one scraper and its rate limit.
+    """
+
+    def __init__(self, path: str = TASK_QUEUE_FILE, worker_id: Optional[str] = None, threads: int = 1,
+                 crawl_id: Optional[str] = None, **scraper_options):
+        self.path = path
+        self.id = worker_id or default_worker_id()
+        self.threads = max(1, threads)
+        self.crawl_id = crawl_id
+        self.scraper = PakWheelsScraper(concurrency=self.threads, **scraper_options)
+        self.stopping = threading.Event()
+
+    def run(self, forever: bool = False, poll: float = WORKER_POLL_INTERVAL):
+        queue = TaskQueue(self.path)
+        queue.register_worker(self.id)
+        logger.info(f"Worker {self.id} started with {self.threads} threads")
+        try:
+            workers = [threading.Thread(target=self._work, args=(forever, poll), name=f"worker-{i}")
+                       for i in range(self.threads)]
+            for thread in workers:
+                thread.start()
+            for thread in workers:
+                thread.join()
+        finally:
+            queue.heartbeat(self.id, 'stopped')
+            queue.close()
+        logger.info(f"Worker {self.id} stopped")
+
+    def stop(self):
+        self.stopping.set()
+
+    def _work(self, forever: bool, poll: float):
+        queue = TaskQueue(self.path)
+        try:
+            while not self.stopping.is_set():
+                task = queue.lease(self.id, self.crawl_id)
+                if task is None:
+                    if not forever and not queue.outstanding(self.crawl_id):
+                        return
+                    queue.heartbeat(self.id, 'idle')
+                    self.stopping.wait(poll)
+                    continue
+
+                queue.heartbeat(self.id, 'working')
+                start = time.perf_counter()
+                try:
+                    result = self.scraper.scrape_page_result(task.page_num, task.base_url)
+                    error = None if result.listings is not None else "fetch or parse failed"
+                except Exception as e:
+                    result, error = None, str(e)
+                seconds = time.perf_counter() - start
+                if error:
+                    logger.warning(f"Page {task.page_num} of crawl {task.crawl_id} failed "
+                                   f"(attempt {task.attempts}): {error}")
+                    queue.fail(task, self.id, error, seconds)
+                elif not queue.complete(task, self.id, result.cars, result.listings, result.last_page, seconds):
+                    logger.info(f"Page {task.page_num} of crawl {task.crawl_id} was already done by another worker")
+        finally:
+            queue.close()
+
+
+def default_worker_id() -> str:
+    """ID of a worker running in this process"""
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+def run_worker(path: str = TASK_QUEUE_FILE, threads: int = 1, crawl_id: Optional[str] = None,
+               forever: bool = False, log_queue=None, log_levels: Optional[Dict[str, int]] = None,
+               **scraper_options):
+    """Entry point for worker processes.
+
+    Workers the coordinator starts log through its `log_queue`; any other
+    worker writes log files of its own, named after its worker ID.
+    """
+    if log_queue is not None:
+        configure_worker_logging(log_queue, log_levels)
+    else:
+        configure_logging(name=default_worker_id())
+    Worker(path, threads=threads, crawl_id=crawl_id, **scraper_options).run(forever)
+
+
+class Coordinator:
+    """Queues a crawl, waits for workers to finish it and merges their rows"""
+
+    def __init__(self, path: str = TASK_QUEUE_FILE):
+        self.path = path
+        self.queue = TaskQueue(path)
+
+    def submit(self, base_url: str, max_pages: int, first_page: int = 1, output_file: str = OUTPUT_FILE) -> str:
+        crawl_id = self.queue.create_crawl(base_url, max_pages, first_page, output_file)
+        logger.info(f"Crawl {crawl_id}: queued pages {first_page}-{max_pages} of {base_url}")
+        return crawl_id
+
+    def wait(self, crawl_id: str, poll: float = WORKER_POLL_INTERVAL,
+             on_progress: Optional[Callable[[Dict[str, int]], None]] = None):
+        """Block until no task of the crawl is waiting or leased"""
+        last = None
+        while self.queue.outstanding(crawl_id):
+            progress = self.queue.progress(crawl_id)
+            if progress != last and on_progress:
+                on_progress(progress)
+            last = progress
+            time.sleep(poll)
+
+    def merge(self, crawl_id: str) -> int:
+        """Write the crawl's rows, in page order and without repeated listings,
+        to its output file and the listings database. Returns the rows written."""
+        crawl = self.queue.crawl(crawl_id)
+        writer = StreamingCSVWriter(crawl['output_file'])
+        database = CarDatabase()
+        seen_ids = set()
+        writer.open()
+        try:
+            for cars in self.queue.iter_results(crawl_id):
+                fresh = []
+                for car in cars:
+                    row_id = listing_id(car.url)
+                    if row_id is None or row_id not in seen_ids:
+                        fresh.append(car)
+                        if row_id is not None:
+                            seen_ids.add(row_id)
+                writer.write_rows(fresh)
+                database.write_rows(cars)
+        except BaseException:
+            writer.abort()
+            raise
+        finally:
+            database.close()
+
+        if writer.rows_written:
+            writer.close()
+        else:
+            writer.discard()
+        self.queue.finish_crawl(crawl_id, writer.rows_written)
+        return writer.rows_written
+
+    def run(self, base_url: str, max_pages: int, output_file: str = OUTPUT_FILE, local_workers: int = 0,
+            threads: int = 1) -> int:
+        """Queue a crawl, optionally start worker processes here, and merge once it's done"""
+        crawl_id = self.submit(base_url, max_pages, output_file=output_file)
+        ctx = multiprocessing.get_context('spawn')
+        processes = [ctx.Process(target=run_worker, args=(self.path, threads, crawl_id),
+                                 kwargs=dict(log_queue=worker_log_queue(), log_levels=channel_levels()))
+                     for _ in range(local_workers)]
+        for process in processes:
+            process.start()
+        try:
+            self.wait(crawl_id, on_progress=lambda progress: logger.info(
+                f"Crawl {crawl_id}: " + ', '.join(f"{count} {state}" for state, count in progress.items())))
+        finally:
+            for process in processes:
+                process.join()
+        rows = self.merge(crawl_id)
+        progress = self.queue.progress(crawl_id)
+        logger.info(f"Crawl {crawl_id}: {progress[DONE]} pages done, {progress[FAILED]} failed, "
+                    f"{progress[SKIPPED]} past the end skipped; {rows} rows saved to {output_file}")
+        return rows
+
+    def close(self):
+        self.queue.close()
+
+
+def format_status(queue: TaskQueue) -> str:
+    lines = []
+    for crawl in queue.crawls():
+        tasks = ', '.join(f"{count} {state}" for state, count in crawl['tasks'].items() if count)
+        lines.append(f"crawl {crawl['id']} ({crawl['state']}): {crawl['base_url']} - {tasks}")
+    for worker in queue.workers():
+        lines.append(f"worker {worker['id']} ({worker['state']}): {worker['pages_done']} pages, "
+                     f"{worker['pages_failed']} failed, {worker['rows']} rows, "
+                     f"{worker['recent_pages_per_minute']:g} pages/min now, "
+                     f"{worker['pages_per_minute']:g} overall")
+    return '\n'.join(lines) or "Queue is empty"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Scrape one search with many worker processes")
+    parser.add_argument('--queue', default=TASK_QUEUE_FILE, help="SQLite task queue shared by every process")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    coordinator = subparsers.add_parser('coordinator', help="queue a crawl, wait for it and merge the output")
+    coordinator.add_argument('--url', default=BASE_URL)
+    coordinator.add_argument('--pages', type=int, default=MAX_PAGES)
+    coordinator.add_argument('--output', default=OUTPUT_FILE)
+    coordinator.add_argument('--local-workers', type=int, default=0, help="worker processes to start here")
+    coordinator.add_argument('--threads', type=int, default=1, help="pages in flight per local worker")
+
+    worker = subparsers.add_parser('worker', help="scrape queued pages")
+    worker.add_argument('--threads', type=int, default=1, help="pages in flight at once")
+    worker.add_argument('--crawl', help="only work on this crawl")
+    worker.add_argument('--forever', action='store_true', help="keep waiting for new crawls when the queue is empty")
+
+    subparsers.add_parser('status', help="show crawls and worker throughput")
+    args = parser.parse_args()
+
+    if args.command == 'worker':
+        # Workers may share a directory with the coordinator and each other
+        configure_logging(name=default_worker_id())
+    else:
+        setup_logging()
+    if args.command == 'coordinator':
+        coordinator = Coordinator(args.queue)
+        try:
+            coordinator.run(args.url, args.pages, args.output, args.local_workers, args.threads)
+        finally:
+            coordinator.close()
+    elif args.command == 'worker':
+        worker = Worker(args.queue, threads=args.threads, crawl_id=args.crawl)
+        try:
+            worker.run(forever=args.forever)
+        except KeyboardInterrupt:
+            worker.stop()
+    else:
+        queue = TaskQueue(args.queue)
+        print(format_status(queue))
+        queue.close()
+
+
+if __name__ == "__main__":
+    main()
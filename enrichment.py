@@ -0,0 +1,250 @@
+"""
+Detail-page enrichment for scraped listings
+
+Search result snippets often lack the color and registration city, and the
+color guessed from a description is frequently wrong. Each listing's own
+page has the seller's spec table, so this stage fetches those pages with a
+small bounded pool (through the scraper's session, so connections, the rate
+limit and the HTTP cache are shared) and merges the fields into the rows.
+
+Extracted fields are kept in SQLite keyed by listing ID, so a listing is
+fetched once however many runs see it.
+
+Enrichment modes (ENRICH_DETAILS):
+    off      - no detail pages are fetched
+    missing  - fetch details only for rows with a field still N/A
+    all      - fetch details for every row, correcting guessed values too
+"""
+
+import json
+import logging
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+try:
+    from lxml import html as lxml_html
+except ImportError:  # pragma: no cover - lxml is a declared dependency
+    lxml_html = None
+
+from config import DETAIL_CACHE_FILE, ENRICH_CONCURRENCY
+from records import FIELD_BY_HEADER, CarListing, parse_value
+from utils import clean_text, extract_mileage, normalize_url
+
+logger = logging.getLogger(__name__)
+
+ENRICH_MODES = ['off', 'missing', 'all']
+
+# CarListing attributes a detail page can supply
+ENRICHED_FIELDS = ['color', 'city', 'transmission', 'year', 'mileage_km']
+
+# Fields where the seller's spec table beats whatever the snippet suggested
+AUTHORITATIVE_FIELDS = ['color', 'city']
+
+# Spec table labels (lowercased) -> CarListing attribute
+SPEC_LABELS = {
+    'registered in': 'city',
+    'color': 'color',
+    'colour': 'color',
+    'transmission': 'transmission',
+    'model year': 'year',
+    'mileage': 'mileage_km',
+}
+
+def detail_url(url: Optional[str]) -> Optional[str]:
+    """Fetchable URL for a listing, repairing rows saved before URLs stopped
+    losing their ':' and '/' characters to clean_text"""
+    url = normalize_url(url)
+    return url if url and url.startswith(('http://', 'https://')) else None
+
+
+def parse_detail_page(content: bytes) -> Dict[str, object]:
+    """Fields found on a listing page, from its JSON-LD and spec table, typed as on CarListing"""
+    if not content or lxml_html is None:
+        return {}
+    root = lxml_html.document_fromstring(content)
+    fields = {}
+
+    for block in root.xpath('//script[@type="application/ld+json"]/text()'):
+        try:
+            data = json.loads(block)
+        except ValueError:
+            continue
+        if not isinstance(data, dict) or 'offers' not in data:
+            continue
+        if data.get('color'):
+            fields['color'] = data['color']
+        if data.get('vehicleTransmission'):
+            fields['transmission'] = data['vehicleTransmission']
+        if data.get('modelDate'):
+            fields['year'] = data['modelDate']
+        if data.get('mileageFromOdometer'):
+            fields['mileage_km'] = data['mileageFromOdometer']
+        break
+
+    # The spec list alternates label and value items
+    items = [''.join(li.itertext()).strip()
+             for li in root.xpath('//ul[contains(concat(" ", normalize-space(@class), " "), " ul-specs ")]/li')]
+    for label, value in zip(items[::2], items[1::2]):
+        field = SPEC_LABELS.get(label.lower())
+        if field and value:
+            fields[field] = value
+
+    if 'mileage_km' in fields:
+        fields['mileage_km'] = extract_mileage(str(fields['mileage_km'])) or fields['mileage_km']
+    return typed_fields({field: clean_text(str(value)) for field, value in fields.items()})
+
+
+def typed_fields(fields: Dict[str, object]) -> Dict[str, object]:
+    """Detail fields keyed by CarListing attribute with missing values dropped.
+
+    Also accepts the CSV-column keys cached before listings became typed.
+    """
+    typed = {}
+    for key, value in fields.items():
+        field = FIELD_BY_HEADER.get(key, key)
+        value = parse_value(field, value)
+        if value is not None:
+            typed[field] = value
+    return typed
+
+
+class DetailCache:
+    """SQLite map of listing ID -> fields extracted from its detail page"""
+
+    def __init__(self, path: str = DETAIL_CACHE_FILE):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS details (
+                listing_id INTEGER PRIMARY KEY,
+                fields TEXT NOT NULL,
+                fetched_at REAL NOT NULL
+            )
+        """)
+        self.conn.commit()
+
+    def get_many(self, ids: List[int]) -> Dict[int, Dict[str, object]]:
+        if not ids:
+            return {}
+        placeholders = ','.join('?' * len(ids))
+        rows = self.conn.execute(
+            f"SELECT listing_id, fields FROM details WHERE listing_id IN ({placeholders})", ids
+        ).fetchall()
+        return {row_id: typed_fields(json.loads(fields)) for row_id, fields in rows}
+
+    def put_many(self, details: Dict[int, Dict[str, object]]):
+        now = time.time()
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO details VALUES (?, ?, ?)",
+            [(row_id, json.dumps(fields), now) for row_id, fields in details.items()]
+        )
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+
+class DetailEnricher:
+    """Fills in listings from their detail pages.
+
+    `fetch(url)` returns a page's bytes or None; the scraper passes its own
+    fetch_page so detail requests go through the same session. The cache is
+    only touched from the thread calling enrich(); pool threads just fetch
+    and parse.
+    """
+
+    def __init__(self, fetch: Callable[[str], Optional[bytes]], mode: str = 'missing',
+                 workers: int = ENRICH_CONCURRENCY, cache_file: str = DETAIL_CACHE_FILE):
+        if mode not in ENRICH_MODES:
+            logger.warning(f"Unknown enrichment mode '{mode}', using 'missing'")
+            mode = 'missing'
+        self.fetch = fetch
+        self.mode = mode
+        self.cache = DetailCache(cache_file)
+        self.pool = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix='detail')
+        self.stats = {
+            'rows': 0,
+            'candidates': 0,
+            'cache_hits': 0,
+            'requests': 0,
+            'failures': 0,
+            'fields_filled': 0,
+            'fields_corrected': 0,
+        }
+
+    def needs_details(self, listing: CarListing) -> bool:
+        if self.mode == 'all':
+            return True
+        return any(getattr(listing, field) is None for field in ENRICHED_FIELDS)
+
+    def _fetch_details(self, url: str) -> Optional[Dict[str, object]]:
+        content = self.fetch(url)
+        return parse_detail_page(content) if content else None
+
+    def enrich(self, rows: List[CarListing]) -> List[CarListing]:
+        """Merge detail-page fields into the listings that need them, in place"""
+        self.stats['rows'] += len(rows)
+        candidates = {}
+        for row in rows:
+            row_id = row.listing_id
+            if row_id is not None and self.needs_details(row):
+                candidates.setdefault(row_id, []).append(row)
+        if not candidates:
+            return rows
+        self.stats['candidates'] += len(candidates)
+
+        details = self.cache.get_many(list(candidates))
+        self.stats['cache_hits'] += len(details)
+
+        # Fetch the rest concurrently; only successful fetches are cached
+        futures = {}
+        for row_id, id_rows in candidates.items():
+            url = detail_url(id_rows[0].url)
+            if row_id not in details and url:
+                futures[row_id] = self.pool.submit(self._fetch_details, url)
+        fetched = {}
+        for row_id, future in futures.items():
+            self.stats['requests'] += 1
+            try:
+                fields = future.result()
+            except Exception as e:
+                logger.error(f"Error enriching listing {row_id}: {str(e)}")
+                fields = None
+            if fields is None:
+                self.stats['failures'] += 1
+            else:
+                fetched[row_id] = fields
+        if fetched:
+            self.cache.put_many(fetched)
+            details.update(fetched)
+
+        for row_id, id_rows in candidates.items():
+            for row in id_rows:
+                self._merge(row, details.get(row_id, {}))
+        return rows
+
+    def _merge(self, listing: CarListing, fields: Dict[str, object]):
+        for field, value in fields.items():
+            current = getattr(listing, field)
+            if current is None:
+                setattr(listing, field, value)
+                self.stats['fields_filled'] += 1
+            elif field in AUTHORITATIVE_FIELDS and current.lower() != value.lower():
+                setattr(listing, field, value)
+                self.stats['fields_corrected'] += 1
+
+    def report(self, page_requests: int) -> str:
+        """One-line summary of the extra requests spent and what they bought"""
+        stats = self.stats
+        improved = stats['fields_filled'] + stats['fields_corrected']
+        overhead = stats['requests'] / page_requests if page_requests else 0
+        per_request = improved / stats['requests'] if stats['requests'] else 0
+        return (f"Enrichment: {stats['requests']} detail requests ({overhead:.1f} per search page, "
+                f"{stats['cache_hits']} cached, {stats['failures']} failed) filled {stats['fields_filled']} "
+                f"and corrected {stats['fields_corrected']} fields ({per_request:.2f} per request)")
+
+    def close(self):
+        self.pool.shutdown(wait=True, cancel_futures=True)
+        self.cache.close()
@@ -0,0 +1,79 @@
+"""
+In-memory event stream for the web dashboard
+
+Scraper progress and log lines are published into a fixed-size ring buffer.
+Clients follow it over Server-Sent Events and block until something new
+arrives, so an idle dashboard costs nothing and a busy one costs one open
+connection instead of a poll every few seconds.
+"""
+
+import json
+import logging
+import threading
+from collections import deque
+from typing import Any, List, NamedTuple
+
+
+class Event(NamedTuple):
+    id: int
+    type: str
+    data: Any
+
+    def to_sse(self) -> str:
+        """Format as a Server-Sent Events message"""
+        return f"id: {self.id}\nevent: {self.type}\ndata: {json.dumps(self.data)}\n\n"
+
+
+class EventBuffer:
+    """Thread-safe ring buffer of the most recent events"""
+
+    def __init__(self, size: int = 1000):
+        self.events = deque(maxlen=size)
+        self.last_id = 0
+        self._condition = threading.Condition()
+
+    def publish(self, event_type: str, data: Any):
+        with self._condition:
+            self.last_id += 1
+            self.events.append(Event(self.last_id, event_type, data))
+            self._condition.notify_all()
+
+    def wait_since(self, last_id: int, timeout: float) -> List[Event]:
+        """Events newer than last_id, waiting up to `timeout` seconds for one to arrive"""
+        with self._condition:
+            if self.last_id <= last_id:
+                self._condition.wait(timeout)
+            if self.last_id <= last_id:
+                return []
+            # Newest events are at the right; walk back only as far as needed
+            newer = []
+            for event in reversed(self.events):
+                if event.id <= last_id:
+                    break
+                newer.append(event)
+            newer.reverse()
+            return newer
+
+
+class RingBufferHandler(logging.Handler):
+    """Logging handler that keeps the last few formatted lines in memory
+    and publishes each one as a 'log' event"""
+
+    def __init__(self, events: EventBuffer, size: int = 200):
+        super().__init__()
+        self.events = events
+        self.lines = deque(maxlen=size)
+
+    def emit(self, record: logging.LogRecord):
+        try:
+            line = self.format(record)
+        except Exception:
+            self.handleError(record)
+            return
+        self.lines.append(line + '\n')
+        self.events.publish('log', line)
+
+    def tail(self, count: int) -> List[str]:
+        """The last `count` log lines, oldest first"""
+        lines = list(self.lines)
+        return lines[-count:]
@@ -0,0 +1,306 @@
+"""
+Export formats for scraped listings
+
+    csv      - display strings ("PKR 14,200,000", "N/A"), as OUTPUT_FILE is written
+    jsonl.gz - gzip-compressed JSON Lines with typed values: integers for
+               price, mileage and year, null for anything missing
+    arrow    - Arrow IPC stream with typed columns (needs pyarrow)
+    parquet  - Parquet with typed, zstd-compressed columns (needs pyarrow)
+
+An exporter writes batches of listings to a binary stream as they come. The
+same exporters write files during a scrape (ExportWriter, published with the
+same .part-and-rename as StreamingCSVWriter) and stream /download?format=
+in chunks (export_chunks), so neither holds the whole export in memory.
+Parquet is the exception to a point: rows are buffered up to
+PARQUET_ROW_GROUP_SIZE before a row group is written.
+
+The typed formats carry the listing ID plus every CarListing field.
+"""
+
+import csv
+import gzip
+import io
+import itertools
+import json
+import logging
+import os
+from typing import BinaryIO, Dict, Iterable, Iterator, List, Optional
+
+from config import CSV_HEADERS, EXPORT_BATCH_SIZE, PARQUET_ROW_GROUP_SIZE
+from records import FIELD_BY_HEADER, CarListing
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+logger = logging.getLogger(__name__)
+
+# Typed columns in the order they're written
+EXPORT_FIELDS = ['listing_id'] + list(FIELD_BY_HEADER.values())
+
+
+def typed_record(listing: CarListing) -> Dict[str, object]:
+    """Listing as plain typed values, keyed by EXPORT_FIELDS"""
+    return {field: getattr(listing, field) for field in EXPORT_FIELDS}
+
+
+def typed_columns(listings: List[CarListing]) -> Dict[str, list]:
+    """Listings as one list of typed values per field"""
+    return {field: [getattr(listing, field) for listing in listings] for field in EXPORT_FIELDS}
+
+
+class CsvExporter:
+    """CSV of display strings, the same as StreamingCSVWriter writes"""
+    name = 'csv'
+    extension = '.csv'
+    mimetype = 'text/csv'
+
+    def __init__(self, stream: BinaryIO):
+        self.stream = stream
+        self._buffer = io.StringIO()
+        self._writer = csv.DictWriter(self._buffer, fieldnames=CSV_HEADERS)
+        self._writer.writeheader()
+        self._drain()
+
+    def _drain(self):
+        self.stream.write(self._buffer.getvalue().encode('utf-8'))
+        self._buffer.seek(0)
+        self._buffer.truncate()
+
+    def write_rows(self, rows: List[CarListing]):
+        self._writer.writerows(row.to_row() for row in rows)
+        self._drain()
+
+    def close(self):
+        pass
+
+
+class JsonLinesExporter:
+    """One JSON object per listing, gzip compressed. Every batch is flushed
+    through the compressor, so a file being written can be read up to its
+    last complete batch."""
+    name = 'jsonl.gz'
+    extension = '.jsonl.gz'
+    mimetype = 'application/gzip'
+
+    def __init__(self, stream: BinaryIO):
+        self.stream = stream
+        self._gzip = gzip.GzipFile(fileobj=stream, mode='wb', compresslevel=6)
+
+    def write_rows(self, rows: List[CarListing]):
+        self._gzip.write(''.join(json.dumps(typed_record(row), ensure_ascii=False) + '\n'
+                                 for row in rows).encode('utf-8'))
+        self._gzip.flush()
+
+    def close(self):
+        self._gzip.close()
+
+
+def arrow_schema():
+    return pa.schema([
+        ('listing_id', pa.int64()),
+        ('model', pa.string()),
+        ('color', pa.string()),
+        ('transmission', pa.string()),
+        ('mileage_km', pa.int64()),
+        ('year', pa.int16()),
+        ('city', pa.string()),
+        ('price_pkr', pa.int64()),
+        ('url', pa.string()),
+    ])
+
+
+class ArrowExporter:
+    """Arrow IPC stream, one record batch per batch of listings; readable
+    batch by batch while it's still being written"""
+    name = 'arrow'
+    extension = '.arrows'
+    mimetype = 'application/vnd.apache.arrow.stream'
+
+    def __init__(self, stream: BinaryIO):
+        self.schema = arrow_schema()
+        self._writer = pa.ipc.new_stream(stream, self.schema)
+
+    def write_rows(self, rows: List[CarListing]):
+        if rows:
+            self._writer.write_batch(pa.RecordBatch.from_pydict(typed_columns(rows), schema=self.schema))
+
+    def close(self):
+        self._writer.close()
+
+
+class ParquetExporter:
+    """Parquet, zstd compressed, one row group per PARQUET_ROW_GROUP_SIZE listings"""
+    name = 'parquet'
+    extension = '.parquet'
+    mimetype = 'application/vnd.apache.parquet'
+
+    def __init__(self, stream: BinaryIO, row_group_size: int = PARQUET_ROW_GROUP_SIZE):
+        self.schema = arrow_schema()
+        self.row_group_size = row_group_size
+        self._pending: List[CarListing] = []
+        self._writer = pq.ParquetWriter(stream, self.schema, compression='zstd')
+
+    def _write_row_group(self):
+        self._writer.write_table(pa.Table.from_pydict(typed_columns(self._pending), schema=self.schema))
+        self._pending = []
+
+    def write_rows(self, rows: List[CarListing]):
+        self._pending.extend(rows)
+        if len(self._pending) >= self.row_group_size:
+            self._write_row_group()
+
+    def close(self):
+        if self._pending:
+            self._write_row_group()
+        self._writer.close()
+
+
+EXPORTERS = {exporter.name: exporter for exporter in (CsvExporter, JsonLinesExporter, ArrowExporter, ParquetExporter)}
+
+# Formats that need pyarrow
+ARROW_FORMATS = ('arrow', 'parquet')
+
+
+def get_exporter(fmt: str):
+    """Exporter class for a format name; raises ValueError for an unknown or unavailable one"""
+    if fmt not in EXPORTERS:
+        raise ValueError(f"Unknown export format '{fmt}', expected one of {', '.join(EXPORTERS)}")
+    if fmt in ARROW_FORMATS and pa is None:
+        raise ValueError(f"The {fmt} format needs pyarrow, which is not installed")
+    return EXPORTERS[fmt]
+
+
+def check_formats(formats: Iterable[str]) -> List[str]:
+    """The format names as a list; raises ValueError if any is unknown or unavailable"""
+    formats = list(formats)
+    for fmt in formats:
+        get_exporter(fmt)
+    return formats
+
+
+def parse_formats(text: str) -> List[str]:
+    """Format names from a comma-separated list such as "jsonl.gz,parquet" """
+    return check_formats(fmt.strip() for fmt in text.split(',') if fmt.strip())
+
+
+def export_filename(filename: str, fmt: str) -> str:
+    """`filename` with the extension of an export format, e.g. data.csv -> data.parquet"""
+    return os.path.splitext(filename)[0] + get_exporter(fmt).extension
+
+
+class ChunkSink(io.RawIOBase):
+    """Write-only stream that keeps what's written until it's drained. Its
+    position keeps counting across drains, as the Parquet writer needs."""
+
+    def __init__(self):
+        super().__init__()
+        self._chunks: List[bytes] = []
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def drain(self) -> bytes:
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def export_chunks(listings: Iterable[CarListing], fmt: str, batch_size: int = EXPORT_BATCH_SIZE) -> Iterator[bytes]:
+    """Stream listings in an export format, encoded a batch at a time"""
+    sink = ChunkSink()
+    exporter = get_exporter(fmt)(sink)
+    listings = iter(listings)
+    while True:
+        batch = list(itertools.islice(listings, batch_size))
+        if not batch:
+            break
+        exporter.write_rows(batch)
+        chunk = sink.drain()
+        if chunk:
+            yield chunk
+    exporter.close()
+    chunk = sink.drain()
+    if chunk:
+        yield chunk
+
+
+class ExportWriter:
+    """Write listings to a file in an export format as they arrive and
+    atomically publish it on close, like StreamingCSVWriter.
+
+    If the run fails, the partial file is kept as `<filename>.part`.
+    """
+
+    def __init__(self, filename: str, fmt: Optional[str] = None):
+        self.filename = filename
+        self.temp_filename = f"{filename}.part"
+        self.format = fmt or next((name for name, exporter in EXPORTERS.items()
+                                   if filename.endswith(exporter.extension)), 'csv')
+        self.exporter_class = get_exporter(self.format)
+        self.rows_written = 0
+        self._file = None
+        self._exporter = None
+
+    def open(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.filename)), exist_ok=True)
+        self._file = open(self.temp_filename, 'wb')
+        self._exporter = self.exporter_class(self._file)
+        return self
+
+    def write_rows(self, rows: List[CarListing]):
+        """Write a batch of listings (normally one page) and flush it to disk"""
+        self._exporter.write_rows(rows)
+        self._file.flush()
+        self.rows_written += len(rows)
+
+    def close(self):
+        """Finish the file and move it into place"""
+        self._exporter.close()
+        self._file.close()
+        os.replace(self.temp_filename, self.filename)
+
+    def discard(self):
+        """Throw the output away, leaving any existing file untouched"""
+        self._file.close()
+        os.remove(self.temp_filename)
+
+    def abort(self):
+        """Stop writing and leave the partial output in the .part file"""
+        self._file.close()
+        logger.warning(f"Partial output kept in {self.temp_filename} ({self.rows_written} rows)")
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+def write_export(listings: Iterable[CarListing], filename: str, fmt: Optional[str] = None,
+                 batch_size: int = EXPORT_BATCH_SIZE) -> int:
+    """Write listings to an export file in one go, through the same atomic rename.
+    Returns the number of rows written."""
+    with ExportWriter(filename, fmt) as writer:
+        listings = iter(listings)
+        while True:
+            batch = list(itertools.islice(listings, batch_size))
+            if not batch:
+                break
+            writer.write_rows(batch)
+    return writer.rows_written
@@ -0,0 +1,132 @@
+"""
+Field extraction engine for PakWheels listings
+
+City and color vocabularies are compiled once into prefix-factored regular
+expressions, so finding a city or color is a single scan of the text however
+many words the vocabularies hold. Vocabularies come from config.py and can be
+extended with a JSON file (see VOCABULARY_FILE) without touching code.
+"""
+
+import json
+import re
+from typing import Dict, Iterable, List, Optional
+
+from config import CITIES, COLORS, COLOR_CONTEXT, VOCABULARY_FILE
+
+# "<color> color", "<color> painted", "<color> body", ...
+COLOR_SUFFIXES = ['color', 'colour', 'painted', 'exterior', 'body']
+# "color: <color>"
+COLOR_PREFIXES = ['color', 'colour']
+
+# Short spec sections (e.g. a lone "White") are trusted without context words
+SHORT_SECTION_LENGTH = 50
+
+
+def keyword_pattern(words: Iterable[str]) -> str:
+    """Build a regex alternation for `words` factored into a prefix trie.
+
+    Words sharing a prefix share a branch, so the regex engine walks at most
+    one path per position instead of trying every word in turn.
+    """
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word.lower():
+            node = node.setdefault(char, {})
+        node[''] = {}
+
+    def build(node: dict) -> str:
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ''
+        pattern = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+        if '' in node:
+            pattern = f'(?:{pattern})?'
+        return pattern
+
+    return build(trie)
+
+
+def _word_end(pattern: str) -> str:
+    # The start-of-word check is done in _search_word: a leading lookbehind
+    # would stop the regex engine from skipping ahead on the first character
+    return rf'(?:{pattern})(?![a-z])'
+
+
+def _search_word(regex, text: str):
+    """First match of `regex` in lowercased `text` that starts a word"""
+    for match in regex.finditer(text):
+        start = match.start()
+        if start == 0 or not text[start - 1].isalpha():
+            return match
+    return None
+
+
+class FieldExtractor:
+    """Precompiled matchers for the registration city and color of a listing"""
+
+    def __init__(self, cities: List[str], colors: Dict[str, List[str]], color_context: List[str]):
+        self.cities = {city.lower(): city.title() for city in cities}
+        self.color_names = {}
+        for color_name, variants in colors.items():
+            for variant in variants:
+                self.color_names[variant.lower()] = color_name.title()
+
+        colors_pattern = keyword_pattern(self.color_names)
+        # Patterns are all lowercase; text is lowercased once before matching,
+        # which is much cheaper than re.IGNORECASE
+        self.city_re = re.compile(_word_end(keyword_pattern(self.cities)))
+        self.color_re = re.compile(_word_end(colors_pattern))
+        self.color_context_re = re.compile(keyword_pattern(color_context))
+        self.color_phrase_re = re.compile(
+            rf'({colors_pattern})\s*(?:{keyword_pattern(COLOR_SUFFIXES)})'
+            rf'|(?:{keyword_pattern(COLOR_PREFIXES)}):\s*({colors_pattern})'
+        )
+
+    @classmethod
+    def from_config(cls, vocabulary_file: Optional[str] = VOCABULARY_FILE) -> 'FieldExtractor':
+        """Build from the config vocabularies, extended by an optional JSON file"""
+        cities = list(CITIES)
+        colors = {name: list(variants) for name, variants in COLORS.items()}
+        color_context = list(COLOR_CONTEXT)
+
+        if vocabulary_file:
+            with open(vocabulary_file, encoding='utf-8') as f:
+                extra = json.load(f)
+            cities += [city for city in extra.get('cities', []) if city not in cities]
+            for name, variants in extra.get('colors', {}).items():
+                colors.setdefault(name, [])
+                colors[name] += [variant for variant in variants if variant not in colors[name]]
+            color_context += extra.get('color_context', [])
+
+        return cls(cities, colors, color_context)
+
+    def find_city(self, *texts: str) -> Optional[str]:
+        """First known city mentioned in the given texts, checked in order"""
+        for text in texts:
+            if text:
+                match = _search_word(self.city_re, text.lower())
+                if match:
+                    return self.cities[match.group()]
+        return None
+
+    def find_color_phrase(self, text: str) -> Optional[str]:
+        """Color stated explicitly, e.g. "white color" or "colour: black" """
+        if not text:
+            return None
+        match = self.color_phrase_re.search(text.lower())
+        if match:
+            return self.color_names[match.group(1) or match.group(2)]
+        return None
+
+    def find_color_in_sections(self, sections: Iterable[str]) -> Optional[str]:
+        """Color named in a spec section that is short or talks about paint"""
+        for section in sections:
+            section = section.lower()
+            match = _search_word(self.color_re, section)
+            if match and (len(section) < SHORT_SECTION_LENGTH or self.color_context_re.search(section)):
+                return self.color_names[match.group()]
+        return None
+
+
+EXTRACTOR = FieldExtractor.from_config()
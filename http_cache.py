@@ -0,0 +1,239 @@
+"""
+On-disk HTTP response cache for the PakWheels scraper
+
+Responses are stored zlib-compressed in SQLite, keyed by URL. Entries younger
+than the TTL are served without touching the network; older ones are
+revalidated with If-None-Match / If-Modified-Since, and a 304 reuses the
+stored body. The cache is size bounded and evicts least recently used
+entries first.
+
+Cache modes (HTTP_CACHE_MODE):
+    off     - every request goes to the network
+    on      - serve fresh entries, revalidate stale ones, store new ones
+    replay  - serve only from the cache and never touch the network; a miss
+              comes back as a 504, as with Cache-Control: only-if-cached
+
+A miss is stored as the caller reads the body, so pages still stream to the
+parser while they download.
+"""
+
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Dict, Iterable, Iterator, Optional
+
+from requests import Response
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+from config import HTTP_CACHE_FILE, HTTP_CACHE_MAX_BYTES, HTTP_CACHE_TTL
+from throttle import ThrottledAdapter
+
+CACHE_MODES = ['off', 'on', 'replay']
+
+COMPRESS_LEVEL = 6
+
+
+class ResponseCache:
+    """Size-bounded LRU store of compressed response bodies"""
+
+    def __init__(self, path: str = HTTP_CACHE_FILE, ttl: float = HTTP_CACHE_TTL,
+                 max_bytes: int = HTTP_CACHE_MAX_BYTES):
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.stats = {
+            'hits': 0,
+            'misses': 0,
+            'revalidated': 0,
+            'stored': 0,
+            'evicted': 0,
+            'bytes_saved': 0,
+        }
+        self._lock = threading.Lock()
+        # Fetch threads share one connection; every use is under self._lock
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                url TEXT PRIMARY KEY,
+                body BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                content_type TEXT,
+                etag TEXT,
+                last_modified TEXT,
+                stored_at REAL NOT NULL,
+                last_used REAL NOT NULL
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)")
+        self.conn.commit()
+
+    def get(self, url: str) -> Optional[Dict]:
+        """Cached entry for a URL with its body decompressed, or None"""
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT body, content_type, etag, last_modified, stored_at FROM responses WHERE url = ?",
+                (url,)
+            ).fetchone()
+            if not row:
+                return None
+            self.conn.execute("UPDATE responses SET last_used = ? WHERE url = ?", (time.time(), url))
+            self.conn.commit()
+
+        body, content_type, etag, last_modified, stored_at = row
+        return {
+            'body': zlib.decompress(body),
+            'headers': {'Content-Type': content_type, 'ETag': etag, 'Last-Modified': last_modified},
+            'fresh': time.time() - stored_at < self.ttl,
+        }
+
+    def put(self, url: str, body: bytes, headers):
+        """Store a response body, evicting old entries if over the size limit"""
+        self.put_compressed(url, zlib.compress(body, COMPRESS_LEVEL), headers)
+
+    def put_compressed(self, url: str, compressed: bytes, headers):
+        """Store a body already compressed with zlib"""
+        now = time.time()
+        with self._lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (url, compressed, len(compressed), headers.get('Content-Type'),
+                 headers.get('ETag'), headers.get('Last-Modified'), now, now)
+            )
+            self.stats['stored'] += 1
+            self._evict()
+            self.conn.commit()
+
+    def touch(self, url: str):
+        """Mark a stale entry fresh again after a 304"""
+        with self._lock:
+            self.conn.execute("UPDATE responses SET stored_at = ? WHERE url = ?", (time.time(), url))
+            self.conn.commit()
+
+    def _evict(self):
+        total = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for url, size in self.conn.execute("SELECT url, size FROM responses ORDER BY last_used").fetchall():
+            self.conn.execute("DELETE FROM responses WHERE url = ?", (url,))
+            self.stats['evicted'] += 1
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+    def record(self, stat: str, amount: int = 1):
+        with self._lock:
+            self.stats[stat] += amount
+
+    def snapshot(self) -> Dict[str, int]:
+        """Copy of the hit/miss counters, safe to hand to another thread"""
+        with self._lock:
+            return dict(self.stats)
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
+
+
+def tee_into_cache(cache: ResponseCache, url: str, headers, chunks: Iterable[bytes]) -> Iterator[bytes]:
+    """Pass a response body through chunk by chunk, compressing it into the
+    cache as it goes. Only a body read to the end is stored."""
+    compressor = zlib.compressobj(COMPRESS_LEVEL)
+    parts = []
+    for chunk in chunks:
+        parts.append(compressor.compress(chunk))
+        yield chunk
+    parts.append(compressor.flush())
+    cache.put_compressed(url, b''.join(parts), headers)
+
+
+class _CacheTeeRaw:
+    """urllib3 response whose decoded body is copied into the cache as
+    requests streams it, so a miss doesn't hold the body back from the parser"""
+
+    def __init__(self, raw, cache: ResponseCache, url: str, headers):
+        self._raw = raw
+        self._cache = cache
+        self._url = url
+        self._headers = headers
+
+    def stream(self, *args, **kwargs):
+        return tee_into_cache(self._cache, self._url, self._headers, self._raw.stream(*args, **kwargs))
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+
+def _cached_response(request, entry: Dict) -> Response:
+    response = Response()
+    response.status_code = 200
+    response.reason = 'OK'
+    response.url = request.url
+    response.request = request
+    response.headers = CaseInsensitiveDict({k: v for k, v in entry['headers'].items() if v})
+    response.encoding = get_encoding_from_headers(response.headers)
+    response._content = entry['body']
+    response._content_consumed = True  # so iter_content() serves the body rather than reading a socket
+    response.from_cache = True
+    return response
+
+
+def _replay_miss(request) -> Response:
+    response = Response()
+    response.status_code = 504
+    response.reason = 'Not in cache (replay mode)'
+    response.url = request.url
+    response.request = request
+    response._content = b''
+    response._content_consumed = True
+    response.from_cache = True
+    return response
+
+
+class CachingAdapter(ThrottledAdapter):
+    """Transport adapter that answers GETs from a ResponseCache when it can.
+
+    Only requests that reach the network take a rate limiter token.
+    """
+
+    def __init__(self, cache: ResponseCache, rate_limiter, replay: bool = False, **kwargs):
+        self.cache = cache
+        self.replay = replay
+        super().__init__(rate_limiter, **kwargs)
+
+    def send(self, request, **kwargs):
+        if request.method != 'GET':
+            return super().send(request, **kwargs)
+
+        entry = self.cache.get(request.url)
+        if entry and (entry['fresh'] or self.replay):
+            self.cache.record('hits')
+            self.cache.record('bytes_saved', len(entry['body']))
+            return _cached_response(request, entry)
+
+        if self.replay:
+            self.cache.record('misses')
+            return _replay_miss(request)
+
+        if entry:
+            # Stale: ask the server whether our copy is still good
+            if entry['headers'].get('ETag'):
+                request.headers['If-None-Match'] = entry['headers']['ETag']
+            if entry['headers'].get('Last-Modified'):
+                request.headers['If-Modified-Since'] = entry['headers']['Last-Modified']
+
+        response = super().send(request, **kwargs)
+
+        if entry and response.status_code == 304:
+            self.cache.touch(request.url)
+            self.cache.record('revalidated')
+            self.cache.record('bytes_saved', len(entry['body']))
+            cached = _cached_response(request, entry)
+            cached.ttfb = response.ttfb
+            return cached
+
+        self.cache.record('misses')
+        if response.status_code == 200 and response.raw is not None:
+            response.raw = _CacheTeeRaw(response.raw, self.cache, request.url, response.headers)
+        return response
@@ -0,0 +1,205 @@
+"""
+Scrape job scheduler for the web dashboard
+
+Each scrape request becomes a Job with its own ID, status and output file.
+Jobs wait in a FIFO queue and a fixed pool of worker threads runs them, so
+several scrapes can be queued or running at once. Every job is handed the
+same HostRateLimiter, which keeps the combined request rate to any one host
+within its limit however many jobs are active, and makes every job back
+off together when a host starts throttling.
+"""
+
+import glob
+import itertools
+import logging
+import os
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional
+
+from checkpoints import CheckpointStore, checkpoint_key
+from config import JOB_HISTORY, JOB_WORKERS, JOBS_DIR
+from throttle import HostRateLimiter
+
+QUEUED = 'queued'
+RUNNING = 'running'
+COMPLETED = 'completed'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+
+FINISHED_STATES = (COMPLETED, FAILED, CANCELLED)
+
+
+class JobCancelled(Exception):
+    """Raised inside a running job once it has been asked to stop"""
+
+
+class Job:
+    """One scrape request and its progress"""
+
+    def __init__(self, params: Dict, output_dir: str = JOBS_DIR):
+        self.id = uuid.uuid4().hex[:12]
+        self.params = params
+        self.output_file = os.path.join(output_dir, f"{self.id}.csv")
+        self.cancel_requested = threading.Event()
+        self.status = {
+            'id': self.id,
+            'state': QUEUED,
+            'url': params.get('base_url'),
+            'created_at': time.time(),
+            'started_at': None,
+            'finished_at': None,
+            'is_running': False,
+            'progress': 0,
+            'total_pages': params.get('max_pages', 0),
+            'current_page': 0,
+            'cars_found': 0,
+            'cars_saved': 0,
+            'cache': None,
+            'changes': None,
+            'enrichment': None,
+            'hosts': None,
+            'message': 'Waiting in queue'
+        }
+
+    @property
+    def state(self) -> str:
+        return self.status['state']
+
+    @property
+    def finished(self) -> bool:
+        return self.state in FINISHED_STATES
+
+    def check_cancelled(self):
+        """Stop the job if a cancel has been requested"""
+        if self.cancel_requested.is_set():
+            raise JobCancelled(self.id)
+
+    def snapshot(self) -> Dict:
+        """Copy of the status, safe to hand to another thread"""
+        return dict(self.status)
+
+
+class JobManager:
+    """Queue of scrape jobs served by a bounded pool of worker threads.
+
+    `runner(job, rate_limiter)` does the work for one job and updates its
+    status; `on_update(job)` is called whenever a job changes state.
+    """
+
+    def __init__(self, runner: Callable, workers: int = JOB_WORKERS,
+                 on_update: Optional[Callable] = None, rate_limiter=None,
+                 output_dir: str = JOBS_DIR, history: int = JOB_HISTORY):
+        self.runner = runner
+        self.on_update = on_update or (lambda job: None)
+        self.rate_limiter = rate_limiter or HostRateLimiter.from_config()
+        self.output_dir = output_dir
+        self.history = history
+        self.jobs: Dict[str, Job] = OrderedDict()
+        self.logger = logging.getLogger(__name__)
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._workers = []
+        for number in range(max(1, workers)):
+            worker = threading.Thread(target=self._work, name=f"scrape-job-{number + 1}", daemon=True)
+            worker.start()
+            self._workers.append(worker)
+
+    def submit(self, **params) -> Job:
+        """Queue a new job and return it.
+        
+        Raises ValueError if another job for the same search URL is still
+        queued or running, since both would share its resume checkpoint.
+        """
+        os.makedirs(self.output_dir, exist_ok=True)
+        job = Job(params, self.output_dir)
+        with self._lock:
+            url = checkpoint_key(job.status['url'] or '')
+            for other in self.jobs.values():
+                if not other.finished and checkpoint_key(other.status['url'] or '') == url:
+                    raise ValueError(f"Job {other.id} is already scraping {other.status['url']}")
+            self.jobs[job.id] = job
+            self._prune()
+        self._queue.put(job)
+        self.logger.info(f"Job {job.id} queued for {job.status['url']}")
+        self.on_update(job)
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self.jobs.get(job_id)
+
+    def list(self) -> List[Job]:
+        """Every job still held, newest first"""
+        with self._lock:
+            return list(reversed(self.jobs.values()))
+
+    def latest(self) -> Optional[Job]:
+        with self._lock:
+            return next(reversed(self.jobs.values()), None)
+
+    def cancel(self, job_id: str) -> Optional[Job]:
+        """Ask a job to stop. A queued job is cancelled at once; a running one
+        stops after the page it is on."""
+        job = self.get(job_id)
+        if job is None or job.finished:
+            return job
+        job.cancel_requested.set()
+        with self._lock:
+            if job.state == QUEUED:
+                self._finish(job, CANCELLED, 'Cancelled before it started')
+                return job
+        job.status['message'] = 'Cancelling...'
+        self.on_update(job)
+        return job
+
+    def _work(self):
+        while True:
+            job = self._queue.get()
+            try:
+                with self._lock:
+                    if job.state != QUEUED:
+                        continue
+                    job.status.update(state=RUNNING, is_running=True, started_at=time.time(),
+                                      message='Starting scraper...')
+                self.on_update(job)
+                self._run(job)
+            finally:
+                self._queue.task_done()
+
+    def _run(self, job: Job):
+        try:
+            self.runner(job, self.rate_limiter)
+        except JobCancelled:
+            self._finish(job, CANCELLED, f"Cancelled after page {job.status['current_page']}")
+        except Exception as e:
+            self.logger.error(f"Job {job.id} failed: {str(e)}")
+            self._finish(job, FAILED, f'Error during scraping: {str(e)}')
+        else:
+            self._finish(job, COMPLETED, job.status['message'])
+
+    def _finish(self, job: Job, state: str, message: str):
+        job.status.update(state=state, is_running=False, progress=100,
+                          finished_at=time.time(), message=message)
+        self.logger.info(f"Job {job.id} {state}")
+        self.on_update(job)
+
+    def _prune(self):
+        """Drop the oldest finished jobs, and their output, once more than `history` are held"""
+        finished = [job for job in self.jobs.values() if job.finished]
+        expired = list(itertools.islice(finished, max(0, len(finished) - self.history)))
+        if not expired:
+            return
+        checkpoints = CheckpointStore()
+        try:
+            for job in expired:
+                del self.jobs[job.id]
+                # The CSV, any exports next to it, and the .part files of an unfinished run
+                for filename in glob.glob(os.path.join(self.output_dir, f"{job.id}.*")):
+                    os.remove(filename)
+                checkpoints.clear_output(f"{job.output_file}.part")
+        finally:
+            checkpoints.close()
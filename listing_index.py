@@ -0,0 +1,100 @@
+"""
+Persistent index of listings already scraped
+
+Each listing is keyed by the numeric ID at the end of its URL
+(e.g. ...-for-sale-in-islamabad-10175242) and stored with a hash of its
+normalized fields. Comparing against the index tells a run which listings
+are new, which have changed (price drop, mileage edit, ...) and which are
+exactly as they were last time.
+"""
+
+import hashlib
+import re
+import sqlite3
+import time
+from typing import List, Optional
+
+from config import CSV_HEADERS, LISTING_INDEX_FILE
+
+LISTING_ID_RE = re.compile(r'-(\d+)(?:[/?#]|$)')
+
+# The URL is left out of the hash: older rows hold mangled copies of it
+HASHED_FIELDS = [field for field in CSV_HEADERS if field != 'URL']
+
+NEW = 'new'
+CHANGED = 'changed'
+UNCHANGED = 'unchanged'
+
+
+def listing_id(url: str) -> Optional[int]:
+    """Numeric PakWheels listing ID from a listing URL"""
+    match = LISTING_ID_RE.search(url or '')
+    return int(match.group(1)) if match else None
+
+
+def row_hash(listing) -> str:
+    """Stable hash of the fields that describe a CarListing, as displayed"""
+    row = listing.to_row()
+    # Missing fields hash as 'NA', the placeholder listings were first indexed with
+    content = '\x1f'.join('NA' if row[field] == 'N/A' else row[field] for field in HASHED_FIELDS)
+    return hashlib.sha1(content.encode('utf-8')).hexdigest()
+
+
+class ListingIndex:
+    """SQLite-backed map of listing ID -> content hash"""
+
+    def __init__(self, path: str = LISTING_INDEX_FILE):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS listings (
+                listing_id INTEGER PRIMARY KEY,
+                content_hash TEXT NOT NULL,
+                first_seen REAL NOT NULL,
+                last_seen REAL NOT NULL
+            )
+        """)
+        self.conn.commit()
+
+    def classify(self, rows: List) -> List[str]:
+        """Label each row new, changed or unchanged and record it in the index.
+
+        Rows without a listing ID can't be tracked and are always treated as new.
+        """
+        now = time.time()
+        ids = [listing_id(row.url) for row in rows]
+        known_ids = [i for i in ids if i is not None]
+        known = {}
+        if known_ids:
+            placeholders = ','.join('?' * len(known_ids))
+            known = dict(self.conn.execute(
+                f"SELECT listing_id, content_hash FROM listings WHERE listing_id IN ({placeholders})",
+                known_ids
+            ).fetchall())
+
+        labels = []
+        for row, row_id in zip(rows, ids):
+            if row_id is None:
+                labels.append(NEW)
+                continue
+
+            content_hash = row_hash(row)
+            if row_id not in known:
+                labels.append(NEW)
+                self.conn.execute("INSERT INTO listings VALUES (?, ?, ?, ?)", (row_id, content_hash, now, now))
+            elif known[row_id] != content_hash:
+                labels.append(CHANGED)
+                self.conn.execute(
+                    "UPDATE listings SET content_hash = ?, last_seen = ? WHERE listing_id = ?",
+                    (content_hash, now, row_id)
+                )
+            else:
+                labels.append(UNCHANGED)
+                self.conn.execute("UPDATE listings SET last_seen = ? WHERE listing_id = ?", (now, row_id))
+            known[row_id] = content_hash
+
+        self.conn.commit()
+        return labels
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,207 @@
+"""
+Logging for the scraper and the web interface
+
+Logging calls on fetch threads, Flask request threads and parser processes
+only put the record on a queue. One background QueueListener thread formats
+the records and writes them out, so a slow disk or terminal never holds up a
+page or a request.
+
+Every record belongs to a channel: 'access' for the HTTP server's
+per-request lines, 'scraper' for everything else. Each channel has its own
+file and level. Files rotate by size or by time, and rotated files are
+gzipped with only LOG_BACKUP_COUNT kept per channel, so disk use stays bounded.
+"""
+
+import atexit
+import gzip
+import logging
+import multiprocessing
+import os
+import queue
+import shutil
+import threading
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler, TimedRotatingFileHandler
+from typing import Dict, List, Optional, Tuple
+
+from config import (ACCESS_LOG_FILE, ACCESS_LOG_LEVEL, LOG_BACKUP_COUNT, LOG_FILE, LOG_LEVEL, LOG_MAX_BYTES,
+                    LOG_ROTATE, LOG_ROTATE_WHEN)
+
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+
+# Channel -> (logger it takes records from, file, level, line format). '' is
+# the root logger, so 'scraper' gets every record no other channel claims.
+# Werkzeug's request lines already carry the client, time and status.
+CHANNELS = {
+    'scraper': ('', LOG_FILE, LOG_LEVEL, LOG_FORMAT),
+    'access': ('werkzeug', ACCESS_LOG_FILE, ACCESS_LOG_LEVEL, '%(message)s'),
+}
+
+_lock = threading.Lock()
+_configured = False
+_router: Optional['ChannelRouter'] = None
+_listeners: List[QueueListener] = []
+_queue_handlers: List[Tuple[logging.Logger, QueueHandler]] = []
+_worker_queue = None
+
+
+class ChannelQueueHandler(QueueHandler):
+    """Queues records tagged with the channel they were logged to"""
+
+    def __init__(self, log_queue, channel: str):
+        super().__init__(log_queue)
+        self.channel = channel
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = super().prepare(record)
+        record.channel = self.channel
+        return record
+
+
+class ChannelRouter(logging.Handler):
+    """Hands each queued record to the handlers of its channel"""
+
+    def __init__(self):
+        super().__init__()
+        self.channels: Dict[str, List[logging.Handler]] = {channel: [] for channel in CHANNELS}
+
+    def handle(self, record: logging.LogRecord) -> bool:
+        for handler in self.channels.get(getattr(record, 'channel', 'scraper'), ()):
+            if record.levelno >= handler.level:
+                handler.handle(record)
+        return True
+
+    def close(self):
+        for handlers in self.channels.values():
+            for handler in handlers:
+                handler.close()
+        super().close()
+
+
+def _gzip_name(name: str) -> str:
+    return name + '.gz'
+
+
+def _gzip_rotate(source: str, dest: str):
+    with open(source, 'rb') as f_in, gzip.open(dest, 'wb') as f_out:
+        shutil.copyfileobj(f_in, f_out)
+    os.remove(source)
+
+
+def rotating_file_handler(filename: str, rotate: str = LOG_ROTATE) -> logging.Handler:
+    """File handler that rotates at LOG_MAX_BYTES ("size") or LOG_ROTATE_WHEN ("time")
+    and gzips each file it rotates out"""
+    if rotate == 'time':
+        handler = TimedRotatingFileHandler(filename, when=LOG_ROTATE_WHEN, backupCount=LOG_BACKUP_COUNT,
+                                           encoding='utf-8', delay=True)
+    else:
+        handler = RotatingFileHandler(filename, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT,
+                                      encoding='utf-8', delay=True)
+    handler.namer = _gzip_name
+    handler.rotator = _gzip_rotate
+    return handler
+
+
+def _attach(log_queue, levels: Dict[str, object]):
+    """Point each channel's logger at the queue"""
+    for channel, (name, _, _, _) in CHANNELS.items():
+        logger = logging.getLogger(name)
+        handler = ChannelQueueHandler(log_queue, channel)
+        logger.addHandler(handler)
+        logger.setLevel(levels[channel])
+        if name:
+            logger.propagate = False
+        _queue_handlers.append((logger, handler))
+
+
+def process_log_file(filename: str, name: Optional[str]) -> str:
+    """Channel file for a process that logs on its own, e.g. scraper.log -> scraper-<name>.log"""
+    if not name:
+        return filename
+    base, ext = os.path.splitext(filename)
+    return f"{base}-{name}{ext}"
+
+
+def configure_logging(console: bool = True, name: Optional[str] = None):
+    """Send every channel through the queue to its file (and the console).
+    With `name`, each channel gets a file of its own for this process (see
+    process_log_file), so separate processes never write or rotate the same
+    file. Only the first call in a process does anything."""
+    global _configured, _router
+    with _lock:
+        if _configured:
+            return
+        _configured = True
+        _router = ChannelRouter()
+        for channel, (_, filename, _, line_format) in CHANNELS.items():
+            handlers = [rotating_file_handler(process_log_file(filename, name))]
+            if console:
+                handlers.append(logging.StreamHandler())
+            for handler in handlers:
+                handler.setFormatter(logging.Formatter(line_format))
+            _router.channels[channel].extend(handlers)
+
+        log_queue = queue.SimpleQueue()
+        _attach(log_queue, {channel: level for channel, (_, _, level, _) in CHANNELS.items()})
+        listener = QueueListener(log_queue, _router)
+        listener.start()
+        _listeners.append(listener)
+    atexit.register(stop_logging)
+
+
+def add_log_handler(handler: logging.Handler, channel: str = 'scraper'):
+    """Have the log thread pass a channel's records to `handler` too"""
+    configure_logging()
+    if handler.formatter is None:
+        handler.setFormatter(logging.Formatter(CHANNELS[channel][3]))
+    _router.channels[channel].append(handler)
+
+
+def set_log_level(channel: str, level):
+    """Change the level of one channel, e.g. set_log_level('access', 'WARNING')"""
+    logging.getLogger(CHANNELS[channel][0]).setLevel(level)
+
+
+def worker_log_queue():
+    """Queue for child processes to log through (see configure_worker_logging);
+    its records are written by this process like its own"""
+    global _worker_queue
+    configure_logging()
+    with _lock:
+        if _worker_queue is None:
+            _worker_queue = multiprocessing.get_context('spawn').Queue()
+            listener = QueueListener(_worker_queue, _router)
+            listener.start()
+            _listeners.append(listener)
+    return _worker_queue
+
+
+def configure_worker_logging(log_queue, levels: Optional[Dict[str, object]] = None):
+    """In a child process, send every channel to the parent through `log_queue`
+    instead of opening the log files a second time"""
+    global _configured
+    with _lock:
+        _configured = True
+        levels = levels or {channel: level for channel, (_, _, level, _) in CHANNELS.items()}
+        _attach(log_queue, levels)
+
+
+def channel_levels() -> Dict[str, int]:
+    """Current level of every channel, to hand on to child processes"""
+    return {channel: logging.getLogger(name).level for channel, (name, _, _, _) in CHANNELS.items()}
+
+
+def stop_logging():
+    """Write out everything still queued and close the log files"""
+    global _configured, _router, _worker_queue
+    with _lock:
+        for logger, handler in _queue_handlers:
+            logger.removeHandler(handler)
+        _queue_handlers.clear()
+        for listener in _listeners:
+            listener.stop()
+        _listeners.clear()
+        if _router:
+            _router.close()
+        _router = None
+        _worker_queue = None
+        _configured = False
@@ -0,0 +1,196 @@
+"""
+Pipeline metrics for the PakWheels scraper
+
+Each stage of a scrape records how long it took for every page into a
+histogram: fetch (request until headers), decode (reading the body), parse,
+extract, validate, enrich and write. Time to first byte is kept in its own
+histogram, as it overlaps the fetch stage. Counters track pages, listings,
+rows and bytes, both decoded and as they came over the wire. One
+process-wide registry (METRICS) collects them for every scraper and job;
+/metrics serves it in the Prometheus text format and
+`pakwheels_scraper.py --profile` prints it as a per-stage report.
+"""
+
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from config import METRICS_BUCKETS
+
+STAGES = ['fetch', 'decode', 'parse', 'extract', 'validate', 'enrich', 'write']
+
+PREFIX = 'pakwheels'
+
+# Counter name -> help text
+COUNTERS = {
+    'pages': 'Results pages handled, by outcome',
+    'listings': 'Listings found on results pages, by whether they passed validation',
+    'rows_written': 'Rows written to CSV output',
+    'bytes_fetched': 'Response body bytes fetched, after decompression',
+    'bytes_on_wire': 'Response body bytes received over the network, before decompression, by transport',
+}
+
+# Histograms of timings other than pipeline stages: name -> help text
+HISTOGRAMS = {
+    'ttfb': 'Time from sending a page request until its response headers arrived (final attempt only)',
+}
+
+
+class Histogram:
+    """Cumulative-bucket histogram as Prometheus expects it"""
+
+    def __init__(self, buckets: Sequence[float] = METRICS_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Estimated quantile, interpolating within the bucket it falls in"""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                lower = self.buckets[i - 1] if i else 0.0
+                upper = self.buckets[i] if i < len(self.buckets) else self.buckets[-1]
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+        return self.buckets[-1]
+
+
+def _labels(labels: Dict[str, object]) -> str:
+    if not labels:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+               for value in labels.values())
+    return '{' + ','.join(f'{key}="{value}"' for key, value in zip(labels, escaped)) + '}'
+
+
+def render_metric(name: str, kind: str, help_text: str,
+                  samples: Iterable[Tuple[Dict[str, object], float]]) -> str:
+    """One metric family in the Prometheus text exposition format"""
+    lines = [f"# HELP {PREFIX}_{name} {help_text}", f"# TYPE {PREFIX}_{name} {kind}"]
+    lines.extend(f"{PREFIX}_{name}{_labels(labels)} {value:g}" for labels, value in samples)
+    return '\n'.join(lines) + '\n'
+
+
+def render_host_metrics(hosts: Dict[str, Dict[str, float]]) -> str:
+    """Per-host request counters and current rate, from HostRateLimiter.metrics()"""
+    return ''.join([
+        render_metric('http_requests_total', 'counter', 'HTTP requests sent, by host and outcome',
+                      [({'host': host, 'outcome': outcome}, stats[outcome])
+                       for host, stats in hosts.items() for outcome in ('ok', 'throttled', 'errors')]),
+        render_metric('http_retries_total', 'counter', 'HTTP requests retried, by host',
+                      [({'host': host}, stats['retries']) for host, stats in hosts.items()]),
+        render_metric('rate_limit_wait_seconds_total', 'counter', 'Time spent waiting for the rate limiter, by host',
+                      [({'host': host}, stats['wait_seconds']) for host, stats in hosts.items()]),
+        render_metric('rate_limit', 'gauge', 'Current requests per second allowed, by host (0 = unlimited)',
+                      [({'host': host}, stats['rate']) for host, stats in hosts.items()]),
+    ])
+
+
+class MetricsRegistry:
+    """Thread-safe stage histograms and labelled counters"""
+
+    def __init__(self, buckets: Sequence[float] = METRICS_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.stages: Dict[str, Histogram] = {stage: Histogram(self.buckets) for stage in STAGES}
+        self.histograms: Dict[str, Histogram] = {name: Histogram(self.buckets) for name in HISTOGRAMS}
+        self.counters: Dict[str, Dict[Tuple[Tuple[str, str], ...], float]] = {name: {} for name in COUNTERS}
+        self._lock = threading.Lock()
+
+    def observe(self, stage: str, seconds: float):
+        with self._lock:
+            histogram = self.stages.get(stage)
+            if histogram is None:
+                histogram = self.stages[stage] = Histogram(self.buckets)
+            histogram.observe(seconds)
+
+    def observe_value(self, name: str, seconds: float):
+        """Record a timing into one of the HISTOGRAMS"""
+        with self._lock:
+            self.histograms[name].observe(seconds)
+
+    def observe_many(self, timings: Optional[Dict[str, float]]):
+        """Record a page's {stage: seconds}, e.g. as timed in a parser process"""
+        for stage, seconds in (timings or {}).items():
+            self.observe(stage, seconds)
+
+    @contextmanager
+    def timer(self, stage: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+    def inc(self, name: str, amount: float = 1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self.counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + amount
+
+    def render(self) -> str:
+        """Everything recorded, in the Prometheus text exposition format"""
+        with self._lock:
+            stages = {stage: (list(h.counts), h.sum, h.count) for stage, h in self.stages.items()}
+            histograms = {name: (list(h.counts), h.sum, h.count) for name, h in self.histograms.items()}
+            counters = {name: dict(series) for name, series in self.counters.items()}
+
+        output = self._render_histogram('stage_seconds', 'Time spent on one page in each pipeline stage',
+                                        [({'stage': stage}, values) for stage, values in stages.items()])
+        for name, values in histograms.items():
+            output += self._render_histogram(f"{name}_seconds", HISTOGRAMS[name], [({}, values)])
+
+        for name, series in counters.items():
+            output += render_metric(f"{name}_total", 'counter', COUNTERS.get(name, name),
+                                    [(dict(key), value) for key, value in sorted(series.items())])
+        return output
+
+    def _render_histogram(self, name: str, help_text: str, series: List[Tuple[Dict[str, str], tuple]]) -> str:
+        lines = [f"# HELP {PREFIX}_{name} {help_text}", f"# TYPE {PREFIX}_{name} histogram"]
+        for labels, (counts, _, _) in series:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                le = '+Inf' if bound == float('inf') else f"{bound:g}"
+                lines.append(f"{PREFIX}_{name}_bucket{_labels(dict(labels, le=le))} {cumulative:g}")
+        for labels, (_, total, count) in series:
+            lines.append(f"{PREFIX}_{name}_sum{_labels(labels)} {total:g}")
+            lines.append(f"{PREFIX}_{name}_count{_labels(labels)} {count:g}")
+        return '\n'.join(lines) + '\n'
+
+    def report(self) -> str:
+        """Per-stage timing table for the command line"""
+        with self._lock:
+            stages = [(stage, h.count, h.sum, h.quantile(0.5), h.quantile(0.95))
+                      for stage, h in self.stages.items() if h.count]
+            histograms = [(name, h.count, h.quantile(0.5), h.quantile(0.95))
+                          for name, h in self.histograms.items() if h.count]
+            counters = {name: dict(series) for name, series in self.counters.items()}
+        total = sum(seconds for _, _, seconds, _, _ in stages) or 1
+        lines = [f"{'stage':<10} {'count':>7} {'total s':>9} {'mean ms':>9} {'p50 ms':>8} {'p95 ms':>8} {'share':>6}"]
+        for stage, count, seconds, p50, p95 in stages:
+            lines.append(f"{stage:<10} {count:>7} {seconds:>9.2f} {seconds / count * 1000:>9.1f} "
+                         f"{p50 * 1000:>8.1f} {p95 * 1000:>8.1f} {seconds / total:>6.0%}")
+        for name, count, p50, p95 in histograms:
+            lines.append(f"{name}: {count} requests, p50 {p50 * 1000:.1f} ms, p95 {p95 * 1000:.1f} ms")
+        for name, series in counters.items():
+            if series:
+                values = ', '.join(f"{'/'.join(v for _, v in key) or 'total'} {value:g}"
+                                   for key, value in sorted(series.items()))
+                lines.append(f"{name}: {values}")
+        return '\n'.join(lines)
+
+
+# Shared by every scraper in the process, so /metrics covers all jobs
+METRICS = MetricsRegistry()
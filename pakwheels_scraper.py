@@ -5,299 +5,614 @@ This script scrapes car listing data from PakWheels website across multiple page
 and extracts car details like model, color, transmission, mileage, year, and registration city.
 """
 
-import requests
-from bs4 import BeautifulSoup
-import csv
+import argparse
+import cProfile
+import math
+import os
 import time
 import logging
 import json
-from typing import List, Dict, Optional
+import pstats
+from typing import Callable, List, Dict, NamedTuple, Optional, Iterable, Iterator, Tuple, TypeVar
 import sys
+from collections import deque
+from contextlib import closing
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
 from urllib.parse import urljoin, urlparse
 
 from config import *
 from utils import *
+from throttle import HostRateLimiter
+from transport import TRANSPORTS, get_transport
+from http_cache import CACHE_MODES, ResponseCache
+from parsers import LISTING_SELECTORS, ParsedPage, Pagination, get_parser
+from extraction import EXTRACTOR
+from catalog import catalog_store
+from storage import CarDatabase, StreamingCSVWriter, read_listings, write_csv
+from exporters import EXPORTERS, ExportWriter, export_filename, parse_formats, write_export
+from checkpoints import CheckpointStore
+from enrichment import ENRICH_MODES, DetailEnricher
+from listing_index import NEW, CHANGED, UNCHANGED, ListingIndex
+from logs import channel_levels, configure_worker_logging, worker_log_queue
+from metrics import METRICS, MetricsRegistry
+from records import MISSING, CarListing, normalize_listing, parse_int
+
+T = TypeVar('T')
+
+class PageResult(NamedTuple):
+    """Car data from one results page and what the page says about the rest"""
+    cars: List[CarListing]
+    listings: Optional[int] = None  # listings on the page; None if it couldn't be fetched or parsed
+    last_page: Optional[int] = None
+    timings: Optional[Dict[str, float]] = None  # seconds spent in each stage, from wherever the page was parsed
 
 class PakWheelsScraper:
-    def __init__(self):
+    def __init__(self, concurrency: int = CONCURRENT_REQUESTS, rate_limit: float = RATE_LIMIT,
+                 parser_backend: str = PARSER_BACKEND, cache_mode: str = HTTP_CACHE_MODE,
+                 parse_workers: int = PARSE_WORKERS, rate_limiter: Optional[HostRateLimiter] = None,
+                 retries: int = MAX_RETRIES, adaptive: bool = ADAPTIVE_RATE_LIMIT,
+                 metrics: Optional[MetricsRegistry] = None, transport: str = HTTP_TRANSPORT,
+                 pool_size: int = HTTP_POOL_SIZE):
         self.logger = setup_logging()
-        self.session = requests.Session()
-        self.session.headers.update(HEADERS)
+        self.metrics = metrics or METRICS
+        self.parser = get_parser(parser_backend)
+        self.extractor = EXTRACTOR
+        self.concurrency = max(1, concurrency)
+        self.parse_workers = max(0, parse_workers)
+        # A limiter passed in is shared with other scrapers (see jobs.JobManager)
+        self.rate_limiter = rate_limiter or HostRateLimiter.from_config(rate_limit, adaptive)
+        
+        if cache_mode not in CACHE_MODES:
+            self.logger.warning(f"Unknown cache mode '{cache_mode}', caching disabled")
+            cache_mode = 'off'
+        self.cache = ResponseCache() if cache_mode != 'off' else None
+        # Search pages and detail-page enrichment share the connection pool
+        self.transport = get_transport(transport, self.rate_limiter, self.cache, replay=cache_mode == 'replay',
+                                       retries=retries, pool_size=pool_size or self.concurrency + ENRICH_CONCURRENCY)
         self.scraped_data = []
+        self.change_counts = {NEW: 0, CHANGED: 0, UNCHANGED: 0}
+        self.enrich_stats = None
+        self.last_page = MAX_PAGES
         
-    def get_page(self, url: str) -> Optional[BeautifulSoup]:
-        """Fetch and parse a single page"""
+    def download(self, url: str, consume: Callable[[Iterable[bytes]], T],
+                 timings: Optional[Dict[str, float]] = None) -> Optional[T]:
+        """Download a page, handing its body to `consume` in chunks as they arrive.
+        Returns what `consume` made of it, or None if the download failed; the
+        time `consume` spent on it is added to `timings` as 'parse'."""
         try:
-            self.logger.info(f"Fetching URL: {url}")
-            response = self.session.get(url, timeout=TIMEOUT)
-            response.raise_for_status()
-            
-            soup = BeautifulSoup(response.content, 'html.parser')
-            return soup
+            self.logger.debug(f"Fetching URL: {url}")
+            # Time to the headers and time reading the body are measured apart
+            with self.metrics.timer('fetch'):
+                download = self.transport.open(url)
+            with download:
+                start = time.perf_counter()
+                result = consume(download.iter_bytes())
+                elapsed = time.perf_counter() - start
+            self.metrics.observe('decode', download.read_seconds)
+            if timings is not None:
+                timings['parse'] = elapsed - download.read_seconds
+            self.metrics.inc('bytes_fetched', download.size)
+            self.metrics.inc('bytes_on_wire', download.wire_bytes, transport=self.transport.name)
+            if download.ttfb is not None:
+                self.metrics.observe_value('ttfb', download.ttfb)
+            self.logger.debug(f"Fetched {url} over {download.http_version}: {download.wire_bytes:,} bytes on the "
+                              f"wire, {download.size:,} decoded"
+                              + (f", first byte after {download.ttfb * 1000:.0f} ms" if download.ttfb is not None else ""))
+            return result
             
-        except requests.RequestException as e:
+        except self.transport.errors as e:
             self.logger.error(f"Error fetching {url}: {str(e)}")
             return None
+    
+    def fetch_page(self, url: str) -> Optional[bytes]:
+        """Download a single page and return its raw bytes"""
+        return self.download(url, b''.join)
+    
+    def get_page(self, url: str, timings: Optional[Dict[str, float]] = None) -> Optional[ParsedPage]:
+        """Fetch a single page, parsing its listings as the body streams in and
+        adding the parse time to `timings`"""
+        try:
+            return self.download(url, self.parser.parse_stream, timings)
         except Exception as e:
             self.logger.error(f"Unexpected error parsing {url}: {str(e)}")
             return None
     
-    def extract_car_details(self, car_element) -> Optional[Dict[str, str]]:
+    def extract_car_details(self, car_element) -> Optional[CarListing]:
         """Extract car details from a car listing element"""
         try:
-            car_data = {
-                'Car Model': 'N/A',
-                'Color': 'N/A',
-                'Transmission': 'N/A',
-                'Mileage': 'N/A',
-                'Model Year': 'N/A',
-                'Registration City': 'N/A',
-                'Price': 'N/A',
-                'URL': 'N/A'
-            }
+            car = CarListing(model='')
             
             # First try to extract from JSON-LD structured data
-            json_script = car_element.find('script', {'type': 'application/ld+json'})
-            if json_script and json_script.string:
+            json_ld = car_element.json_ld()
+            if json_ld:
                 try:
-                    json_data = json.loads(json_script.string.strip())
+                    json_data = json.loads(json_ld.strip())
                     
                     # Extract basic info from JSON-LD
                     if json_data.get('name'):
-                        car_data['Car Model'] = clean_text(json_data['name'])
+                        car.model = json_data['name']
                     
                     if json_data.get('modelDate'):
-                        car_data['Model Year'] = str(json_data['modelDate'])
+                        car.year = parse_int(json_data['modelDate'])
                     
                     if json_data.get('vehicleTransmission'):
-                        car_data['Transmission'] = json_data['vehicleTransmission']
+                        car.transmission = json_data['vehicleTransmission']
                     
                     if json_data.get('mileageFromOdometer'):
-                        mileage_text = json_data['mileageFromOdometer']
-                        mileage = extract_mileage(mileage_text)
-                        if mileage:
-                            car_data['Mileage'] = mileage
-                        else:
-                            car_data['Mileage'] = mileage_text
+                        mileage_text = str(json_data['mileageFromOdometer'])
+                        car.mileage_km = parse_int(extract_mileage(mileage_text) or mileage_text)
                     
                     if json_data.get('offers') and json_data['offers'].get('price'):
-                        price = json_data['offers']['price']
-                        car_data['Price'] = f"PKR {price:,}"
+                        car.price_pkr = parse_int(json_data['offers']['price'])
                     
                     if json_data.get('offers') and json_data['offers'].get('url'):
-                        car_data['URL'] = json_data['offers']['url']
+                        car.url = json_data['offers']['url']
                     
-                    # Try to extract color from JSON-LD description with context validation
-                    description = json_data.get('description', '').lower()
-                    import re
-                    # Look for color mentioned with proper context
-                    color_patterns = [
-                        r'(white|black|silver|grey|gray|red|blue|green|yellow|brown|gold|beige|maroon|pearl)\s*(?:color|colour)',
-                        r'(?:color|colour):\s*(white|black|silver|grey|gray|red|blue|green|yellow|brown|gold|beige|maroon|pearl)',
-                    ]
+                    # Color stated in the description, and the city from description or URL
+                    description = json_data.get('description', '')
+                    color = self.extractor.find_color_phrase(description)
+                    if color:
+                        car.color = color
                     
-                    for pattern in color_patterns:
-                        match = re.search(pattern, description)
-                        if match:
-                            car_data['Color'] = match.group(1).title()
-                            break
-                    
-                    # Extract registration city from description or URL
-                    cities = ['islamabad', 'karachi', 'lahore', 'rawalpindi', 'faisalabad',
-                             'multan', 'peshawar', 'quetta', 'sialkot', 'gujranwala', 'hyderabad']
-                    for city in cities:
-                        if city in description or (car_data['URL'] and city in car_data['URL'].lower()):
-                            car_data['Registration City'] = city.title()
-                            break
+                    city = self.extractor.find_city(description, car.url)
+                    if city:
+                        car.city = city
                         
                 except (json.JSONDecodeError, AttributeError, KeyError) as e:
                     self.logger.debug(f"Could not parse JSON-LD data: {e}")
             
-            # Fix URL formatting if malformed
-            if car_data['URL'] != 'N/A':
-                url = car_data['URL']
-                if not url.startswith('http'):
-                    if url.startswith('www.pakwheels.com'):
-                        car_data['URL'] = 'https://' + url
-                    elif 'pakwheels.com' in url:
-                        # Handle malformed URLs like 'httpswww.pakwheels.com...'
-                        car_data['URL'] = 'https://www.pakwheels.com' + url.split('pakwheels.com')[-1]
-            
             # Extract color from HTML content more accurately
-            if car_data['Color'] == 'N/A':
-                # Look for color-specific elements in the car listing
-                color_found = False
-                
-                # Check for color in detailed specifications sections
-                spec_sections = car_element.find_all(['ul', 'div', 'span'], 
-                    class_=lambda x: x and any(word in str(x).lower() for word in ['detail', 'spec', 'info', 'feature']))
-                
-                colors = {
-                    'white': ['white', 'safed'], 'black': ['black', 'kala'], 
-                    'silver': ['silver', 'chandi'], 'grey': ['grey', 'gray', 'slaiti'],
-                    'red': ['red', 'lal', 'maroon'], 'blue': ['blue', 'neela', 'navy'],
-                    'green': ['green', 'hara'], 'yellow': ['yellow', 'peela'],
-                    'brown': ['brown', 'bhura'], 'gold': ['gold', 'sona'],
-                    'beige': ['beige', 'cream'], 'pearl': ['pearl']
-                }
-                
-                for section in spec_sections:
-                    section_text = section.get_text(strip=True).lower()
-                    for color_name, variants in colors.items():
-                        for variant in variants:
-                            if variant in section_text and not color_found:
-                                # Verify it's actually about color, not just containing the word
-                                color_context = ['color', 'colour', 'rang', 'painted', 'finish']
-                                if any(ctx in section_text for ctx in color_context) or len(section_text) < 50:
-                                    car_data['Color'] = color_name.title()
-                                    color_found = True
-                                    break
-                        if color_found:
-                            break
-                    if color_found:
-                        break
-                
-                # If still not found, check the full listing text with stricter matching
-                if not color_found:
-                    full_text = car_element.get_text(strip=True).lower()
-                    # Look for color mentioned near relevant keywords
-                    import re
-                    color_patterns = [
-                        r'(white|black|silver|grey|gray|red|blue|green|yellow|brown|gold|beige|pearl)\s*(?:color|colour|painted)',
-                        r'(?:color|colour):\s*(white|black|silver|grey|gray|red|blue|green|yellow|brown|gold|beige|pearl)',
-                        r'(white|black|silver|grey|gray|red|blue|green|yellow|brown|gold|beige|pearl)\s*(?:exterior|body)',
-                    ]
-                    
-                    for pattern in color_patterns:
-                        match = re.search(pattern, full_text)
-                        if match:
-                            car_data['Color'] = match.group(1).title()
-                            break
+            if car.color is None:
+                # Check detailed specification sections first, then the full listing
+                # text with stricter matching
+                color = (self.extractor.find_color_in_sections(car_element.spec_texts())
+                         or self.extractor.find_color_phrase(car_element.text()))
+                if color:
+                    car.color = color
             
-            return normalize_car_data(car_data)
+            # Each field gets the cleaner for its kind of value; URLs keep their ':' and '/'
+            return normalize_listing(car)
             
         except Exception as e:
             self.logger.error(f"Error extracting car details: {str(e)}")
             return None
     
-    def scrape_page(self, page_num: int, custom_url: Optional[str] = None) -> List[Dict[str, str]]:
-        """Scrape a single page and return list of car data"""
+    def page_url(self, page_num: int, custom_url: Optional[str] = None) -> str:
+        """URL of a results page for the configured or custom search"""
         if custom_url:
             base_url = custom_url
         else:
             base_url = BASE_URL
             
         if page_num == 1:
-            url = base_url
-        else:
-            # Handle pagination for filtered URLs
-            if base_url.endswith('/'):
-                url = f"{base_url}?page={page_num}"
-            else:
-                url = f"{base_url}/?page={page_num}"
-        
-        soup = self.get_page(url)
-        if not soup:
-            return []
+            return base_url
         
+        # Handle pagination for filtered URLs
+        if base_url.endswith('/'):
+            return f"{base_url}?page={page_num}"
+        else:
+            return f"{base_url}/?page={page_num}"
+    
+    def parse_content(self, content: bytes, timings: Optional[Dict[str, float]] = None) -> ParsedPage:
+        start = time.perf_counter()
+        page = self.parser.parse(content)
+        if timings is not None:
+            timings['parse'] = time.perf_counter() - start
+        return page
+    
+    def extract_page(self, page: ParsedPage, page_num: int,
+                     timings: Optional[Dict[str, float]] = None) -> List[CarListing]:
+        """Turn the listings of a parsed page into validated car data, adding the
+        time spent extracting and validating to `timings`"""
         cars_data = []
+        extract_time = validate_time = 0.0
+        log_sample = LOG_SAMPLE_EVERY if self.logger.isEnabledFor(logging.DEBUG) else 0
+        car_elements = page.listings
         
-        # Target the specific PakWheels car listing structure
-        car_elements = soup.select('li.classified-listing')
-        
-        if car_elements:
+        if not car_elements:
+            self.logger.warning(f"No car listings found on page {page_num}")
+            return []
+        elif page.selector == LISTING_SELECTORS[0]:
             self.logger.info(f"Found {len(car_elements)} car listings using PakWheels selector")
         else:
-            # Fallback selectors if the structure changes
-            fallback_selectors = [
-                'li[data-listing-id]',
-                '.search-results li',
-                '.classified-listing',
-                'li[id*="main_ad"]'
-            ]
-            
-            for selector in fallback_selectors:
-                car_elements = soup.select(selector)
-                if car_elements:
-                    self.logger.info(f"Found {len(car_elements)} car listings using fallback selector: {selector}")
-                    break
-            
-            if not car_elements:
-                self.logger.warning(f"No car listings found on page {page_num}")
-                return []
+            self.logger.info(f"Found {len(car_elements)} car listings using selector: {page.selector}")
         
         for idx, car_element in enumerate(car_elements):
             try:
+                start = time.perf_counter()
                 car_data = self.extract_car_details(car_element)
-                if car_data and validate_car_data(car_data):
+                extracted = time.perf_counter()
+                valid = car_data is not None and validate_listing(car_data)
+                validate_time += time.perf_counter() - extracted
+                extract_time += extracted - start
+                if valid:
                     cars_data.append(car_data)
-                    self.logger.info(f"Extracted car {idx + 1}: {car_data['Car Model']}")
-                else:
-                    self.logger.warning(f"Invalid or incomplete car data for listing {idx + 1}")
+                # Per-listing lines are sampled; every listing is counted in the metrics
+                if log_sample and idx % log_sample == 0:
+                    if valid:
+                        self.logger.debug(f"Extracted car {idx + 1}: {car_data.model}")
+                    else:
+                        self.logger.debug(f"Invalid or incomplete car data for listing {idx + 1}")
                     
             except Exception as e:
                 self.logger.error(f"Error processing car listing {idx + 1}: {str(e)}")
                 continue
         
-        self.logger.info(f"Page {page_num}: Successfully extracted {len(cars_data)} car listings")
+        if timings is not None:
+            timings['extract'] = extract_time
+            timings['validate'] = validate_time
+        invalid = len(car_elements) - len(cars_data)
+        self.logger.info(f"Page {page_num}: Successfully extracted {len(cars_data)} car listings"
+                         + (f" ({invalid} invalid)" if invalid else ""))
         return cars_data
     
-    def scrape_multiple_pages(self, max_pages: int = MAX_PAGES, custom_url: Optional[str] = None) -> List[Dict[str, str]]:
-        """Scrape multiple pages and return all car data"""
-        all_cars_data = []
+    def last_page_of(self, pagination: Pagination, page_num: int, listings: int) -> Optional[int]:
+        """Last results page of the search, going by what one of its pages says"""
+        if pagination.last_page:
+            return max(pagination.last_page, page_num)
+        if pagination.total_results is not None and listings:
+            # A short last page overestimates the count, which only costs one empty fetch
+            return max(math.ceil(pagination.total_results / listings), page_num)
+        if pagination.has_next is False:
+            return page_num
+        return None
+    
+    def page_result(self, page: Optional[ParsedPage], page_num: int,
+                    timings: Optional[Dict[str, float]] = None) -> PageResult:
+        """Extract a parsed page's car data along with where the results end"""
+        if page is None:
+            return PageResult([])
+        timings = {} if timings is None else timings
+        cars_data = self.extract_page(page, page_num, timings)
+        listings = len(page.listings)
+        return PageResult(cars_data, listings, self.last_page_of(page.pagination, page_num, listings), timings)
+    
+    def scrape_page_result(self, page_num: int, custom_url: Optional[str] = None) -> PageResult:
+        """Scrape a single page, keeping its pagination details"""
+        timings = {}
+        page = self.get_page(self.page_url(page_num, custom_url), timings)
+        return self.page_result(page, page_num, timings)
+    
+    def scrape_page(self, page_num: int, custom_url: Optional[str] = None) -> List[CarListing]:
+        """Scrape a single page and return list of car data"""
+        return self.scrape_page_result(page_num, custom_url).cars
+    
+    def _scrape_page_safe(self, page_num: int, custom_url: Optional[str] = None) -> PageResult:
+        """Scrape a page, logging and swallowing any error so one bad page doesn't stop the run"""
+        try:
+            return self.scrape_page_result(page_num, custom_url)
+        except Exception as e:
+            self.logger.error(f"Error scraping page {page_num}: {str(e)}")
+            return PageResult([])
+    
+    def scrape_first_page(self, custom_url: Optional[str] = None) -> PageResult:
+        """Scrape a search's first page on its own, e.g. to see how deep its results go"""
+        result = self._scrape_page_safe(1, custom_url)
+        self._check_page(1, result, None)
+        return result
+    
+    def _submit_pipelined(self, page_num: int, custom_url: Optional[str],
+                          fetch_pool: ThreadPoolExecutor, parse_pool: ProcessPoolExecutor) -> Future:
+        """Download a page on a fetch thread, then hand its bytes to a parser process.
         
-        for page_num in range(1, max_pages + 1):
-            self.logger.info(f"Scraping page {page_num} of {max_pages}")
-            
+        The returned future resolves to the page's PageResult.
+        """
+        result = Future()
+        
+        def parsed(parse_future):
+            if result.cancelled():
+                return
             try:
-                page_data = self.scrape_page(page_num, custom_url)
-                all_cars_data.extend(page_data)
-                
-                self.logger.info(f"Page {page_num} completed. Total cars scraped so far: {len(all_cars_data)}")
-                
-                # Add delay between requests
-                if page_num < max_pages:
-                    time.sleep(REQUEST_DELAY)
-                    
+                result.set_result(parse_future.result())
             except Exception as e:
-                self.logger.error(f"Error scraping page {page_num}: {str(e)}")
-                continue
+                result.set_exception(e)
         
-        return all_cars_data
+        def fetched(fetch_future):
+            if result.cancelled():
+                return
+            try:
+                content = fetch_future.result()
+                if content is None:
+                    result.set_result(PageResult([]))
+                else:
+                    parse_pool.submit(parse_page_content, content, page_num).add_done_callback(parsed)
+            except Exception as e:
+                result.set_exception(e)
+        
+        fetch_pool.submit(self.fetch_page, self.page_url(page_num, custom_url)).add_done_callback(fetched)
+        return result
+    
+    def on_page_done(self, page_num: int, cars_data: List[CarListing]):
+        """Called in page order as each page's results are handed back"""
+    
+    def on_page_count(self, last_page: int):
+        """Called when the search turns out to end before the requested page count"""
     
-    def save_to_csv(self, data: List[Dict[str, str]], filename: str = OUTPUT_FILE):
-        """Save scraped data to CSV file"""
+    def _check_page(self, page_num: int, result: PageResult,
+                    previous_urls: Optional[set]) -> Tuple[List[CarListing], bool]:
+        """Update the page limit from a page's pagination and decide whether it is
+        the last page. Returns the car data to hand on and whether to stop."""
+        self.metrics.observe_many(result.timings)
+        self.metrics.inc('pages', outcome='failed' if result.listings is None else 'ok')
+        if result.listings:
+            self.metrics.inc('listings', len(result.cars), outcome='valid')
+            self.metrics.inc('listings', result.listings - len(result.cars), outcome='invalid')
+        if result.listings is None:
+            # Fetch or parse failed; that says nothing about where the results end
+            return result.cars, False
+        if result.listings == 0:
+            self.logger.info(f"Page {page_num} has no listings, stopping")
+            return result.cars, True
+        if result.cars and {car.url for car in result.cars} == previous_urls:
+            # Some searches answer pages past the end with the last page again
+            self.logger.info(f"Page {page_num} repeats page {page_num - 1}, stopping")
+            return [], True
+        learned = catalog_store().learn(car.model for car in result.cars)
+        if learned:
+            self.logger.info(f"Catalog learned {learned} new makes, models or variants from page {page_num}")
+        if result.last_page and result.last_page < self.last_page:
+            self.last_page = result.last_page
+            self.logger.info(f"Search results end at page {self.last_page}")
+            self.on_page_count(self.last_page)
+        return result.cars, page_num >= self.last_page
+    
+    def iter_pages(self, max_pages: int = MAX_PAGES, custom_url: Optional[str] = None,
+                   start_page: int = 1, previous_urls: Optional[set] = None) -> Iterator[Tuple[int, List[CarListing]]]:
+        """Yield (page number, car data) for each page in page order.
+        
+        Up to `concurrency` pages are fetched at a time. With `parse_workers`,
+        fetch threads only download bytes and parsing runs in a process pool,
+        so the GIL-bound parsing doesn't hold up the network.
+        
+        Iteration stops early at the last page the search reports, at the
+        first page with no listings, or at a page repeating the one before.
+        The first page is fetched on its own, so a short search doesn't
+        spend requests on pages past its end. When starting past page 1,
+        `previous_urls` are the listing URLs of the page before `start_page`,
+        so that the first page fetched is checked for a repeat as well.
+        """
+        self.last_page = max_pages
+        
+        if self.concurrency == 1 and not self.parse_workers:
+            page_num = start_page
+            while page_num <= self.last_page:
+                self.logger.info(f"Scraping page {page_num} of {self.last_page}")
+                result = self._scrape_page_safe(page_num, custom_url)
+                cars_data, finished = self._check_page(page_num, result, previous_urls)
+                previous_urls = {car.url for car in result.cars}
+                self.on_page_done(page_num, cars_data)
+                yield page_num, cars_data
+                if finished:
+                    return
+                page_num += 1
+            return
+        
+        fetch_pool = ThreadPoolExecutor(max_workers=self.concurrency)
+        parse_pool = None
+        if self.parse_workers:
+            parse_pool = ProcessPoolExecutor(
+                max_workers=self.parse_workers,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=init_parse_worker,
+                initargs=(self.parser.name, logging.root.manager.disable, worker_log_queue(), channel_levels()),
+            )
+            submit = lambda page_num: self._submit_pipelined(page_num, custom_url, fetch_pool, parse_pool)
+        else:
+            submit = lambda page_num: fetch_pool.submit(self._scrape_page_safe, page_num, custom_url)
+        
+        # Pages in flight form a bounded queue: nothing new is fetched until the
+        # consumer takes the oldest page, so downloaded-but-unparsed bytes can't
+        # pile up. The window is a little larger than the workers to keep them busy.
+        window = (self.concurrency + self.parse_workers) * 2
+        pending = deque()
+        next_page = start_page
+        
+        def next_result():
+            done_page, future = pending.popleft()
+            try:
+                result = future.result()
+            except Exception as e:
+                self.logger.error(f"Error scraping page {done_page}: {str(e)}")
+                result = PageResult([])
+            return done_page, result
+        
+        try:
+            while next_page <= self.last_page or pending:
+                # Only the first page goes out until its pagination is known
+                limit = window if next_page > start_page else 1
+                while next_page <= self.last_page and len(pending) < limit:
+                    self.logger.info(f"Scraping page {next_page} of {self.last_page}")
+                    pending.append((next_page, submit(next_page)))
+                    next_page += 1
+                
+                done_page, result = next_result()
+                cars_data, finished = self._check_page(done_page, result, previous_urls)
+                previous_urls = {car.url for car in result.cars}
+                self.on_page_done(done_page, cars_data)
+                yield done_page, cars_data
+                if finished:
+                    return
+                # Drop pages already queued past a newly learned end
+                while pending and pending[-1][0] > self.last_page:
+                    pending.pop()[1].cancel()
+        finally:
+            # The consumer may stop early; don't fetch pages nobody will read
+            for _, future in pending:
+                future.cancel()
+            fetch_pool.shutdown(wait=True, cancel_futures=True)
+            if parse_pool:
+                parse_pool.shutdown(wait=True, cancel_futures=True)
+    
+    def scrape_multiple_pages(self, max_pages: int = MAX_PAGES, custom_url: Optional[str] = None) -> Iterator[CarListing]:
+        """Scrape multiple pages, yielding car data as each page completes"""
+        for page_num, page_data in self.iter_pages(max_pages, custom_url):
+            yield from page_data
+    
+    def select_rows(self, page_data: List[CarListing], index: ListingIndex, seen_ids: set,
+                    incremental: bool = False) -> List[CarListing]:
+        """Drop listings already written in this run and record the rest in the index.
+        
+        With `incremental`, only new or changed listings are kept.
+        """
+        fresh = []
+        for row in page_data:
+            row_id = row.listing_id
+            if row_id is None or row_id not in seen_ids:
+                fresh.append(row)
+                if row_id is not None:
+                    seen_ids.add(row_id)
+        
+        rows = []
+        for row, label in zip(fresh, index.classify(fresh)):
+            self.change_counts[label] += 1
+            if label != UNCHANGED or not incremental:
+                rows.append(row)
+        return rows
+    
+    def scrape_to_csv(self, max_pages: int = MAX_PAGES, custom_url: Optional[str] = None,
+                      filename: str = OUTPUT_FILE, resume: bool = False, incremental: bool = False,
+                      enrich: str = ENRICH_DETAILS, exports: Iterable[str] = EXPORT_FORMATS) -> int:
+        """Scrape multiple pages, streaming each page's rows to a CSV as it completes.
+        
+        Every page is also saved to the listings database. Every finished page
+        is checkpointed, so with `resume` an interrupted run
+        of the same URL continues from its first missing page. With `incremental`
+        only listings that are new or changed since earlier runs are written, and
+        pagination stops at the first page holding nothing but known listings.
+        With `enrich` other than 'off', rows are filled in from their detail pages
+        before being saved. Each of `exports` (e.g. 'parquet') is written next to the CSV,
+        page by page as well. Returns the number of rows in the output. If nothing was scraped the
+        existing files are left alone.
+        """
+        base_url = custom_url or BASE_URL
+        writer = StreamingCSVWriter(filename)
+        exporters = [ExportWriter(export_filename(filename, fmt), fmt) for fmt in exports if fmt != 'csv']
+        checkpoints = CheckpointStore()
+        index = ListingIndex()
+        database = CarDatabase()
+        enricher = DetailEnricher(self.fetch_page, enrich) if enrich != 'off' else None
+        seen_ids = set()
+        pages_done = 0
+        self.change_counts = {NEW: 0, CHANGED: 0, UNCHANGED: 0}
         try:
-            with open(filename, 'w', newline='', encoding='utf-8') as csvfile:
-                writer = csv.DictWriter(csvfile, fieldnames=CSV_HEADERS)
-                writer.writeheader()
-                writer.writerows(data)
+            checkpoint = checkpoints.get(base_url) if resume else None
+            if checkpoint:
+                if checkpoint.output_file != writer.temp_filename:
+                    # The interrupted run wrote somewhere else; take over its partial file
+                    os.replace(checkpoint.output_file, writer.temp_filename)
+                start_page = checkpoint.last_page + 1
+                writer.open(checkpoint.offset, checkpoint.row_count)
+                # Listings the finished pages wrote still count as seen in this run
+                seen_ids.update(row.listing_id for row in read_listings(writer.temp_filename)
+                                if row.listing_id is not None)
+                self.logger.info(f"Resuming {base_url} from page {start_page} "
+                                 f"({checkpoint.row_count} cars already saved)")
+                # Exports can't be picked up mid-file; they're rebuilt from the CSV at the end
+                resumed_exports, exporters = exporters, []
+            else:
+                start_page = 1
+                checkpoints.clear(base_url)
+                checkpoints.clear_output(writer.temp_filename)
+                writer.open()
+                resumed_exports = []
+            for exporter in exporters:
+                exporter.open()
+            
+            try:
+                with closing(self.iter_pages(max_pages, custom_url, start_page)) as pages:
+                    for page_num, page_data in pages:
+                        pages_done += 1
+                        if enricher:
+                            with self.metrics.timer('enrich'):
+                                enricher.enrich(page_data)
+                        with self.metrics.timer('write'):
+                            rows = self.select_rows(page_data, index, seen_ids, incremental)
+                            writer.write_rows(rows)
+                            for exporter in exporters:
+                                exporter.write_rows(rows)
+                            # Unchanged listings still go to the database to refresh last_seen
+                            database.write_rows(page_data)
+                            checkpoints.record(base_url, page_num, writer.temp_filename, writer.offset,
+                                               writer.rows_written)
+                        self.metrics.inc('rows_written', len(rows))
+                        self.logger.info(f"Page {page_num} completed. Total cars scraped so far: {writer.rows_written}")
+                        
+                        if incremental and page_data and not rows:
+                            self.logger.info(f"Page {page_num} has only known listings, stopping")
+                            break
+            except BaseException:
+                writer.abort()
+                for exporter in exporters:
+                    exporter.abort()
+                raise
             
+            checkpoints.clear(base_url)
+        finally:
+            checkpoints.close()
+            index.close()
+            database.close()
+            if enricher:
+                enricher.close()
+        
+        self.logger.info(f"Listings: {self.change_counts[NEW]} new, {self.change_counts[CHANGED]} changed, "
+                         f"{self.change_counts[UNCHANGED]} unchanged")
+        for line in self.rate_limiter.report().splitlines():
+            self.logger.info(f"Requests to {line}")
+        if enricher:
+            self.enrich_stats = dict(enricher.stats)
+            self.logger.info(enricher.report(pages_done))
+        if writer.rows_written:
+            writer.close()
             self.logger.info(f"Data saved to {filename}")
+            for exporter in exporters:
+                exporter.close()
+                self.logger.info(f"Data saved to {exporter.filename}")
+            for exporter in resumed_exports:
+                write_export(read_listings(filename), exporter.filename, exporter.format)
+                self.logger.info(f"Data saved to {exporter.filename}")
+        else:
+            writer.discard()
+            for exporter in exporters:
+                exporter.discard()
+        return writer.rows_written
+    
+    def save_to_csv(self, data: List[CarListing], filename: str = OUTPUT_FILE,
+                    exports: Iterable[str] = EXPORT_FORMATS):
+        """Save scraped data to CSV file, and to each of `exports` next to it"""
+        try:
+            write_csv(data, filename)
+            self.logger.info(f"Data saved to {filename}")
+            for fmt in exports:
+                if fmt != 'csv':
+                    write_export(data, export_filename(filename, fmt), fmt)
+                    self.logger.info(f"Data saved to {export_filename(filename, fmt)}")
             
         except Exception as e:
             self.logger.error(f"Error saving data to CSV: {str(e)}")
     
-    def generate_summary(self, data: List[Dict[str, str]]):
+    def generate_summary(self, data: Iterable[CarListing]):
         """Generate and print summary of scraped data"""
-        if not data:
-            self.logger.info("No data to summarize")
-            return
-        
-        total_cars = len(data)
-        
-        # Count by transmission type
+        total_cars = 0
         transmission_counts = {}
-        for car in data:
-            transmission = car.get('Transmission', 'N/A')
-            transmission_counts[transmission] = transmission_counts.get(transmission, 0) + 1
-        
-        # Count by registration city
         city_counts = {}
+        
+        # Single pass so `data` can be a stream of rows read back from disk
         for car in data:
-            city = car.get('Registration City', 'N/A')
+            total_cars += 1
+            
+            # Count by transmission type
+            transmission = car.transmission or MISSING
+            transmission_counts[transmission] = transmission_counts.get(transmission, 0) + 1
+            
+            # Count by registration city
+            city = car.city or MISSING
             city_counts[city] = city_counts.get(city, 0) + 1
         
+        if not total_cars:
+            self.logger.info("No data to summarize")
+            return
+        
         print("\n" + "="*50)
         print("SCRAPING SUMMARY REPORT")
         print("="*50)
@@ -314,22 +629,21 @@ class PakWheelsScraper:
         
         print("="*50)
     
-    def run(self):
+    def run(self, resume: bool = False, incremental: bool = False, enrich: str = ENRICH_DETAILS,
+            exports: Iterable[str] = EXPORT_FORMATS):
         """Main method to run the scraper"""
         self.logger.info("Starting PakWheels scraper")
         self.logger.info(f"Target pages: {MAX_PAGES}")
         self.logger.info(f"Base URL: {BASE_URL}")
         
         try:
-            # Scrape data
-            all_data = self.scrape_multiple_pages()
+            # Scrape data, streaming it to CSV page by page
+            cars_saved = self.scrape_to_csv(resume=resume, incremental=incremental, enrich=enrich,
+                                            exports=exports)
             
-            if all_data:
-                # Save to CSV
-                self.save_to_csv(all_data)
-                
-                # Generate summary
-                self.generate_summary(all_data)
+            if cars_saved:
+                # Generate summary from the saved file
+                self.generate_summary(read_listings(OUTPUT_FILE))
                 
                 self.logger.info("Scraping completed successfully")
             else:
@@ -339,10 +653,78 @@ class PakWheelsScraper:
             self.logger.error(f"Fatal error during scraping: {str(e)}")
             sys.exit(1)
 
+# Scraper used by parse worker processes, set up once per process
+_parse_worker = None
+
+def init_parse_worker(parser_backend: str, disabled_log_level: int = logging.NOTSET, log_queue=None,
+                      log_levels: Optional[Dict[str, int]] = None):
+    """Process pool initializer: build the parser and extractor this process will use"""
+    global _parse_worker
+    # Spawned workers don't inherit logging.disable() from the parent, and
+    # log through it rather than writing to the same files
+    logging.disable(disabled_log_level)
+    if log_queue is not None:
+        configure_worker_logging(log_queue, log_levels)
+    _parse_worker = PakWheelsScraper(concurrency=1, parser_backend=parser_backend, cache_mode='off')
+
+def parse_page_content(content: bytes, page_num: int) -> PageResult:
+    """Parse one downloaded page into car data inside a worker process.
+    Stage timings travel back with the result, since this process's metrics are never read."""
+    timings = {}
+    page = _parse_worker.parse_content(content, timings)
+    return _parse_worker.page_result(page, page_num, timings)
+
+def export_formats(value: str) -> List[str]:
+    """argparse type for --export; the default from PAKWHEELS_EXPORTS goes through it too"""
+    try:
+        return parse_formats(value)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
 def main():
     """Main function"""
-    scraper = PakWheelsScraper()
-    scraper.run()
+    parser = argparse.ArgumentParser(description="Scrape PakWheels car listings to CSV")
+    parser.add_argument('--resume', action='store_true',
+                        help="continue an interrupted run from its first missing page")
+    parser.add_argument('--incremental', action='store_true',
+                        help="only save listings that are new or changed since earlier runs")
+    parser.add_argument('--enrich', choices=ENRICH_MODES, default=ENRICH_DETAILS,
+                        help="fetch listing detail pages to fill in missing fields ('missing') "
+                             "or to check every row ('all')")
+    parser.add_argument('--export', type=export_formats, default=','.join(EXPORT_FORMATS), metavar='FORMATS',
+                        help=f"also write these formats next to the CSV, comma separated, from "
+                             f"{', '.join(fmt for fmt in EXPORTERS if fmt != 'csv')}")
+    parser.add_argument('--cache', choices=CACHE_MODES, default=HTTP_CACHE_MODE,
+                        help="keep downloaded pages in a local cache ('on'), or serve only "
+                             "from it without touching the network ('replay')")
+    parser.add_argument('--transport', choices=TRANSPORTS, default=HTTP_TRANSPORT,
+                        help="HTTP client for downloads; 'httpx' uses HTTP/2 when h2 is installed")
+    parser.add_argument('--profile', choices=['stages', 'cprofile'],
+                        help="print time spent per pipeline stage when done; 'cprofile' also "
+                             "profiles every function and saves the stats")
+    parser.add_argument('--profile-output', default=PROFILE_FILE,
+                        help=f"where --profile cprofile saves its stats (default {PROFILE_FILE})")
+    args = parser.parse_args()
+    
+    scraper = PakWheelsScraper(transport=args.transport, cache_mode=args.cache)
+    if not args.profile:
+        scraper.run(resume=args.resume, incremental=args.incremental, enrich=args.enrich,
+                    exports=args.export)
+        return
+    
+    profiler = cProfile.Profile() if args.profile == 'cprofile' else None
+    try:
+        if profiler:
+            profiler.enable()
+        scraper.run(resume=args.resume, incremental=args.incremental, enrich=args.enrich,
+                    exports=args.export)
+    finally:
+        if profiler:
+            profiler.disable()
+            profiler.dump_stats(args.profile_output)
+            pstats.Stats(profiler).sort_stats('cumulative').print_stats(25)
+            print(f"Profile saved to {args.profile_output}")
+        print(METRICS.report())
 
 if __name__ == "__main__":
     main()
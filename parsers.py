@@ -0,0 +1,259 @@
+"""
+HTML parsing backends for PakWheels search result pages
+
+Each backend turns the raw bytes of a search page into a list of listings
+that expose the three things extract_car_details needs: the JSON-LD block,
+the text of any detail/spec sections, and the full listing text. Each
+parsed page also carries what it says about pagination, so the scraper
+knows where the results end. parse_stream() takes the body as chunks while
+it downloads; the lxml backend parses each chunk as it comes, the others
+parse once the whole body is in.
+
+    lxml    - lxml.html with precompiled XPath (default)
+    jsonld  - scans the raw bytes for JSON-LD <script> blocks only
+    bs4     - the original BeautifulSoup/html.parser path, always available
+"""
+
+import logging
+import re
+from typing import Iterable, List, NamedTuple, Optional
+
+from bs4 import BeautifulSoup
+
+try:
+    from lxml import etree, html as lxml_html
+except ImportError:  # pragma: no cover - lxml is a declared dependency
+    etree = lxml_html = None
+
+logger = logging.getLogger(__name__)
+
+# CSS selectors tried in order; the first one that matches anything wins
+LISTING_SELECTORS = [
+    'li.classified-listing',
+    'li[data-listing-id]',
+    '.search-results li',
+    '.classified-listing',
+    'li[id*="main_ad"]',
+]
+
+SPEC_CLASS_WORDS = ['detail', 'spec', 'info', 'feature']
+
+
+class Pagination(NamedTuple):
+    """What a results page says about the size of the whole search"""
+    total_results: Optional[int] = None
+    last_page: Optional[int] = None
+    has_next: Optional[bool] = None  # None when the page has no pagination links at all
+
+
+class ParsedPage(NamedTuple):
+    """Listings found on a page and the selector that found them"""
+    selector: Optional[str]
+    listings: list
+    pagination: Pagination = Pagination()
+
+
+# Pagination is read from the raw bytes so every backend gets it the same way
+_PAGE_LINK = re.compile(rb'<a[^>]+href=["\'][^"\']*[?&]page=(\d+)', re.IGNORECASE)
+_LAST_PAGE_LINK = re.compile(
+    rb'<li[^>]*class=["\'][^"\']*\blast\b[^"\']*["\'][^>]*>\s*<a[^>]+href=["\'][^"\']*[?&]page=(\d+)',
+    re.IGNORECASE,
+)
+_NEXT_LINK = re.compile(rb'<li[^>]*class=["\'][^"\']*\bnext\b|rel=["\']next["\']', re.IGNORECASE)
+_TOTAL_RESULTS = [
+    re.compile(rb'\bof\s+([\d,]+)\s+(?:results|ads|cars)\b', re.IGNORECASE),
+    re.compile(rb'\b([\d,]+)\s+(?:results|ads|cars)\s+found\b', re.IGNORECASE),
+]
+
+
+def read_pagination(content: bytes) -> Pagination:
+    """Total result count, last page number and whether there is a next page, where the page shows them"""
+    total_results = None
+    for pattern in _TOTAL_RESULTS:
+        match = pattern.search(content)
+        if match:
+            total_results = int(match.group(1).replace(b',', b''))
+            break
+
+    last_match = _LAST_PAGE_LINK.search(content)
+    last_page = int(last_match.group(1)) if last_match else None
+
+    has_next = None
+    if _PAGE_LINK.search(content):
+        has_next = bool(_NEXT_LINK.search(content))
+    return Pagination(total_results, last_page, has_next)
+
+
+class SoupListing:
+    """Listing backed by a BeautifulSoup element"""
+
+    def __init__(self, element):
+        self.element = element
+
+    def json_ld(self) -> Optional[str]:
+        script = self.element.find('script', {'type': 'application/ld+json'})
+        return script.string if script else None
+
+    def spec_texts(self) -> List[str]:
+        sections = self.element.find_all(['ul', 'div', 'span'],
+            class_=lambda x: x and any(word in str(x).lower() for word in SPEC_CLASS_WORDS))
+        return [section.get_text(strip=True) for section in sections]
+
+    def text(self) -> str:
+        return self.element.get_text(strip=True)
+
+
+class SoupParser:
+    """Original BeautifulSoup parser"""
+    name = 'bs4'
+
+    def parse(self, content: bytes) -> ParsedPage:
+        soup = BeautifulSoup(content, 'html.parser')
+        for selector in LISTING_SELECTORS:
+            elements = soup.select(selector)
+            if elements:
+                return ParsedPage(selector, [SoupListing(element) for element in elements], read_pagination(content))
+        return ParsedPage(None, [], read_pagination(content))
+
+    def parse_stream(self, chunks: Iterable[bytes]) -> ParsedPage:
+        return self.parse(b''.join(chunks))
+
+
+if etree is not None:
+    _LOWER_CLASS = "translate(@class, 'ABCDEFGHIJKLMNOPQRSTUVWXYZ', 'abcdefghijklmnopqrstuvwxyz')"
+
+    def _has_class(name: str) -> str:
+        return f"contains(concat(' ', normalize-space(@class), ' '), ' {name} ')"
+
+    # XPath equivalents of LISTING_SELECTORS, compiled once at import
+    _LISTING_XPATHS = [
+        (LISTING_SELECTORS[0], etree.XPath(f"//li[{_has_class('classified-listing')}]")),
+        (LISTING_SELECTORS[1], etree.XPath("//li[@data-listing-id]")),
+        (LISTING_SELECTORS[2], etree.XPath(f"//*[{_has_class('search-results')}]//li")),
+        (LISTING_SELECTORS[3], etree.XPath(f"//*[{_has_class('classified-listing')}]")),
+        (LISTING_SELECTORS[4], etree.XPath("//li[contains(@id, 'main_ad')]")),
+    ]
+    _JSON_LD_XPATH = etree.XPath(".//script[@type='application/ld+json']/text()")
+    _SPEC_XPATH = etree.XPath(
+        ".//*[self::ul or self::div or self::span][" +
+        " or ".join(f"contains({_LOWER_CLASS}, '{word}')" for word in SPEC_CLASS_WORDS) +
+        "]"
+    )
+    _TEXT_XPATH = etree.XPath(".//text()[not(ancestor::script) and not(ancestor::style)]")
+
+
+def _joined_text(element) -> str:
+    """Same result as BeautifulSoup's get_text(strip=True)"""
+    return ''.join(part.strip() for part in _TEXT_XPATH(element))
+
+
+class LxmlListing:
+    """Listing backed by an lxml element"""
+
+    def __init__(self, element):
+        self.element = element
+
+    def json_ld(self) -> Optional[str]:
+        blocks = _JSON_LD_XPATH(self.element)
+        return str(blocks[0]) if blocks else None
+
+    def spec_texts(self) -> List[str]:
+        return [_joined_text(section) for section in _SPEC_XPATH(self.element)]
+
+    def text(self) -> str:
+        return _joined_text(self.element)
+
+
+class LxmlParser:
+    """lxml.html parser with precompiled XPath selectors"""
+    name = 'lxml'
+
+    def parse(self, content: bytes) -> ParsedPage:
+        if not content:
+            return ParsedPage(None, [])
+        return self._page(lxml_html.document_fromstring(content), content)
+
+    def parse_stream(self, chunks: Iterable[bytes]) -> ParsedPage:
+        """Feed libxml2 each chunk as it arrives, so the tree is built while the rest downloads"""
+        parser = lxml_html.HTMLParser()
+        content = bytearray()
+        for chunk in chunks:
+            content += chunk
+            parser.feed(chunk)
+        if not content:
+            return ParsedPage(None, [])
+        return self._page(parser.close(), bytes(content))
+
+    def _page(self, root, content: bytes) -> ParsedPage:
+        for selector, xpath in _LISTING_XPATHS:
+            elements = xpath(root)
+            if elements:
+                return ParsedPage(selector, [LxmlListing(element) for element in elements], read_pagination(content))
+        return ParsedPage(None, [], read_pagination(content))
+
+
+_JSON_LD_BLOCK = re.compile(
+    rb'<script[^>]*type=["\']application/ld\+json["\'][^>]*>(.*?)</script>',
+    re.IGNORECASE | re.DOTALL,
+)
+
+
+class JsonLdListing:
+    """Listing made from a bare JSON-LD block; there is no HTML around it"""
+
+    def __init__(self, block: str):
+        self.block = block
+
+    def json_ld(self) -> Optional[str]:
+        return self.block
+
+    def spec_texts(self) -> List[str]:
+        return []
+
+    def text(self) -> str:
+        return ''
+
+
+class JsonLdParser:
+    """Pulls listing JSON-LD blocks straight out of the raw bytes without building a tree.
+
+    Falls back to BeautifulSoup when a page has no listing JSON-LD at all, so a
+    markup change degrades to the slow path instead of returning nothing.
+    """
+    name = 'jsonld'
+    selector = 'script[type="application/ld+json"]'
+
+    def __init__(self):
+        self.fallback = SoupParser()
+
+    def parse(self, content: bytes) -> ParsedPage:
+        listings = [
+            JsonLdListing(block.decode('utf-8', errors='replace'))
+            for block in _JSON_LD_BLOCK.findall(content)
+            # Pages also carry breadcrumb/organization JSON-LD; listings have offers
+            if b'"offers"' in block
+        ]
+        if listings:
+            return ParsedPage(self.selector, listings, read_pagination(content))
+        return self.fallback.parse(content)
+
+    def parse_stream(self, chunks: Iterable[bytes]) -> ParsedPage:
+        return self.parse(b''.join(chunks))
+
+
+PARSERS = {
+    'bs4': SoupParser,
+    'lxml': LxmlParser,
+    'jsonld': JsonLdParser,
+}
+
+
+def get_parser(name: str):
+    """Return a parser instance for the configured backend name"""
+    if name not in PARSERS:
+        logger.warning(f"Unknown parser backend '{name}', using bs4")
+        name = 'bs4'
+    if name == 'lxml' and etree is None:
+        logger.warning("lxml is not installed, using bs4")
+        name = 'bs4'
+    return PARSERS[name]()
@@ -0,0 +1,256 @@
+"""
+Typed records for scraped listings
+
+A CarListing holds one listing with mileage, year and price as integers
+and None for anything the listing didn't say. Display formatting
+("PKR 14,200,000", "140,000", "N/A") is applied only when a row is written
+out, by to_row().
+
+ListingColumns keeps many listings column by column in typed arrays, for
+result sets too large to hold as one object per listing.
+"""
+
+import csv
+import re
+import sys
+from array import array
+from dataclasses import dataclass
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from catalog import TitleParts, default_catalog
+from config import CSV_HEADERS
+from listing_index import listing_id
+from utils import clean_label, clean_text, normalize_url
+
+MISSING = 'N/A'
+
+# Placeholders that mean "no value" in rows read back from older CSVs
+# (clean_text used to turn 'N/A' into 'NA')
+MISSING_VALUES = ('N/A', 'NA', '')
+
+# CSV column -> CarListing attribute, in CSV_HEADERS order
+FIELD_BY_HEADER = {
+    'Car Model': 'model',
+    'Color': 'color',
+    'Transmission': 'transmission',
+    'Mileage': 'mileage_km',
+    'Model Year': 'year',
+    'Registration City': 'city',
+    'Price': 'price_pkr',
+    'URL': 'url',
+}
+HEADER_BY_FIELD = {field: header for header, field in FIELD_BY_HEADER.items()}
+
+INT_FIELDS = ('mileage_km', 'year', 'price_pkr')
+
+_NON_DIGITS = re.compile(r'\D+')
+
+_TITLE_SUFFIX = re.compile(r'\s+for sale in\b.*$', re.IGNORECASE)
+_TITLE_YEAR = re.compile(r'\s+(?:19|20)\d{2}$')
+
+
+def parse_int(text) -> Optional[int]:
+    """Integer value of a display string like "PKR 14,200,000" or "140,000" """
+    if isinstance(text, int):
+        return text
+    if isinstance(text, float):
+        return int(text)
+    text = str(text or '')
+    if text.isdecimal():
+        return int(text)
+    digits = _NON_DIGITS.sub('', text)
+    return int(digits) if digits else None
+
+
+def title_model(title: Optional[str]) -> Optional[str]:
+    """Make and model from a listing title, e.g. "Toyota Prado" for "Toyota Prado 2010 for sale in Islamabad" """
+    if not title:
+        return None
+    words = _TITLE_YEAR.sub('', _TITLE_SUFFIX.sub('', title.strip())).split()
+    if not words:
+        return None
+    # Only the make is normalized; trims like "XLi" or "i-VTEC" keep their case
+    return ' '.join([words[0].title()] + words[1:])
+
+
+def parse_value(field: str, value) -> Optional[object]:
+    """Typed value for a CarListing field from a display string, or None if missing"""
+    if value is None or (isinstance(value, str) and value.strip() in MISSING_VALUES):
+        return None
+    if field in INT_FIELDS:
+        return parse_int(value)
+    if field == 'url':
+        return normalize_url(value)
+    # Titles, colors and cities repeat across listings; share one copy of each
+    return sys.intern(str(value))
+
+
+def format_value(field: str, value) -> str:
+    """Display string for a CarListing field, as written to CSV"""
+    if value is None:
+        return MISSING
+    if field == 'price_pkr':
+        return f"PKR {value:,}"
+    if field == 'mileage_km':
+        return f"{value:,}"
+    return str(value)
+
+
+# Cleaner for each CarListing attribute, by the kind of value it holds: free
+# text, a short label from a small vocabulary, a number, or a URL
+FIELD_NORMALIZERS = {
+    'model': clean_text,
+    'color': clean_label,
+    'transmission': clean_label,
+    'mileage_km': parse_int,
+    'year': parse_int,
+    'city': clean_label,
+    'price_pkr': parse_int,
+    'url': normalize_url,
+}
+
+
+def normalize_listing(listing: 'CarListing') -> 'CarListing':
+    """Clean every field of a freshly extracted listing in place"""
+    for field, normalize in FIELD_NORMALIZERS.items():
+        value = getattr(listing, field)
+        if value is not None:
+            setattr(listing, field, normalize(value))
+    return listing
+
+
+@dataclass(slots=True)
+class CarListing:
+    """One scraped listing"""
+    model: str
+    color: Optional[str] = None
+    transmission: Optional[str] = None
+    mileage_km: Optional[int] = None
+    year: Optional[int] = None
+    city: Optional[str] = None
+    price_pkr: Optional[int] = None
+    url: Optional[str] = None
+
+    @property
+    def listing_id(self) -> Optional[int]:
+        return listing_id(self.url)
+
+    @property
+    def title_parts(self) -> TitleParts:
+        """Make, model, variant, year and city the title states, looked up in the catalog"""
+        return default_catalog().parse(self.model)
+
+    @property
+    def make(self) -> Optional[str]:
+        """Make named by the title, e.g. "Toyota" for "Toyota Prado 2010 for sale in Islamabad" """
+        return self.title_parts.make
+
+    def to_row(self) -> Dict[str, str]:
+        """CSV row with display formatting applied"""
+        return {header: format_value(field, getattr(self, field)) for header, field in FIELD_BY_HEADER.items()}
+
+    @classmethod
+    def from_row(cls, row: Dict[str, str]) -> 'CarListing':
+        """Listing from a CSV-style row of display strings"""
+        values = {field: parse_value(field, row.get(header)) for header, field in FIELD_BY_HEADER.items()}
+        values['model'] = values['model'] or ''
+        return cls(**values)
+
+
+assert list(FIELD_BY_HEADER) == CSV_HEADERS
+
+
+class ListingColumns:
+    """Column-oriented container of listings.
+
+    Integer fields are stored in array('q') with -1 for missing values.
+    Titles, colors, transmissions and cities repeat a lot, so each is stored
+    as an array of codes into a list of distinct strings. URLs are kept as
+    a plain list since nearly every one is different.
+    """
+    CATEGORY_FIELDS = ('model', 'color', 'transmission', 'city')
+    NONE_INT = -1
+
+    def __init__(self, listings: Iterable[CarListing] = ()):
+        self.ints = {field: array('q') for field in INT_FIELDS}
+        self.codes = {field: array('I') for field in self.CATEGORY_FIELDS}
+        self.categories: Dict[str, List[Optional[str]]] = {field: [] for field in self.CATEGORY_FIELDS}
+        self._code_of: Dict[str, Dict[Optional[str], int]] = {field: {} for field in self.CATEGORY_FIELDS}
+        self.urls: List[Optional[str]] = []
+        self.extend(listings)
+
+    def _encode(self, field: str, value: Optional[str]) -> int:
+        code_of = self._code_of[field]
+        code = code_of.get(value)
+        if code is None:
+            code = code_of[value] = len(self.categories[field])
+            self.categories[field].append(value)
+        return code
+
+    def append(self, listing: CarListing):
+        for field in INT_FIELDS:
+            value = getattr(listing, field)
+            self.ints[field].append(self.NONE_INT if value is None else value)
+        for field in self.CATEGORY_FIELDS:
+            self.codes[field].append(self._encode(field, getattr(listing, field)))
+        self.urls.append(listing.url)
+
+    def extend(self, listings: Iterable[CarListing]):
+        for listing in listings:
+            self.append(listing)
+
+    @classmethod
+    def from_csv(cls, filename: str) -> 'ListingColumns':
+        """Load a scraped CSV straight into columns, without building a CarListing per row"""
+        columns = cls()
+        with open(filename, newline='', encoding='utf-8') as csvfile:
+            reader = csv.reader(csvfile)
+            header = next(reader, [])
+            positions = [(FIELD_BY_HEADER[name], i) for i, name in enumerate(header) if name in FIELD_BY_HEADER]
+            # Raw text -> stored value, per column; years, mileages, prices and
+            # especially the text columns repeat, so most cells are a dict lookup
+            ints = [(field, columns.ints[field].append, i, {}) for field, i in positions if field in INT_FIELDS]
+            categories = [(field, columns.codes[field].append, i, {}) for field, i in positions
+                          if field in cls.CATEGORY_FIELDS]
+            url = dict(positions).get('url')
+            encode = columns._encode
+            urls = columns.urls
+            for row in reader:
+                for field, append, i, seen in ints:
+                    text = row[i]
+                    value = seen.get(text)
+                    if value is None:
+                        value = parse_value(field, text)
+                        value = seen[text] = cls.NONE_INT if value is None else value
+                    append(value)
+                for field, append, i, seen in categories:
+                    text = row[i]
+                    code = seen.get(text)
+                    if code is None:
+                        code = seen[text] = encode(field, parse_value(field, text))
+                    append(code)
+                urls.append(parse_value('url', row[url]) if url is not None else None)
+        return columns
+
+    def __len__(self) -> int:
+        return len(self.urls)
+
+    def __getitem__(self, index: int) -> CarListing:
+        values = {field: self.categories[field][self.codes[field][index]] for field in self.CATEGORY_FIELDS}
+        for field in INT_FIELDS:
+            value = self.ints[field][index]
+            values[field] = None if value == self.NONE_INT else value
+        return CarListing(url=self.urls[index], **values)
+
+    def __iter__(self) -> Iterator[CarListing]:
+        for index in range(len(self)):
+            yield self[index]
+
+    def column(self, field: str) -> list:
+        """Every value of one field, decoded, with None for missing"""
+        if field in INT_FIELDS:
+            return [None if value == self.NONE_INT else value for value in self.ints[field]]
+        if field in self.CATEGORY_FIELDS:
+            categories = self.categories[field]
+            return [categories[code] for code in self.codes[field]]
+        return list(self.urls)
@@ -0,0 +1,224 @@
+"""
+Output writers for scraped car data
+
+Rows are written as they arrive instead of being held in memory until the
+end of a run. Writes go to a temporary file next to the target that is
+renamed into place when the run finishes, so readers never see a half
+written CSV.
+
+CarDatabase keeps every listing ever scraped in SQLite, with numeric
+columns for querying, and streams it back out as CarListing records for
+the exporters to encode.
+"""
+
+import csv
+import logging
+import os
+import sqlite3
+import time
+from typing import Dict, Iterator, List, Optional
+
+from config import CSV_HEADERS, DATABASE_FILE
+from records import CarListing, parse_value
+
+logger = logging.getLogger(__name__)
+
+
+class StreamingCSVWriter:
+    """Append rows to a CSV page by page and atomically publish it on close.
+
+    If the run fails, the partial file is kept as `<filename>.part` so the
+    rows already scraped are not lost.
+    """
+
+    def __init__(self, filename: str, fieldnames: List[str] = CSV_HEADERS):
+        self.filename = filename
+        self.temp_filename = f"{filename}.part"
+        self.fieldnames = fieldnames
+        self.rows_written = 0
+        self._file = None
+        self._writer = None
+
+    def open(self, resume_offset: Optional[int] = None, rows_written: int = 0):
+        """Start a new .part file, or continue an existing one from `resume_offset`
+        (anything after that offset came from a page that never finished)"""
+        directory = os.path.dirname(os.path.abspath(self.filename))
+        os.makedirs(directory, exist_ok=True)
+        if resume_offset is None:
+            self._file = open(self.temp_filename, 'w', newline='', encoding='utf-8')
+            self._writer = csv.DictWriter(self._file, fieldnames=self.fieldnames)
+            self._writer.writeheader()
+        else:
+            self._file = open(self.temp_filename, 'r+', newline='', encoding='utf-8')
+            self._file.truncate(resume_offset)
+            self._file.seek(resume_offset)
+            self._writer = csv.DictWriter(self._file, fieldnames=self.fieldnames)
+            self.rows_written = rows_written
+        return self
+
+    @property
+    def offset(self) -> int:
+        """Bytes written to the .part file so far"""
+        return self._file.tell()
+
+    def write_rows(self, rows: List[CarListing]):
+        """Write a batch of listings (normally one page) and flush it to disk"""
+        self._writer.writerows(row.to_row() for row in rows)
+        self._file.flush()
+        self.rows_written += len(rows)
+
+    def close(self):
+        """Finish the file and move it into place"""
+        self._file.close()
+        os.replace(self.temp_filename, self.filename)
+
+    def discard(self):
+        """Throw the output away, leaving any existing file untouched"""
+        self._file.close()
+        os.remove(self.temp_filename)
+
+    def abort(self):
+        """Stop writing and leave the partial output in the .part file"""
+        self._file.close()
+        logger.warning(f"Partial output kept in {self.temp_filename} ({self.rows_written} rows)")
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+def read_csv_rows(filename: str) -> Iterator[Dict[str, str]]:
+    """Stream rows back out of a CSV without loading the whole file"""
+    with open(filename, newline='', encoding='utf-8') as csvfile:
+        yield from csv.DictReader(csvfile)
+
+
+def read_listings(filename: str) -> Iterator[CarListing]:
+    """Stream a CSV back as CarListing records"""
+    for row in read_csv_rows(filename):
+        yield CarListing.from_row(row)
+
+
+def write_csv(rows: List[CarListing], filename: str):
+    """Write all rows to a CSV in one go, through the same atomic rename"""
+    with StreamingCSVWriter(filename) as writer:
+        writer.write_rows(rows)
+
+
+# Columns in CSV_HEADERS order, with the typed columns in place of the
+# display strings they were parsed from
+LISTING_COLUMNS = ['car_model', 'color', 'transmission', 'mileage_km', 'year',
+                   'registration_city', 'price_pkr', 'url']
+
+
+class CarDatabase:
+    """SQLite store of every listing scraped, one row per listing ID.
+
+    Display strings are kept as written to CSV; price, mileage and year are
+    also stored as integers so they can be indexed and compared.
+    """
+
+    def __init__(self, path: str = DATABASE_FILE):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS cars (
+                listing_id INTEGER PRIMARY KEY,
+                car_model TEXT NOT NULL,
+                make TEXT,
+                color TEXT,
+                transmission TEXT,
+                mileage TEXT,
+                model_year TEXT,
+                registration_city TEXT,
+                price TEXT,
+                url TEXT,
+                mileage_km INTEGER,
+                year INTEGER,
+                price_pkr INTEGER,
+                first_seen REAL NOT NULL,
+                last_seen REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS cars_make ON cars (make);
+            CREATE INDEX IF NOT EXISTS cars_city ON cars (registration_city);
+            CREATE INDEX IF NOT EXISTS cars_year ON cars (year);
+            CREATE INDEX IF NOT EXISTS cars_price ON cars (price_pkr);
+        """)
+        self.conn.commit()
+
+    @staticmethod
+    def _record(listing: CarListing, now: float) -> tuple:
+        display = listing.to_row()
+        return (
+            listing.listing_id,
+            listing.model,
+            listing.make,
+            display['Color'],
+            display['Transmission'],
+            display['Mileage'],
+            display['Model Year'],
+            display['Registration City'],
+            display['Price'],
+            listing.url,
+            listing.mileage_km,
+            listing.year,
+            listing.price_pkr,
+            now,
+            now,
+        )
+
+    def write_rows(self, rows: List[CarListing]):
+        """Insert or refresh a page of rows in one transaction.
+
+        Rows without a listing ID are skipped: a NULL key would make SQLite
+        give each a fresh rowid, so the listing would be added again every run.
+        """
+        now = time.time()
+        records = [record for record in (self._record(row, now) for row in rows) if record[0] is not None]
+        self.conn.executemany("""
+            INSERT INTO cars VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (listing_id) DO UPDATE SET
+                car_model = excluded.car_model,
+                make = excluded.make,
+                color = excluded.color,
+                transmission = excluded.transmission,
+                mileage = excluded.mileage,
+                model_year = excluded.model_year,
+                registration_city = excluded.registration_city,
+                price = excluded.price,
+                url = excluded.url,
+                mileage_km = excluded.mileage_km,
+                year = excluded.year,
+                price_pkr = excluded.price_pkr,
+                last_seen = excluded.last_seen
+        """, records)
+        self.conn.commit()
+
+    def count(self) -> int:
+        return self.conn.execute("SELECT COUNT(*) FROM cars").fetchone()[0]
+
+    def iter_rows(self, make: Optional[str] = None, city: Optional[str] = None) -> Iterator[CarListing]:
+        """Stream stored listings, newest first"""
+        query = f"SELECT {', '.join(LISTING_COLUMNS)} FROM cars"
+        conditions, params = [], []
+        if make:
+            conditions.append("make = ? COLLATE NOCASE")
+            params.append(make)
+        if city:
+            conditions.append("registration_city = ? COLLATE NOCASE")
+            params.append(city)
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += " ORDER BY last_seen DESC"
+
+        for car_model, color, transmission, mileage_km, year, city, price_pkr, url in self.conn.execute(query, params):
+            yield CarListing(car_model, parse_value('color', color), parse_value('transmission', transmission),
+                             mileage_km, year, parse_value('city', city), price_pkr, url)
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,56 @@
+"""
+Tests for reading listing titles with the make/model/variant catalog
+"""
+
+import os
+
+from catalog import Catalog, CatalogStore, TitleParts
+
+
+def test_parse_title():
+    parts = Catalog().parse("Toyota Corolla Axio 2017 for sale in Islamabad")
+    assert parts == TitleParts('Toyota', 'Corolla', 'Axio', 2017, 'Islamabad', 3)
+
+
+def test_longest_model_wins():
+    catalog = Catalog()
+    assert catalog.parse("Toyota Corolla Cross 2023").model == 'Corolla Cross'
+    assert catalog.parse("Honda Civic 2019").model == 'Civic'
+
+
+def test_tank_make_wins_over_toyota_tank():
+    # 'Tank' is both a make and a Toyota model; a make at the start of a title comes first
+    catalog = Catalog()
+    assert catalog.parse("Tank 500 2024 for sale in Lahore")[:3] == ('Tank', '500', None)
+    assert catalog.parse("Toyota Tank 2017 for sale in Karachi")[:3] == ('Toyota', 'Tank', None)
+
+
+def test_model_without_make():
+    catalog = Catalog()
+    assert catalog.parse("Civic Oriel 2019")[:3] == ('Honda', 'Civic', 'Oriel')
+    # Suzuki and Daihatsu both make a Mira
+    parts = catalog.parse("Mira 2015")
+    assert (parts.make, parts.model, parts.known) == (None, 'Mira', 1)
+
+
+def test_parsing_opens_no_file(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    Catalog().parse("Toyota Corolla 2018")
+    assert os.listdir(tmp_path) == []
+
+
+def test_store_learns_after_enough_sightings(tmp_path):
+    path = str(tmp_path / 'catalog.db')
+    catalog = Catalog()
+    store = CatalogStore(catalog, path, min_sightings=2)
+    assert store.learn(["Zotye Z100 2012 for sale in Lahore"]) == 0
+    assert not catalog.recognizes("Zotye Z100 2013")
+    assert store.learn(["Zotye Z100 2014 for sale in Karachi"]) == 1
+    assert catalog.parse("Zotye Z100 2013").known == 2
+    store.close()
+
+    # A new catalog picks up what was learned once the file is opened over it
+    reopened = Catalog()
+    assert not reopened.recognizes("Zotye Z100 2013")
+    CatalogStore(reopened, path, min_sightings=2).close()
+    assert reopened.recognizes("Zotye Z100 2013")
@@ -0,0 +1,46 @@
+"""
+Tests for resuming the dashboard's /events stream
+"""
+
+import itertools
+
+import pytest
+
+import web_interface
+from web_interface import app, events, last_event_id
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(web_interface, 'EVENT_KEEPALIVE', 0.1)
+    return app.test_client()
+
+
+def stream_after(client, last_id, chunks=5):
+    """The first few chunks of /events after publishing an event, keepalives included"""
+    response = client.get('/events', headers={'Last-Event-ID': last_id}, buffered=False)
+    events.publish('log', 'resumed')
+    try:
+        return b''.join(itertools.islice(response.response, chunks))
+    finally:
+        response.close()
+
+
+def test_malformed_last_event_id():
+    assert last_event_id('abc') == events.last_id
+
+
+def test_last_event_id_from_before_a_restart():
+    # A browser reconnecting after a restart sends an ID from the old, longer buffer
+    assert last_event_id(str(events.last_id + 500)) == events.last_id
+
+
+def test_known_last_event_id():
+    events.publish('log', 'earlier')
+    assert last_event_id(str(events.last_id - 1)) == events.last_id - 1
+    assert last_event_id(None) == events.last_id
+
+
+@pytest.mark.parametrize('last_id', ['abc', '999999'])
+def test_stream_resumes_after_unknown_id(client, last_id):
+    assert b'resumed' in stream_after(client, last_id)
@@ -0,0 +1,61 @@
+"""
+Tests for listing URL and field normalization, and the CSV round trip
+"""
+
+import pytest
+
+from records import CarListing
+from storage import read_listings, write_csv
+from utils import normalize_car_data, normalize_url
+
+LISTING_URL = 'https://www.pakwheels.com/used-cars/toyota-corolla-2018-for-sale-in-lahore-8123456'
+
+
+@pytest.mark.parametrize('url', [
+    LISTING_URL,
+    '//www.pakwheels.com/used-cars/toyota-corolla-2018-for-sale-in-lahore-8123456',
+    '/used-cars/toyota-corolla-2018-for-sale-in-lahore-8123456',
+    'www.pakwheels.com/used-cars/toyota-corolla-2018-for-sale-in-lahore-8123456',
+    # What clean_text used to leave of a URL after stripping ':' and '/'
+    'httpswww.pakwheels.comused-carstoyota-corolla-2018-for-sale-in-lahore-8123456',
+])
+def test_normalize_url(url):
+    assert normalize_url(url) == LISTING_URL
+
+
+def test_normalize_url_keeps_other_schemes_and_query():
+    url = 'http://www.pakwheels.com/used-cars/search/-/?page=2&sort=price'
+    assert normalize_url(url) == url
+
+
+@pytest.mark.parametrize('url', [None, '', '  ', 'N/A', 'NA'])
+def test_normalize_url_missing(url):
+    assert normalize_url(url) is None
+
+
+def test_normalize_car_data_keeps_url_verbatim():
+    data = normalize_car_data({
+        'Car Model': '  Toyota   Corolla  ',
+        'Price': None,
+        'URL': LISTING_URL + '?utm=feed#photos',
+    })
+    assert data['URL'] == LISTING_URL + '?utm=feed#photos'
+    assert data['Car Model'] == 'Toyota Corolla'
+    assert data['Price'] == 'N/A'
+
+
+def test_car_listing_csv_round_trip(tmp_path):
+    listings = [
+        CarListing(model='Toyota Corolla', color='White', transmission='Automatic', mileage_km=140000,
+                   year=2018, city='Lahore', price_pkr=4250000, url=LISTING_URL),
+        CarListing(model='Suzuki Mehran'),
+    ]
+    filename = str(tmp_path / 'cars.csv')
+    write_csv(listings, filename)
+
+    rows = [listing.to_row() for listing in listings]
+    assert rows[0]['Price'] == 'PKR 4,250,000'
+    assert rows[0]['Mileage'] == '140,000'
+    assert rows[1]['URL'] == 'N/A'
+    assert [CarListing.from_row(row) for row in rows] == listings
+    assert list(read_listings(filename)) == listings
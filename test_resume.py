@@ -0,0 +1,57 @@
+"""
+Tests for resuming an interrupted scrape from its checkpoint
+"""
+
+import pytest
+
+from pakwheels_scraper import PageResult, PakWheelsScraper
+from records import CarListing
+from storage import read_listings
+
+PAGES = 6
+
+
+def page_listings(page_num):
+    """Ten listings a page; each page repeats the last two of the one before,
+    as results shift while they're being paged through"""
+    first = max(1, page_num * 10 - 2)
+    return [CarListing('Toyota Corolla 2018', url=f'https://www.pakwheels.com/used-cars/toyota-corolla-{8100000 + n}')
+            for n in range(first, page_num * 10 + 10)]
+
+
+class Interrupted(Exception):
+    pass
+
+
+class StubScraper(PakWheelsScraper):
+    """Serves page_listings() instead of fetching, failing at `crash_at`"""
+
+    def __init__(self, crash_at=None):
+        super().__init__(concurrency=1, cache_mode='off')
+        self.crash_at = crash_at
+
+    def _scrape_page_safe(self, page_num, custom_url=None):
+        if page_num == self.crash_at:
+            raise Interrupted(page_num)
+        cars = page_listings(page_num)
+        return PageResult(cars, len(cars), PAGES)
+
+
+def scrape(scraper, filename, resume=False):
+    return scraper.scrape_to_csv(PAGES, filename=filename, resume=resume, enrich='off', exports=[])
+
+
+def test_resume_writes_no_duplicates(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    fresh = str(tmp_path / 'fresh.csv')
+    resumed = str(tmp_path / 'resumed.csv')
+
+    expected = scrape(StubScraper(), fresh)
+    with pytest.raises(Interrupted):
+        scrape(StubScraper(crash_at=4), resumed)
+    rows = scrape(StubScraper(), resumed, resume=True)
+
+    ids = [listing.listing_id for listing in read_listings(resumed)]
+    assert rows == expected == len(ids)
+    assert len(set(ids)) == len(ids)
+    assert ids == [listing.listing_id for listing in read_listings(fresh)]
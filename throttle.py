@@ -0,0 +1,261 @@
+"""
+Request pacing and retries for the PakWheels scraper
+
+Every request takes a token from its host's bucket in a HostRateLimiter, so
+the overall rate to a host stays within its limit no matter how many pages
+are in flight or how many scrapes share the limiter.
+
+Rates adapt AIMD style: each clean response raises a host's rate a little
+(up to RATE_LIMIT_MAX) and each 429/503 cuts it by RATE_DECREASE (down to
+RATE_LIMIT_MIN). A Retry-After header pauses the whole host. Failed requests
+are retried with exponential backoff and full jitter, so a throttled or
+flaky server costs a delay instead of a page.
+"""
+
+import functools
+import logging
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Callable, Dict, Optional, Tuple
+from urllib.parse import urlparse
+
+from requests.adapters import HTTPAdapter
+from requests.exceptions import ConnectionError, Timeout
+
+from config import (ADAPTIVE_RATE_LIMIT, MAX_RETRIES, RATE_DECREASE, RATE_INCREASE, RATE_LIMIT,
+                    RATE_LIMIT_BURST, RATE_LIMIT_MAX, RATE_LIMIT_MIN, RETRY_BACKOFF, RETRY_BACKOFF_MAX)
+
+logger = logging.getLogger(__name__)
+
+# Responses worth another attempt, and those that mean "slow down"
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+THROTTLE_STATUSES = {429, 503}
+
+RETRY_METHODS = {'GET', 'HEAD', 'OPTIONS'}
+
+# Requests already in flight when a host starts throttling all come back 429;
+# only the first of those within this many seconds cuts the rate
+DECREASE_COOLDOWN = 1.0
+
+
+class TokenBucket:
+    """Thread-safe token bucket rate limiter"""
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = float(rate)
+        self.capacity = max(1, int(burst))
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        if self.rate > 0:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self) -> float:
+        """Block until a token is available, then consume it. Returns the seconds spent waiting."""
+        start = time.monotonic()
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    wait = self.paused_until - now
+                elif self.rate <= 0:
+                    return now - start
+                else:
+                    self._refill(now)
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return now - start
+                    wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def set_rate(self, rate: float):
+        with self._lock:
+            self._refill(time.monotonic())
+            self.rate = float(rate)
+
+    def pause(self, seconds: float):
+        """Hand out no tokens for the next `seconds`"""
+        with self._lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+            self.tokens = 0.0
+
+
+class HostRateLimiter:
+    """One token bucket per host, shared by every scraper given this limiter.
+
+    With min_rate < max_rate each host's rate adapts between the two as
+    responses are recorded; otherwise it stays at `rate`.
+    """
+
+    def __init__(self, rate: float, burst: int = 1, min_rate: Optional[float] = None,
+                 max_rate: Optional[float] = None, increase: float = RATE_INCREASE,
+                 decrease: float = RATE_DECREASE):
+        self.rate = rate
+        self.burst = burst
+        self.min_rate = rate if min_rate is None else min(min_rate, rate)
+        self.max_rate = rate if max_rate is None else max(max_rate, rate)
+        self.increase = increase
+        self.decrease = decrease
+        self.buckets: Dict[str, TokenBucket] = {}
+        self.stats: Dict[str, Dict[str, float]] = {}
+        self.last_decrease: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, rate: float = RATE_LIMIT, adaptive: bool = ADAPTIVE_RATE_LIMIT) -> 'HostRateLimiter':
+        """Limiter using the configured burst and, if adaptive, the configured AIMD bounds"""
+        if not adaptive or rate <= 0:
+            return cls(rate, RATE_LIMIT_BURST)
+        return cls(rate, RATE_LIMIT_BURST, RATE_LIMIT_MIN, RATE_LIMIT_MAX)
+
+    @property
+    def adaptive(self) -> bool:
+        return self.min_rate < self.max_rate
+
+    def _bucket(self, host: Optional[str]) -> TokenBucket:
+        with self._lock:
+            bucket = self.buckets.get(host)
+            if bucket is None:
+                bucket = self.buckets[host] = TokenBucket(self.rate, self.burst)
+                self.stats[host] = {'requests': 0, 'ok': 0, 'throttled': 0, 'errors': 0,
+                                    'retries': 0, 'wait_seconds': 0.0}
+            return bucket
+
+    def acquire(self, host: Optional[str] = None):
+        bucket = self._bucket(host)
+        waited = bucket.acquire()
+        with self._lock:
+            self.stats[host]['requests'] += 1
+            self.stats[host]['wait_seconds'] += waited
+
+    def record(self, host: Optional[str], status: Optional[int], retry_after: Optional[float] = None):
+        """Feed back the outcome of a request; `status` is None for a connection error or timeout"""
+        bucket = self._bucket(host)
+        if status in THROTTLE_STATUSES:
+            outcome = 'throttled'
+            now = time.monotonic()
+            with self._lock:
+                cut = now - self.last_decrease.get(host, 0.0) >= DECREASE_COOLDOWN
+                if cut:
+                    self.last_decrease[host] = now
+            if self.adaptive and cut:
+                bucket.set_rate(max(self.min_rate, bucket.rate * self.decrease))
+            if retry_after:
+                bucket.pause(retry_after)
+        elif status is None or status in RETRY_STATUSES:
+            outcome = 'errors'
+        else:
+            outcome = 'ok'
+            if self.adaptive and bucket.rate < self.max_rate:
+                bucket.set_rate(min(self.max_rate, bucket.rate + self.increase))
+        with self._lock:
+            self.stats[host][outcome] += 1
+
+    def record_retry(self, host: Optional[str]):
+        self._bucket(host)
+        with self._lock:
+            self.stats[host]['retries'] += 1
+
+    def metrics(self) -> Dict[str, Dict[str, float]]:
+        """Per-host counters and current rate, safe to hand to another thread"""
+        with self._lock:
+            return {
+                host: dict(stats, rate=round(self.buckets[host].rate, 3), wait_seconds=round(stats['wait_seconds'], 3))
+                for host, stats in self.stats.items()
+            }
+
+    def report(self) -> str:
+        """One line per host summarizing how requests to it went"""
+        lines = []
+        for host, stats in self.metrics().items():
+            rate = f"rate now {stats['rate']:g}/s" if stats['rate'] > 0 else "no rate limit"
+            lines.append(f"{host}: {stats['requests']} requests, {stats['ok']} ok, {stats['throttled']} throttled, "
+                         f"{stats['errors']} errors, {stats['retries']} retries, "
+                         f"{stats['wait_seconds']:.1f}s waiting, {rate}")
+        return '\n'.join(lines)
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Seconds to wait from a Retry-After header, given as seconds or an HTTP date"""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt: int, base: float = RETRY_BACKOFF, cap: float = RETRY_BACKOFF_MAX) -> float:
+    """Exponential backoff with full jitter for the given retry attempt (0-based)"""
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+def send_with_retries(send: Callable[[], object], url: str, method: str, rate_limiter: HostRateLimiter,
+                      retries: int = MAX_RETRIES, backoff: float = RETRY_BACKOFF,
+                      backoff_max: float = RETRY_BACKOFF_MAX, errors: Tuple[type, ...] = (ConnectionError, Timeout)):
+    """Make a request with `send`, taking a rate limiter token before each
+    attempt, reporting how it went, and retrying idempotent requests that
+    failed in a way worth retrying.
+
+    `send` makes one attempt and returns a response with status_code, headers
+    and close(), as both requests and httpx responses have; `errors` are the
+    exceptions that mean the connection failed or timed out. Each response is
+    stamped with `ttfb`, the seconds its attempt took to get the headers back.
+    """
+    host = urlparse(url).hostname
+    attempts = retries + 1 if method in RETRY_METHODS else 1
+    for attempt in range(attempts):
+        rate_limiter.acquire(host)
+        last_attempt = attempt == attempts - 1
+        try:
+            start = time.perf_counter()
+            response = send()
+            response.ttfb = time.perf_counter() - start
+        except errors as e:
+            rate_limiter.record(host, None)
+            if last_attempt:
+                raise
+            delay = backoff_delay(attempt, backoff, backoff_max)
+            reason = type(e).__name__
+        else:
+            retry_after = parse_retry_after(response.headers.get('Retry-After'))
+            rate_limiter.record(host, response.status_code, retry_after)
+            if response.status_code not in RETRY_STATUSES or last_attempt:
+                return response
+            if retry_after is not None and retry_after > backoff_max:
+                # The server wants a longer break than we are willing to wait
+                return response
+            delay = max(retry_after or 0, backoff_delay(attempt, backoff, backoff_max))
+            reason = f"HTTP {response.status_code}"
+            response.close()
+
+        rate_limiter.record_retry(host)
+        logger.warning(f"{reason} from {url}, retrying in {delay:.1f}s "
+                       f"(attempt {attempt + 2} of {attempts})")
+        time.sleep(delay)
+
+
+class ThrottledAdapter(HTTPAdapter):
+    """Transport adapter that sends every request that actually goes out on
+    the network through send_with_retries"""
+
+    def __init__(self, rate_limiter: HostRateLimiter, retries: int = MAX_RETRIES,
+                 backoff: float = RETRY_BACKOFF, backoff_max: float = RETRY_BACKOFF_MAX, **kwargs):
+        self.rate_limiter = rate_limiter
+        self.retries = retries
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        super().__init__(**kwargs)
+
+    def send(self, request, **kwargs):
+        return send_with_retries(functools.partial(super().send, request, **kwargs), request.url, request.method,
+                                 self.rate_limiter, self.retries, self.backoff, self.backoff_max)
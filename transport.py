@@ -0,0 +1,300 @@
+"""
+HTTP transports for page downloads
+
+    requests - requests.Session over urllib3, HTTP/1.1 (default)
+    httpx    - httpx.Client; with the h2 package installed, requests to a
+               host share one HTTP/2 connection instead of one connection each
+
+Both send every request through the scraper's HostRateLimiter with retries
+(throttle.send_with_retries), answer from the ResponseCache when it's on,
+keep at most `pool_size` connections per host, and hand the body over in
+STREAM_CHUNK_SIZE chunks as it arrives, so the parser can work on the start
+of a page while the rest is still downloading. Each advertises brotli (br)
+and zstd in Accept-Encoding only if it has a decoder for them installed.
+
+Every download reports its time to first byte and the bytes that came over
+the wire, before decompression, next to the size they decoded to.
+"""
+
+import functools
+import logging
+import time
+from typing import Callable, Iterable, Iterator, Optional
+
+import requests
+from urllib3.util.request import ACCEPT_ENCODING
+
+from config import HEADERS, HTTP2, HTTP_KEEPALIVE_EXPIRY, MAX_RETRIES, STREAM_CHUNK_SIZE, TIMEOUT
+from http_cache import CachingAdapter, ResponseCache
+from throttle import HostRateLimiter, ThrottledAdapter, send_with_retries
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+try:
+    import h2
+except ImportError:
+    h2 = None
+
+try:
+    import brotli
+except ImportError:
+    try:
+        import brotlicffi as brotli
+    except ImportError:
+        brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+TRANSPORTS = ['requests', 'httpx']
+
+
+class Download:
+    """A page response whose body is read as it arrives.
+
+    After the body has been read, `size` is its decoded length, `wire_bytes`
+    what came over the network for it and `read_seconds` the time spent
+    waiting for and decompressing it.
+    """
+
+    def __init__(self, url: str, status_code: int, http_version: str, ttfb: Optional[float], from_cache: bool,
+                 chunks: Iterable[bytes], wire_bytes: Callable[[], int], close: Callable[[], None]):
+        self.url = url
+        self.status_code = status_code
+        self.http_version = http_version
+        self.ttfb = ttfb  # None when the page came from the cache without a request
+        self.from_cache = from_cache
+        self.size = 0
+        self.read_seconds = 0.0
+        self._chunks = chunks
+        self._wire_bytes = wire_bytes
+        self._close = close
+
+    @property
+    def wire_bytes(self) -> int:
+        return self._wire_bytes()
+
+    def iter_bytes(self) -> Iterator[bytes]:
+        chunks = iter(self._chunks)
+        while True:
+            start = time.perf_counter()
+            chunk = next(chunks, None)
+            self.read_seconds += time.perf_counter() - start
+            if chunk is None:
+                return
+            if chunk:
+                self.size += len(chunk)
+                yield chunk
+
+    def read(self) -> bytes:
+        return b''.join(self.iter_bytes())
+
+    def close(self):
+        self._close()
+
+    def __enter__(self) -> 'Download':
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class RequestsTransport:
+    """requests.Session whose adapter paces, retries and caches every request"""
+    name = 'requests'
+    errors = (requests.RequestException,)
+
+    def __init__(self, rate_limiter: HostRateLimiter, cache: Optional[ResponseCache] = None, replay: bool = False,
+                 retries: int = MAX_RETRIES, pool_size: int = 10):
+        self.session = requests.Session()
+        self.session.headers.update(HEADERS)
+        # Whatever urllib3 can decode here: gzip and deflate, plus br and zstd
+        # if their decoders are installed
+        self.session.headers['Accept-Encoding'] = ACCEPT_ENCODING.replace(',', ', ')
+        if cache:
+            adapter = CachingAdapter(cache, rate_limiter, replay=replay, retries=retries,
+                                     pool_connections=1, pool_maxsize=pool_size)
+        else:
+            adapter = ThrottledAdapter(rate_limiter, retries=retries, pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def open(self, url: str, timeout: float = TIMEOUT) -> Download:
+        """Send a GET and return once the headers are in; raises for an error status"""
+        response = self.session.get(url, timeout=timeout, stream=True)
+        try:
+            response.raise_for_status()
+        except requests.HTTPError:
+            response.close()
+            raise
+        raw = response.raw
+        return Download(url, response.status_code, _http_version(raw), getattr(response, 'ttfb', None),
+                        getattr(response, 'from_cache', False), response.iter_content(STREAM_CHUNK_SIZE),
+                        # urllib3 counts the bytes it read off the socket, before decoding
+                        lambda: raw.tell() if raw is not None else 0, response.close)
+
+    def close(self):
+        self.session.close()
+
+
+def _http_version(raw) -> str:
+    version = getattr(raw, 'version', None)
+    return {10: 'HTTP/1.0', 11: 'HTTP/1.1', 20: 'HTTP/2'}.get(version, 'cache' if raw is None else 'HTTP/1.1')
+
+
+if httpx is not None:
+    class ThrottledTransport(httpx.HTTPTransport):
+        """httpx transport that sends every request through send_with_retries"""
+
+        def __init__(self, rate_limiter: HostRateLimiter, retries: int = MAX_RETRIES, **kwargs):
+            self.rate_limiter = rate_limiter
+            self.retries = retries
+            super().__init__(**kwargs)
+
+        def handle_request(self, request):
+            return send_with_retries(functools.partial(super().handle_request, request), str(request.url),
+                                     request.method, self.rate_limiter, self.retries, errors=(httpx.TransportError,))
+
+    class CachingTransport(ThrottledTransport):
+        """httpx counterpart of http_cache.CachingAdapter"""
+
+        def __init__(self, cache: ResponseCache, rate_limiter: HostRateLimiter, replay: bool = False, **kwargs):
+            self.cache = cache
+            self.replay = replay
+            super().__init__(rate_limiter, **kwargs)
+
+        def handle_request(self, request):
+            if request.method != 'GET':
+                return super().handle_request(request)
+
+            url = str(request.url)
+            entry = self.cache.get(url)
+            if entry and (entry['fresh'] or self.replay):
+                self.cache.record('hits')
+                self.cache.record('bytes_saved', len(entry['body']))
+                return _cached_response(request, entry)
+
+            if self.replay:
+                self.cache.record('misses')
+                response = httpx.Response(504, request=request, content=b'')
+                response.from_cache = True
+                return response
+
+            if entry:
+                # Stale: ask the server whether our copy is still good
+                if entry['headers'].get('ETag'):
+                    request.headers['If-None-Match'] = entry['headers']['ETag']
+                if entry['headers'].get('Last-Modified'):
+                    request.headers['If-Modified-Since'] = entry['headers']['Last-Modified']
+
+            response = super().handle_request(request)
+
+            if entry and response.status_code == 304:
+                response.close()
+                self.cache.touch(url)
+                self.cache.record('revalidated')
+                self.cache.record('bytes_saved', len(entry['body']))
+                return _cached_response(request, entry, getattr(response, 'ttfb', None))
+
+            self.cache.record('misses')
+            if response.status_code == 200:
+                response.stream = CacheTeeStream(response.stream, self.cache, url, response.headers)
+            return response
+
+    class CacheTeeStream(httpx.SyncByteStream):
+        """Response stream that stores the body in the cache once it has been read to the end.
+
+        The chunks are still content-encoded here; the client decodes them
+        after this, so the stored copy is decoded the same way at the end.
+        """
+
+        def __init__(self, stream, cache: ResponseCache, url: str, headers):
+            self.stream = stream
+            self.cache = cache
+            self.url = url
+            self.headers = headers
+
+        def __iter__(self):
+            parts = []
+            for chunk in self.stream:
+                parts.append(chunk)
+                yield chunk
+            body = httpx.Response(200, headers=self.headers, content=b''.join(parts)).read()
+            self.cache.put(self.url, body, self.headers)
+
+        def close(self):
+            self.stream.close()
+
+    def _cached_response(request, entry, ttfb: Optional[float] = None):
+        response = httpx.Response(200, request=request, content=entry['body'],
+                                  headers={k: v for k, v in entry['headers'].items() if v})
+        response.from_cache = True
+        response.ttfb = ttfb
+        return response
+
+
+class HttpxTransport:
+    """httpx.Client, over HTTP/2 when h2 is installed and `http2` is set"""
+    name = 'httpx'
+
+    def __init__(self, rate_limiter: HostRateLimiter, cache: Optional[ResponseCache] = None, replay: bool = False,
+                 retries: int = MAX_RETRIES, pool_size: int = 10, http2: bool = HTTP2):
+        if httpx is None:
+            raise ImportError("httpx is not installed")
+        self.errors = (httpx.HTTPError,)
+        self.http2 = http2 and h2 is not None
+        # Over HTTP/2 one connection carries every page in flight; the limit
+        # only matters for HTTP/1.1 origins
+        options = dict(retries=retries, http2=self.http2,
+                       limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size,
+                                           keepalive_expiry=HTTP_KEEPALIVE_EXPIRY))
+        if cache:
+            transport = CachingTransport(cache, rate_limiter, replay=replay, **options)
+        else:
+            transport = ThrottledTransport(rate_limiter, **options)
+        headers = dict(HEADERS)
+        headers['Accept-Encoding'] = ', '.join(['gzip', 'deflate'] + ['br'] * (brotli is not None)
+                                               + ['zstd'] * (zstandard is not None))
+        # HTTP/2 has no Connection header; httpx keeps connections alive anyway
+        headers.pop('Connection', None)
+        self.client = httpx.Client(headers=headers, transport=transport, follow_redirects=True)
+
+    def open(self, url: str, timeout: float = TIMEOUT) -> Download:
+        """Send a GET and return once the headers are in; raises for an error status"""
+        response = self.client.send(self.client.build_request('GET', url, timeout=timeout), stream=True)
+        try:
+            response.raise_for_status()
+        except httpx.HTTPStatusError:
+            response.close()
+            raise
+        from_cache = getattr(response, 'from_cache', False)
+        return Download(url, response.status_code, 'cache' if from_cache else response.http_version,
+                        getattr(response, 'ttfb', None), from_cache, response.iter_bytes(STREAM_CHUNK_SIZE),
+                        lambda: response.num_bytes_downloaded, response.close)
+
+    def close(self):
+        self.client.close()
+
+
+def get_transport(name: str, rate_limiter: HostRateLimiter, cache: Optional[ResponseCache] = None,
+                  replay: bool = False, retries: int = MAX_RETRIES, pool_size: int = 10):
+    """Transport for the configured name, falling back to requests if httpx isn't installed"""
+    if name not in TRANSPORTS:
+        logger.warning(f"Unknown HTTP transport '{name}', using requests")
+        name = 'requests'
+    if name == 'httpx' and httpx is None:
+        logger.warning("httpx is not installed, using requests")
+        name = 'requests'
+    if name == 'httpx':
+        transport = HttpxTransport(rate_limiter, cache, replay, retries, pool_size)
+        if HTTP2 and not transport.http2:
+            logger.warning("h2 is not installed, httpx will use HTTP/1.1")
+        return transport
+    return RequestsTransport(rate_limiter, cache, replay, retries, pool_size)
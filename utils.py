@@ -2,34 +2,94 @@
 Utility functions for the PakWheels scraper
 """
 
+import os
 import re
 import logging
-from typing import Optional, Dict, Any
+from functools import lru_cache
+from typing import Optional, Dict, Any, List
+
+from catalog import default_catalog
+from extraction import keyword_pattern
+from logs import configure_logging
 
 def setup_logging():
-    """Set up logging configuration"""
-    logging.basicConfig(
-        level=logging.INFO,
-        format='%(asctime)s - %(levelname)s - %(message)s',
-        handlers=[
-            logging.FileHandler('scraper.log'),
-            logging.StreamHandler()
-        ]
-    )
+    """Set up logging configuration (see logs.py); safe to call more than once"""
+    configure_logging()
     return logging.getLogger(__name__)
 
+def tail_lines(filename: str, count: int, block_size: int = 8192) -> List[str]:
+    """Return the last `count` lines of a file by reading backwards from the end,
+    so the cost doesn't depend on how big the file has grown"""
+    with open(filename, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        position = f.tell()
+        data = b''
+        while position > 0 and data.count(b'\n') <= count:
+            read_size = min(block_size, position)
+            position -= read_size
+            f.seek(position)
+            data = f.read(read_size) + data
+    
+    lines = data.decode('utf-8', errors='replace').splitlines(keepends=True)
+    return lines[-count:]
+
+_WHITESPACE_RE = re.compile(r'\s+')
+_UNSAFE_CHARS_RE = re.compile(r'[^\w\s\-\.\,\(\)]')
+# Text clean_text would return unchanged: safe words separated by single spaces
+_CLEAN_TEXT_RE = re.compile(r'[\w\-\.\,\(\)]+(?: [\w\-\.\,\(\)]+)*')
+
 def clean_text(text: str) -> str:
-    """Clean and normalize text data"""
+    """Clean and normalize free text.
+    
+    Only meant for titles and labels: URLs and numbers have their own
+    normalizers (see records.FIELD_NORMALIZERS).
+    """
     if not text:
         return ""
+    if _CLEAN_TEXT_RE.fullmatch(text):
+        # Most titles are already clean; one match beats two substitutions
+        return text
     
     # Remove extra whitespace and newlines
-    text = re.sub(r'\s+', ' ', text.strip())
+    text = _WHITESPACE_RE.sub(' ', text.strip())
     
     # Remove special characters that might cause CSV issues
-    text = re.sub(r'[^\w\s\-\.\,\(\)]', '', text)
-    
-    return text
+    return _UNSAFE_CHARS_RE.sub('', text)
+
+@lru_cache(maxsize=4096)
+def clean_label(text: str) -> Optional[str]:
+    """Clean a short value such as a color, transmission or city, or None if nothing is left.
+    The same few values come up on every page, so results are memoized."""
+    return clean_text(text) or None
+
+PAKWHEELS_ORIGIN = 'https://www.pakwheels.com'
+
+# URLs saved while clean_text still stripped ':' and '/'
+_MANGLED_URL_RE = re.compile(r'^https?(?:www\.)?pakwheels\.com/?(used-cars|new-cars)/?(.+)$')
+
+def normalize_url(url: Any) -> Optional[str]:
+    """Absolute listing URL, kept verbatim apart from repairing a missing scheme,
+    a site-relative path, or the ':' and '/' clean_text used to strip"""
+    if not url:
+        return None
+    url = str(url).strip()
+    if url in ('', 'N/A', 'NA'):
+        return None
+    if url.startswith(('https://', 'http://')):
+        return url
+    if url.startswith('//'):
+        return 'https:' + url
+    if url.startswith('www.pakwheels.com'):
+        return 'https://' + url
+    if url.startswith('/'):
+        return PAKWHEELS_ORIGIN + url
+    match = _MANGLED_URL_RE.match(url)
+    if match:
+        return f"{PAKWHEELS_ORIGIN}/{match.group(1)}/{match.group(2)}"
+    if 'pakwheels.com' in url:
+        path = url.split('pakwheels.com', 1)[-1]
+        return PAKWHEELS_ORIGIN + (path if path.startswith('/') else '/' + path)
+    return url
 
 def extract_year(text: str) -> Optional[str]:
     """Extract year from text using regex"""
@@ -83,6 +143,9 @@ def normalize_car_data(data: Dict[str, Any]) -> Dict[str, str]:
     for key, value in data.items():
         if value is None:
             normalized[key] = "N/A"
+        elif key == 'URL':
+            # clean_text would strip the ':' and '/' that make it a URL
+            normalized[key] = normalize_url(value) or "N/A"
         else:
             normalized[key] = clean_text(str(value))
     
@@ -96,42 +159,49 @@ def validate_car_data(data: Dict[str, str]) -> bool:
         if not data.get(field) or data[field] == "N/A":
             return False
     
-    # Check if the car model looks like a real car listing
-    car_model = data.get('Car Model', '').lower()
-    
-    # Filter out non-car entries
-    invalid_patterns = [
-        'post an ad', 'create quick alerts', 'how many used cars',
-        'what is the starting price', 'what are the popular',
-        'let us know whats wrong'
-    ]
+    model_year = data.get('Model Year', '')
+    year = int(model_year) if model_year.isdigit() else None
+    return looks_like_car(data['Car Model'], year, data.get('Transmission'))
+
+def validate_listing(listing) -> bool:
+    """Validate a CarListing the same way as validate_car_data"""
+    return bool(listing.model) and looks_like_car(listing.model, listing.year, listing.transmission)
+
+# Titles of page furniture that the listing selectors sometimes pick up
+INVALID_TITLE_PATTERNS = [
+    'post an ad', 'create quick alerts', 'how many used cars',
+    'what is the starting price', 'what are the popular',
+    'let us know whats wrong'
+]
+
+PLACEHOLDER_TITLES = frozenset(['na', 'n/a', 'n a'])
+TRANSMISSIONS = frozenset(['Automatic', 'Manual', 'CVT'])
+
+# The term list is one prefix-factored regex, so a title is scanned once
+# whatever the number of terms
+_INVALID_TITLE_RE = re.compile(keyword_pattern(INVALID_TITLE_PATTERNS))
+
+def looks_like_car(car_model: str, model_year: Optional[int], transmission: Optional[str]) -> bool:
+    """Check that a listing title (with its year and transmission) is a real car listing"""
+    title = car_model
+    car_model = car_model.lower()
     
     # Check for empty or just "n/a" car models
-    if not car_model or car_model in ['na', 'n/a', 'n a']:
+    if not car_model or car_model in PLACEHOLDER_TITLES:
         return False
     
-    for pattern in invalid_patterns:
-        if pattern and pattern in car_model:
-            return False
-    
-    # Should contain car-related terms
-    car_terms = ['for sale', 'honda', 'toyota', 'suzuki', 'hyundai', 'kia', 
-                 'nissan', 'bmw', 'audi', 'mercedes', 'corolla', 'civic', 
-                 'city', 'alto', 'cultus', 'prado', 'vitz', 'mehran', 'camry',
-                 'hilux', 'fortuner', 'innova', 'swift', 'baleno']
+    # Filter out non-car entries
+    if _INVALID_TITLE_RE.search(car_model):
+        return False
     
-    if any(term in car_model for term in car_terms):
+    # A make or model the catalog knows, or a "... for sale in <city>" title
+    parts = default_catalog().parse(title)
+    if parts.known or parts.city:
         return True
     
     # If model year is present and valid, it's likely a valid car listing
-    model_year = data.get('Model Year', '')
-    if (model_year != 'N/A' and model_year not in ['', 'N/A'] and 
-        model_year.isdigit() and 1990 <= int(model_year) <= 2025):
+    if model_year is not None and 1990 <= model_year <= 2025:
         return True
     
     # If transmission is specified, it's likely a car
-    transmission = data.get('Transmission', '')
-    if transmission != 'N/A' and transmission in ['Automatic', 'Manual', 'CVT']:
-        return True
-    
-    return False
+    return transmission in TRANSMISSIONS
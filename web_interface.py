@@ -3,74 +3,190 @@ Web interface for PakWheels scraper
 Provides a simple web UI to configure and run the scraper
 """
 
-from flask import Flask, render_template, request, jsonify, send_file
-import threading
+from flask import Flask, Response, render_template, request, jsonify, send_file, stream_with_context
 import os
 import json
+import sqlite3
+import threading
+import time
 from typing import Optional, List, Dict
 from pakwheels_scraper import PakWheelsScraper
+from listing_index import UNCHANGED
+from records import CarListing
+from storage import CarDatabase, read_listings
+from exporters import check_formats, export_chunks, export_filename, get_exporter
+from analytics import GROUPINGS, ListingAnalytics, parse_groupings
+from events import EventBuffer, RingBufferHandler
+from jobs import CANCELLED, COMPLETED, FAILED, QUEUED, RUNNING, Job, JobManager
+from metrics import METRICS, render_host_metrics, render_metric
+from distributed import TaskQueue
+from logs import add_log_handler
+from utils import setup_logging, tail_lines
 from config import *
 import logging
 
 app = Flask(__name__)
 
-# Global variables to track scraping status
-scraping_status = {
+# Progress and log events for the dashboard. The log buffer is fed by the
+# log thread, like the log files, so request threads never wait on it.
+events = EventBuffer()
+setup_logging()
+log_buffer = RingBufferHandler(events)
+add_log_handler(log_buffer)
+
+# Every job writes these next to its CSV; an unknown name fails here rather than in each job
+check_formats(EXPORT_FORMATS)
+
+# Seconds an idle /events connection waits before sending a keepalive comment
+EVENT_KEEPALIVE = 30
+
+# Seconds between checks of the task queue file for worker progress
+QUEUE_WATCH_INTERVAL = 2.0
+
+# Shown by /status before the first job is submitted
+IDLE_STATUS = {
+    'id': None,
+    'state': None,
     'is_running': False,
     'progress': 0,
     'total_pages': 0,
     'current_page': 0,
     'cars_found': 0,
+    'cache': None,
+    'changes': None,
     'message': 'Ready to start scraping'
 }
 
+def publish_job(job: Job):
+    """Push a snapshot of a job's status to /events listeners"""
+    events.publish('job', job.snapshot())
+
 class WebScraper(PakWheelsScraper):
-    """Extended scraper class for web interface"""
+    """Extended scraper class for web interface, reporting into one job"""
     
-    def __init__(self):
-        super().__init__()
-        self.web_status = scraping_status
+    def __init__(self, job: Job, rate_limiter=None):
+        super().__init__(rate_limiter=rate_limiter)
+        self.job = job
+        self.web_status = job.status
     
-    def scrape_page(self, page_num: int, custom_url: Optional[str] = None):
-        """Override to update web status"""
+    def on_page_done(self, page_num: int, cars_data: List[CarListing]):
+        """Update web status as each page's results come back"""
         self.web_status['current_page'] = page_num
-        self.web_status['progress'] = (page_num / self.web_status['total_pages']) * 100
-        self.web_status['message'] = f'Scraping page {page_num} of {self.web_status["total_pages"]}'
-        
-        cars_data = super().scrape_page(page_num, custom_url)
+        self.web_status['progress'] = min(100, (page_num / self.web_status['total_pages']) * 100)
+        self.web_status['message'] = f'Scraped page {page_num} of {self.web_status["total_pages"]}'
         self.web_status['cars_found'] += len(cars_data)
-        
-        return cars_data
+        if self.cache:
+            self.web_status['cache'] = self.cache.snapshot()
+        self.web_status['hosts'] = self.rate_limiter.metrics()
+        publish_job(self.job)
+        self.job.check_cancelled()
+    
+    def on_page_count(self, last_page: int):
+        """Size the progress bar to the pages the search really has"""
+        self.web_status['total_pages'] = last_page
+        publish_job(self.job)
     
-    def run_web_scraping(self, max_pages=MAX_PAGES, base_url=BASE_URL):
-        """Run scraping with web status updates"""
-        global scraping_status
+    def run_web_scraping(self, max_pages=MAX_PAGES, base_url=BASE_URL, resume=False, incremental=False,
+                         enrich='off'):
+        """Run scraping with web status updates.
+        
+        Errors and cancellation propagate to the JobManager, which records
+        how the job ended.
+        """
+        self.web_status['cache'] = self.cache.snapshot() if self.cache else None
+        
+        # Log the URL being used for scraping
+        self.logger.info(f"Job {self.job.id}: starting scraping with URL: {base_url}")
         
+        # Scrape data with custom URL support, streaming rows to the job's CSV
+        cars_saved = self.scrape_to_csv(max_pages, base_url, filename=self.job.output_file,
+                                        resume=resume, incremental=incremental, enrich=enrich)
+        
+        self.web_status['cars_saved'] = cars_saved
+        self.web_status['changes'] = dict(self.change_counts)
+        self.web_status['enrichment'] = self.enrich_stats
+        if cars_saved:
+            self.web_status['message'] = f'Scraping completed! Found {cars_saved} cars.'
+        elif incremental and self.change_counts[UNCHANGED]:
+            self.web_status['message'] = 'Scraping completed. No new or changed listings since the last run.'
+        else:
+            self.web_status['message'] = 'Scraping completed but no data found. Please check the URL and filters.'
+
+def run_job(job: Job, rate_limiter):
+    """JobManager runner: scrape one job's URL with the shared rate limiter"""
+    WebScraper(job, rate_limiter).run_web_scraping(**job.params)
+
+jobs = JobManager(run_job, on_update=publish_job)
+
+class QueueWatcher:
+    """Publishes a 'workers' event whenever the distributed task queue changes.
+    
+    Workers run in other processes and only report through the queue file,
+    so one thread watches the file for every dashboard, and only while at
+    least one /events stream is open. Nothing is sent while the queue is idle.
+    """
+    
+    def __init__(self, events: EventBuffer, path: str = TASK_QUEUE_FILE, interval: float = QUEUE_WATCH_INTERVAL):
+        self.events = events
+        self.path = path
+        self.interval = interval
+        self.listeners = 0
+        self._stamp = None
+        self._thread = None
+        self._lock = threading.Lock()
+    
+    def snapshot(self) -> Optional[Dict]:
+        """Workers and crawls in the queue, or None if there's no queue file"""
+        if not os.path.exists(self.path):
+            return None
+        queue = TaskQueue(self.path)
         try:
-            scraping_status['is_running'] = True
-            scraping_status['total_pages'] = max_pages
-            scraping_status['current_page'] = 0
-            scraping_status['cars_found'] = 0
-            scraping_status['message'] = 'Starting scraper...'
-            
-            # Log the URL being used for scraping
-            self.logger.info(f"Starting scraping with URL: {base_url}")
-            
-            # Scrape data with custom URL support
-            all_data = self.scrape_multiple_pages(max_pages, base_url)
-            
-            if all_data:
-                self.save_to_csv(all_data)
-                scraping_status['message'] = f'Scraping completed! Found {len(all_data)} cars. Data saved to {OUTPUT_FILE}'
-            else:
-                scraping_status['message'] = 'Scraping completed but no data found. Please check the URL and filters.'
-                
-        except Exception as e:
-            scraping_status['message'] = f'Error during scraping: {str(e)}'
-            self.logger.error(f"Web scraping error: {str(e)}")
+            return {'workers': queue.workers(), 'crawls': queue.crawls()}
         finally:
-            scraping_status['is_running'] = False
-            scraping_status['progress'] = 100
+            queue.close()
+    
+    def _file_stamp(self):
+        # Writes land in the WAL first, so it changes before the main file does
+        stamps = []
+        for filename in (self.path, self.path + '-wal'):
+            try:
+                stat = os.stat(filename)
+            except OSError:
+                continue
+            stamps.append((stat.st_mtime_ns, stat.st_size))
+        return tuple(stamps)
+    
+    def attach(self):
+        with self._lock:
+            self.listeners += 1
+            if self._thread is None:
+                self._stamp = self._file_stamp()
+                self._thread = threading.Thread(target=self._run, name='queue-watcher', daemon=True)
+                self._thread.start()
+    
+    def detach(self):
+        with self._lock:
+            self.listeners -= 1
+    
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                if not self.listeners:
+                    self._thread = None
+                    return
+            stamp = self._file_stamp()
+            if stamp and stamp != self._stamp:
+                self._stamp = stamp
+                try:
+                    self.events.publish('workers', self.snapshot())
+                except sqlite3.Error as e:
+                    logging.getLogger(__name__).warning(f"Could not read the task queue: {e}")
+
+queue_watcher = QueueWatcher(events)
+
+def job_not_found(job_id: str):
+    return jsonify({'error': f'No job {job_id}'}), 404
 
 @app.route('/')
 def index():
@@ -79,62 +195,211 @@ def index():
 
 @app.route('/start_scraping', methods=['POST'])
 def start_scraping():
-    """Start the scraping process"""
-    global scraping_status
-    
-    if scraping_status['is_running']:
-        return jsonify({'error': 'Scraping is already in progress'})
-    
+    """Queue a scraping job; it starts as soon as a job worker is free"""
     try:
         data = request.get_json()
         max_pages = min(int(data.get('pages', MAX_PAGES)), 400)  # Limit to 400 pages max
         base_url = data.get('url', BASE_URL).strip()
+        resume = bool(data.get('resume', False))
+        incremental = bool(data.get('incremental', False))
+        enrich = 'missing' if data.get('enrich') else 'off'
         
         # Validate URL
         if not base_url.startswith('http'):
             return jsonify({'error': 'Invalid URL format'})
         
-        # Start scraping in background thread
-        scraper = WebScraper()
-        thread = threading.Thread(
-            target=scraper.run_web_scraping,
-            args=(max_pages, base_url)
-        )
-        thread.daemon = True
-        thread.start()
+        job = jobs.submit(max_pages=max_pages, base_url=base_url, resume=resume, incremental=incremental,
+                          enrich=enrich)
         
-        return jsonify({'success': True, 'message': 'Scraping started'})
+        return jsonify({'success': True, 'job_id': job.id, 'message': f'Scraping job {job.id} queued'})
         
     except Exception as e:
         return jsonify({'error': f'Failed to start scraping: {str(e)}'})
 
 @app.route('/status')
 def get_status():
-    """Get current scraping status"""
-    return jsonify(scraping_status)
+    """Get the status of the most recently submitted job"""
+    job = jobs.latest()
+    return jsonify(job.snapshot() if job else IDLE_STATUS)
+
+@app.route('/jobs')
+def list_jobs():
+    """Status of every job held, newest first"""
+    return jsonify({'jobs': [job.snapshot() for job in jobs.list()]})
+
+@app.route('/jobs/<job_id>')
+def get_job(job_id):
+    """Status of one job"""
+    job = jobs.get(job_id)
+    if job is None:
+        return job_not_found(job_id)
+    return jsonify(job.snapshot())
+
+@app.route('/jobs/<job_id>/cancel', methods=['POST'])
+def cancel_job(job_id):
+    """Cancel a queued job, or stop a running one after its current page"""
+    job = jobs.cancel(job_id)
+    if job is None:
+        return job_not_found(job_id)
+    return jsonify(job.snapshot())
+
+@app.route('/jobs/<job_id>/download')
+def download_job(job_id):
+    """Download the CSV written by one job"""
+    job = jobs.get(job_id)
+    if job is None:
+        return job_not_found(job_id)
+    if not os.path.exists(job.output_file):
+        return jsonify({'error': f'Job {job_id} has no output yet'}), 404
+    return send_file(os.path.abspath(job.output_file), as_attachment=True,
+                     download_name=f'pakwheels_cars_{job_id}.csv')
+
+def last_event_id(header: Optional[str]) -> int:
+    """Event ID a reconnecting client resumes after. One this server never
+    sent, malformed or from before a restart, starts from now like a new connection."""
+    try:
+        last_id = int(header or events.last_id)
+    except ValueError:
+        return events.last_id
+    return last_id if last_id <= events.last_id else events.last_id
+
+@app.route('/events')
+def stream_events():
+    """Server-Sent Events stream of job, worker and log events.
+    
+    Each connection starts with the status of every job held and of the
+    distributed workers, then blocks until new events arrive. Reconnecting
+    clients resume from their Last-Event-ID.
+    """
+    last_id = last_event_id(request.headers.get('Last-Event-ID'))
+    
+    def generate(last_id):
+        for job in reversed(jobs.list()):
+            yield f"event: job\ndata: {json.dumps(job.snapshot())}\n\n"
+        workers = queue_watcher.snapshot()
+        if workers:
+            yield f"event: workers\ndata: {json.dumps(workers)}\n\n"
+        queue_watcher.attach()
+        try:
+            while True:
+                new_events = events.wait_since(last_id, timeout=EVENT_KEEPALIVE)
+                if not new_events:
+                    yield ": keepalive\n\n"
+                    continue
+                for event in new_events:
+                    yield event.to_sse()
+                last_id = new_events[-1].id
+        finally:
+            queue_watcher.detach()
+    
+    return Response(
+        stream_with_context(generate(last_id)),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
 
 @app.route('/download')
 def download_csv():
-    """Download the scraped data CSV file"""
-    if os.path.exists(OUTPUT_FILE):
-        return send_file(OUTPUT_FILE, as_attachment=True)
-    else:
+    """Download scraped data, as CSV unless ?format= asks for jsonl.gz, arrow or parquet.
+    
+    By default this streams every listing in the database, optionally filtered
+    by ?make= and ?city=. ?source=run returns the output of the most recent
+    job that saved any rows, or of the last command-line run. Every format is
+    encoded a batch of rows at a time as the response is sent.
+    """
+    fmt = request.args.get('format', 'csv')
+    try:
+        exporter = get_exporter(fmt)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    download_name = export_filename(os.path.basename(OUTPUT_FILE), fmt)
+    headers = {'Content-Disposition': f'attachment; filename={download_name}'}
+    
+    if request.args.get('source') != 'run' and os.path.exists(DATABASE_FILE):
+        make = request.args.get('make')
+        city = request.args.get('city')
+        
+        def generate():
+            database = CarDatabase()
+            try:
+                yield from export_chunks(database.iter_rows(make=make, city=city), fmt)
+            finally:
+                database.close()
+        
+        return Response(stream_with_context(generate()), mimetype=exporter.mimetype, headers=headers)
+    
+    filename = latest_run_output()
+    if filename is None:
         return jsonify({'error': 'No data file found'}), 404
+    if fmt == 'csv':
+        return send_file(os.path.abspath(filename), as_attachment=True, download_name=download_name)
+    return Response(stream_with_context(export_chunks(read_listings(filename), fmt)),
+                    mimetype=exporter.mimetype, headers=headers)
+
+def latest_run_output() -> Optional[str]:
+    """CSV written by the most recent job that saved any rows, or by the last command-line run"""
+    for job in jobs.list():
+        if job.state == COMPLETED and os.path.exists(job.output_file):
+            return job.output_file
+    return OUTPUT_FILE if os.path.exists(OUTPUT_FILE) else None
+
+@app.route('/summary')
+def get_summary():
+    """Price and mileage statistics, depreciation curves and price outliers as JSON.
+    
+    Like /download this covers every listing in the database, optionally
+    filtered by ?make= and ?city=, unless ?source=run asks for the latest run's
+    output. ?by= picks the groupings (e.g. make,model+year) and ?top= how many
+    groups, curves and outliers to return.
+    """
+    try:
+        groupings = parse_groupings(request.args.get('by', '')) or GROUPINGS
+        top = int(request.args.get('top', 20))
+    except ValueError:
+        return jsonify({'error': 'top must be a number'}), 400
+    
+    if request.args.get('source') != 'run' and os.path.exists(DATABASE_FILE):
+        analytics = ListingAnalytics.from_database(make=request.args.get('make'), city=request.args.get('city'))
+    else:
+        filename = latest_run_output()
+        if filename is None:
+            return jsonify({'error': 'No data file found'}), 404
+        analytics = ListingAnalytics.from_csv(filename)
+    
+    try:
+        return jsonify(analytics.summary(groupings, top))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+@app.route('/metrics')
+def get_metrics():
+    """Stage timings, page and listing counters, per-host request stats and
+    jobs by state, in the Prometheus text format"""
+    states = [job.state for job in jobs.list()]
+    body = (METRICS.render()
+            + render_host_metrics(jobs.rate_limiter.metrics())
+            + render_metric('jobs', 'gauge', 'Jobs held, by state',
+                            [({'state': state}, states.count(state))
+                             for state in (QUEUED, RUNNING, COMPLETED, FAILED, CANCELLED)]))
+    return Response(body, mimetype='text/plain; version=0.0.4')
+
+@app.route('/workers')
+def get_workers():
+    """Distributed workers with their throughput, and the crawls they're serving"""
+    return jsonify(queue_watcher.snapshot() or {'workers': [], 'crawls': []})
 
 @app.route('/logs')
 def get_logs():
     """Get recent log entries"""
     try:
-        if os.path.exists('scraper.log'):
-            with open('scraper.log', 'r') as f:
-                lines = f.readlines()
-                # Return last 50 lines
-                recent_logs = lines[-50:] if len(lines) > 50 else lines
-                return jsonify({'logs': recent_logs})
-        else:
-            return jsonify({'logs': []})
+        # Lines logged since the server started are in memory; before that,
+        # read the end of the log file without loading the rest of it
+        recent_logs = log_buffer.tail(50)
+        if not recent_logs and os.path.exists(LOG_FILE):
+            recent_logs = tail_lines(LOG_FILE, 50)
+        return jsonify({'logs': recent_logs})
     except Exception as e:
         return jsonify({'error': f'Failed to read logs: {str(e)}'})
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5000, debug=True)
+    app.run(host='0.0.0.0', port=5000, debug=True, threaded=True)